@@ -1,40 +1,112 @@
-import schedule
+import json
 import time
 import logging
 import signal
 import sys
 import os
-import random
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait as wait_for_futures
 from datetime import datetime, timedelta
-from manual_punch import punch_attendance, load_config
+from cookie_store import CookieStoreError
+from manual_punch import (punch_attendance, load_config, load_cookies_from_file, load_known_accounts,
+                          get_token_state, invalidate_file_cache, open_ledger, open_plan_store, DEFAULT_ACCOUNT,
+                          PUNCH_TYPE_NAMES, preflight_account, preflight_settings)
+from punch_ledger import ledger_journal_mode, record_result
+from punch_plan import DONE, FAILED, MISSED, SKIPPED, generate_plans, plan_days, plan_settings
+from metrics import CATCH_UPS, REGISTRY, SCHEDULE_DRIFT, TextfileWriter, start_http_exporter
+from log_pipeline import setup_log_pipeline
+from http_session import configure_http_session, get_connection_stats, trace_connections
+from punch_scheduler import DeadlineScheduler
+from rate_limiter import rate_limit_stats
+from replica_lease import ReplicaLease, coordination_settings
+from service_control import ControlError, control_socket_path, start_control_server, stop_control_server
+from tracing import JsonLinesSink, add_sink, remove_sink, span, tracing_settings
+from work_calendar import get_calendar, workday_numbers
 import threading
 
+PUNCH_NAMES = {1: "Punch-in", 2: "Punch-out"}
+PUNCH_TYPE_ARGS = {"checkin": 1, "in": 1, "1": 1, "checkout": 2, "out": 2, "2": 2}
+PUNCH_JOB_SUFFIXES = {1: "punch_in", 2: "punch_out"}
+PREFLIGHT_JOB_SUFFIXES = {1: "preflight_in", 2: "preflight_out"}
+CATCH_UP_JOB_SUFFIXES = {1: "catch_up_in", 2: "catch_up_out"}
+PLAN_REFILL_JOB = "plan:refill"
+LEASE_RENEW_JOB = "lease:renew"
+SERVICE_JOBS = (PLAN_REFILL_JOB, LEASE_RENEW_JOB)
+DEFAULT_CATCH_UP_GRACE_SECONDS = 1800
+MAX_MISSED_LOG_LINES = 20
+
+def plan_job_id(name: str, day, attendance_type: int) -> str:
+    return f"{name}:{day.isoformat()}:{PUNCH_JOB_SUFFIXES[attendance_type]}"
+
+def preflight_job_id(name: str, day, attendance_type: int) -> str:
+    return f"{name}:{day.isoformat()}:{PREFLIGHT_JOB_SUFFIXES[attendance_type]}"
+
+def catch_up_job_id(name: str, day, attendance_type: int) -> str:
+    return f"{name}:{day.isoformat()}:{CATCH_UP_JOB_SUFFIXES[attendance_type]}"
+
 class AttendanceService:
-    def __init__(self):
+    def __init__(self, clock=datetime.now, punch_func=None, executor=None, preflight_func=None, replica_id=None,
+                 preflight_executor=None):
+        """`clock`, `punch_func`, `preflight_func` and the executors are injectable so the service can run on a virtual clock"""
         self.running = True
+        self.clock = clock
+        self.punch_func = punch_func or punch_attendance
+        self.preflight_func = preflight_func or preflight_account
         self.pid_file = 'attendance_service.pid'  # Windows compatible path
-        self.punch_in_time = None  # Record punch-in time
-        self.cookie_failure_count = 0  # Track consecutive cookie failures
-        self.config = load_config()  # Load configuration
+        self.cookie_failure_counts = {}  # Track consecutive cookie failures per account
+        self.reload_requested = False  # Set by SIGHUP, handled in the main loop
+        self.state_lock = threading.Lock()  # Guards per-account state touched by workers
+        self.in_flight = {}  # (account, attendance_type) -> Future
+        self.preflights = set()  # Futures of queued or running pre-flight checks
+        self.schedule_inputs = {}  # account name -> inputs its plans were generated from
+        self.planned_through = None  # Last day the plan window was generated for all accounts
+        self.last_results = {}  # account name -> summary of its latest punch, served on the control socket
+        self.started_at = clock()
+        self.recovery = None  # outcome of the start-up reconciliation of missed plan rows
+        self.replica_id = replica_id  # defaults to host:pid when coordination is enabled
+        self.lease = None  # ReplicaLease when several replicas share the ledger file
+        
+        service_settings = self.config.get("service_settings", {})
+        self.max_in_flight = max(1, service_settings.get("max_in_flight_punches", 4))
+        configure_http_session(max(service_settings.get("pool_size", 10), self.max_in_flight))
         self.setup_logging()
+        self.scheduler = DeadlineScheduler(now=clock, logger=self.logger)
+        self.executor = executor or ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="punch")
+        # Pre-flights get their own small pool so they never hold a punch worker
+        self.preflight_executor = preflight_executor or ThreadPoolExecutor(
+            max_workers=max(1, preflight_settings(self.config)["workers"]), thread_name_prefix="preflight")
+        self.set_accounts(self.load_service_accounts())
+        self.ledger = open_ledger(self.config)  # Punch history survives restarts
+        self.plans = open_plan_store(self.config)
+        self.metrics_server = None
+        self.metrics_writer = None
+        self.control_server = None
+        self.trace_sink = None
         self.setup_signal_handlers()
         self.write_pid()
     
+    @property
+    def config(self):
+        """Current configuration - shared with punch_attendance via the file cache"""
+        return load_config()
+    
+    def load_service_accounts(self):
+        """Load account profiles to punch - falls back to the single default account"""
+        try:
+            return load_known_accounts(self.config)
+        except Exception as e:
+            self.logger.error(f"Cannot load accounts file: {e}")
+        return [dict(DEFAULT_ACCOUNT)]
+    
+    def set_accounts(self, accounts):
+        self.accounts = accounts
+        self.accounts_by_name = {account["name"]: account for account in accounts}
+    
     def setup_logging(self):
-        """Setup logging - suitable for Linux environment"""
-        log_format = '%(asctime)s - %(levelname)s - %(message)s'
-        
+        """Setup logging - queue-based so punch threads never wait on log I/O"""
         # Create logs directory
         os.makedirs('logs', exist_ok=True)
         
-        logging.basicConfig(
-            level=logging.INFO,
-            format=log_format,
-            handlers=[
-                logging.FileHandler('logs/attendance_service.log', encoding='utf-8'),
-                logging.StreamHandler(sys.stdout)  # Optional: display in foreground mode
-            ]
-        )
+        self.log_listener = setup_log_pipeline(self.config.get("service_settings", {}).get("logging", {}))
         self.logger = logging.getLogger(__name__)
     
     def write_pid(self):
@@ -66,44 +138,75 @@ class AttendanceService:
         """Handle shutdown signals"""
         self.logger.info(f"Received signal {signum}, preparing to shutdown service...")
         self.running = False
+        self.scheduler.wake()
     
     def reload_handler(self, signum, frame):
-        """Handle reload signals"""
-        self.logger.info("Received reload signal, reconfiguring schedule...")
-        schedule.clear()
-        self.setup_schedule()
+        """Handle reload signals - the main loop performs the reload"""
+        self.reload_requested = True
+        self.scheduler.wake()
     
-    def generate_random_punch_times(self):
-        """Generate random punch times using config settings"""
-        work_schedule = self.config.get("work_schedule", {})
+    def reload(self):
+        """Re-read configuration and reschedule only the accounts whose inputs changed"""
+        self.reload_requested = False
+        self.logger.info("Received reload signal, reloading configuration...")
+        # Anything already due fires under the old schedule before it changes
+        self.scheduler.run_pending()
         
-        # Get punch-in settings
-        punch_in_config = work_schedule.get("punch_in", {})
-        punch_in_hour = punch_in_config.get("hour", 9)
-        punch_in_min_range = punch_in_config.get("minute_range", {})
-        punch_in_min = punch_in_min_range.get("min", 10)
-        punch_in_max = punch_in_min_range.get("max", 20)
-        punch_in_minute = random.randint(punch_in_min, punch_in_max)
+        invalidate_file_cache(DEFAULT_ACCOUNT["config_file"])
+        for config_file in {account["config_file"] for account in self.accounts}:
+            invalidate_file_cache(config_file)
+        accounts = self.load_service_accounts()
+        config_inputs = {}
+        new_inputs = {account["name"]: self.account_schedule_inputs(account, config_inputs) for account in accounts}
         
-        # Get punch-out settings
-        punch_out_config = work_schedule.get("punch_out", {})
-        punch_out_hour = punch_out_config.get("hour", 18)
-        punch_out_min_range = punch_out_config.get("minute_range", {})
-        punch_out_min = punch_out_min_range.get("min", 10)
-        punch_out_max = punch_out_min_range.get("max", 30)
-        punch_out_minute = random.randint(punch_out_min, punch_out_max)
+        removed = [name for name in self.schedule_inputs if name not in new_inputs]
+        changed = [account for account in accounts if self.schedule_inputs.get(account["name"]) != new_inputs[account["name"]]]
         
-        punch_in_time = f"{punch_in_hour:02d}:{punch_in_minute:02d}"
-        punch_out_time = f"{punch_out_hour:02d}:{punch_out_minute:02d}"
+        # Today's plans keep their slots; changed accounts are re-planned from tomorrow
+        today = self.clock().date()
+        for name in removed:
+            self.cancel_planned_jobs(name, (today, today + timedelta(days=1)))
+            del self.schedule_inputs[name]
+            self.logger.info(f"[{name}] Removed from schedule")
+        for account in changed:
+            self.cancel_planned_jobs(account["name"], (today + timedelta(days=1), ))
+        self.plans.delete_from(removed, today)
+        self.plans.delete_from([account["name"] for account in changed], today + timedelta(days=1))
         
-        return punch_in_time, punch_out_time
+        self.set_accounts(accounts)
+        if changed:
+            self.extend_plans(changed)
+            self.schedule_planned(changed)
+        for account in changed:
+            self.schedule_inputs[account["name"]] = new_inputs[account["name"]]
+            self.log_token_state(account)
+        
+        self.logger.info(f"Reload completed: {len(changed)} account(s) added or re-planned, {len(removed)} removed, "
+                         f"{len(accounts) - len(changed)} unchanged")
+    
+    def account_schedule_inputs(self, account, config_inputs=None):
+        """Everything an account's jobs are generated from - reload compares these"""
+        config_inputs = config_inputs if config_inputs is not None else {}
+        config_file = account["config_file"]
+        if config_file not in config_inputs:
+            config = load_config(config_file)
+            config_inputs[config_file] = (json.dumps({
+                "work_schedule": config.get("work_schedule", {}),
+                "workdays": config.get("service_settings", {}).get("workdays"),
+                "plan": plan_settings(config)
+            }, sort_keys=True), get_calendar(config))
+        config_json, calendar = config_inputs[config_file]
+        return tuple(sorted(account.items())), config_json, calendar.fingerprint(account["name"])
     
-    def handle_cookie_failure(self, error_message: str):
+    def handle_cookie_failure(self, error_message: str, account=None):
         """Handle cookie failure scenarios"""
-        self.cookie_failure_count += 1
+        name = (account or DEFAULT_ACCOUNT)["name"]
+        with self.state_lock:
+            self.cookie_failure_counts[name] = self.cookie_failure_counts.get(name, 0) + 1
+            failure_count = self.cookie_failure_counts[name]
         
         if "Cookie expired" in error_message or "refresh failed" in error_message:
-            self.logger.error("[COOKIE] COOKIE EXPIRED - Manual intervention required!")
+            self.logger.error(f"[COOKIE] [{name}] COOKIE EXPIRED - Manual intervention required!")
             self.logger.error("[ACTION] To fix this issue:")
             self.logger.error("   1. Run: python manual_punch.py update")
             self.logger.error("   2. Follow the guide to extract new cookies")
@@ -111,102 +214,751 @@ class AttendanceService:
             
             # Create alert file for external monitoring
             alert_file = "logs/cookie_alert.txt"
-            with open(alert_file, 'w') as f:
-                f.write(f"COOKIE EXPIRED at {datetime.now()}\n")
+            with self.state_lock, open(alert_file, 'a') as f:
+                f.write(f"COOKIE EXPIRED at {self.clock()} (account: {name})\n")
                 f.write("Manual intervention required\n")
                 f.write("Run: python manual_punch.py update\n")
         
-        if self.cookie_failure_count >= 3:
-            self.logger.warning("[WARNING] Multiple consecutive cookie failures detected")
+        if failure_count >= 3:
+            self.logger.warning(f"[WARNING] [{name}] Multiple consecutive cookie failures detected")
             self.logger.warning("Service will continue running but manual cookie update is recommended")
     
-    def handle_punch_success(self):
+    def handle_punch_success(self, account=None):
         """Reset failure count on successful punch"""
-        if self.cookie_failure_count > 0:
-            self.logger.info("[SUCCESS] Cookie issues resolved - resetting failure count")
-            self.cookie_failure_count = 0
+        name = (account or DEFAULT_ACCOUNT)["name"]
+        with self.state_lock:
+            if not self.cookie_failure_counts.get(name):
+                return
+            self.logger.info(f"[SUCCESS] [{name}] Cookie issues resolved - resetting failure count")
+            self.cookie_failure_counts[name] = 0
             
-            # Remove alert file if it exists
+            # Remove alert file once every account is healthy again
             alert_file = "logs/cookie_alert.txt"
-            if os.path.exists(alert_file):
+            if not any(self.cookie_failure_counts.values()) and os.path.exists(alert_file):
                 os.remove(alert_file)
     
-    def punch_in(self):
-        """Punch in for work"""
-        self.logger.info("Starting punch-in process...")
-        self.punch_in_time = datetime.now()
+    def log_token_state(self, account=None):
+        """Log JWT expiry from the cached token state - no decode per call"""
+        account = account or DEFAULT_ACCOUNT
+        name = account["name"]
+        try:
+            jwt_token = load_cookies_from_file(account["cookie_file"], account["config_file"]).get('__ModuleSessionCookie')
+        except CookieStoreError as e:
+            self.logger.error(f"[COOKIE] [{name}] {e}")
+            return
+        if not jwt_token:
+            self.logger.warning(f"[COOKIE] [{name}] No __ModuleSessionCookie found")
+            return
+        
+        token_state = get_token_state(jwt_token)
+        if not token_state.decoded or not token_state.exp:
+            self.logger.warning(f"[COOKIE] [{name}] JWT token cannot be decoded or has no expiry")
+        elif token_state.expired:
+            self.logger.error(f"[COOKIE] [{name}] JWT token expired at {token_state.expires_at}")
+        else:
+            hours = token_state.remaining_seconds / 3600
+            self.logger.info(f"[{name}] JWT token valid until {token_state.expires_at} ({hours:.1f} hours left)")
+    
+    def log_connection_stats(self):
+        """Log connection pool reuse so keep-alive can be verified"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        stats = get_connection_stats()
+        self.logger.info(f"Connection pool: {stats['connections']} opened, {stats['reused']} reused, "
+                         f"{stats['requests']} requests (pool size {stats['pool_size']})")
+    
+    def setup_metrics(self):
+        """Register service gauges and start the configured metrics exporters"""
+        REGISTRY.gauge("attendance_jwt_seconds_to_expiry", "Seconds until each account's JWT expires",
+                       ["account"], callback=self.jwt_expiry_samples)
+        REGISTRY.gauge("attendance_cookie_failure_count", "Consecutive cookie failures per account",
+                       ["account"], callback=lambda: {(name, ): count for name, count in self.cookie_failure_counts.items()})
+        REGISTRY.gauge("attendance_punches_in_flight", "Punch jobs queued or running",
+                       callback=lambda: {(): len(self.in_flight)})
+        REGISTRY.gauge("attendance_http_connections_reused", "Pooled HTTP requests served on a reused connection",
+                       callback=lambda: {(): get_connection_stats()["reused"]})
+        
+        metrics_settings = self.config.get("service_settings", {}).get("metrics", {})
+        port = metrics_settings.get("port")
+        if port:
+            host = metrics_settings.get("host", "127.0.0.1")
+            try:
+                self.metrics_server = start_http_exporter(port, host)
+                self.logger.info(f"Metrics exporter listening on http://{host}:{port}/metrics")
+            except OSError as e:
+                self.logger.error(f"Cannot start metrics exporter on port {port}: {e}")
         
+        textfile = metrics_settings.get("textfile")
+        if textfile:
+            interval = metrics_settings.get("textfile_interval_seconds", 15)
+            self.metrics_writer = TextfileWriter(textfile, interval).start()
+            self.logger.info(f"Writing metrics to {textfile} every {interval}s")
+    
+    def jwt_expiry_samples(self):
+        """JWT seconds-to-expiry per account, read from the cached token states"""
+        samples = {}
+        for account in self.accounts:
+            try:
+                jwt_token = load_cookies_from_file(account["cookie_file"], account["config_file"]).get('__ModuleSessionCookie')
+            except CookieStoreError:
+                continue
+            remaining = get_token_state(jwt_token).remaining_seconds if jwt_token else None
+            if remaining is not None:
+                samples[(account["name"], )] = remaining
+        return samples
+    
+    def stop_metrics(self):
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+        if self.metrics_writer is not None:
+            self.metrics_writer.stop()
+    
+    def setup_tracing(self):
+        """Append per-phase spans of every punch to a JSON lines file when tracing is enabled"""
+        settings = tracing_settings(self.config)
+        if not settings["enabled"]:
+            return
         try:
-            result = punch_attendance(attendance_type=1)
-            if result["success"]:
-                self.logger.info(f"[SUCCESS] Punch-in successful! Time: {self.punch_in_time.strftime('%H:%M:%S')}")
-                self.logger.info(f"Response: {result['data']}")
-                self.handle_punch_success()
-            else:
-                error_msg = result.get('error', 'Unknown error')
-                self.logger.error(f"[ERROR] Punch-in failed! Error: {error_msg}")
-                self.handle_cookie_failure(error_msg)
-        except Exception as e:
-            self.logger.error(f"Punch-in exception: {str(e)}")
+            self.trace_sink = JsonLinesSink(settings["file"])
+        except OSError as e:
+            self.logger.error(f"Cannot open trace file {settings['file']}: {e}")
+            return
+        add_sink(self.trace_sink)
+        trace_connections()
+        self.logger.info(f"Writing punch traces to {settings['file']}")
     
-    def punch_out(self):
-        """Punch out from work"""
-        self.logger.info("Starting punch-out process...")
-        punch_out_time = datetime.now()
+    def stop_tracing(self):
+        if self.trace_sink is not None:
+            remove_sink(self.trace_sink)
+            self.trace_sink.close()
+    
+    def setup_control_socket(self):
+        """Serve status, jobs, last results, punch-now and reload on the control socket"""
+        path = control_socket_path(self.config)
+        if not path:
+            return
+        handlers = {
+            "status": self.control_status,
+            "jobs": self.control_jobs,
+            "last": self.control_last,
+            "punch": self.control_punch,
+            "reload": self.control_reload
+        }
+        try:
+            self.control_server = start_control_server(path, handlers)
+            self.logger.info(f"Control socket listening on {path}")
+        except OSError as e:
+            self.logger.error(f"Cannot start control socket {path}: {e}")
+    
+    def stop_control_socket(self):
+        if self.control_server is not None:
+            stop_control_server(self.control_server)
+            self.control_server = None
+    
+    def control_account(self, name):
+        """Resolve an account for a control command - optional when only one is configured"""
+        if name is None:
+            if len(self.accounts) != 1:
+                raise ControlError("Several accounts are configured - name one")
+            return self.accounts[0]
+        account = self.accounts_by_name.get(name)
+        if account is None:
+            raise ControlError(f"Unknown account {name!r}")
+        return account
+    
+    def control_status(self, request):
+        now = self.clock()
+        jobs = self.scheduler.jobs()
+        upcoming = next((job for job in jobs if job.job_id not in SERVICE_JOBS), None)
+        with self.state_lock:
+            in_flight = len(self.in_flight)
+            cookie_failures = dict(self.cookie_failure_counts)
+        return {
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "uptime_seconds": (now - self.started_at).total_seconds(),
+            "accounts": len(self.accounts),
+            "jobs": len(jobs),
+            "next_job": {"job_id": upcoming.job_id, "next_run": upcoming.next_run} if upcoming else None,
+            "in_flight": in_flight,
+            "reload_pending": self.reload_requested,
+            "cookie_failures": cookie_failures,
+            "recovery": self.recovery,
+            "replica": self.replica_status(),
+            "rate_limits": rate_limit_stats(),
+            "connections": get_connection_stats()
+        }
+    
+    def control_jobs(self, request):
+        """Upcoming punch jobs per account, earliest first"""
+        name = request.get("account")
+        if name is not None:
+            self.control_account(name)
+        limit = max(1, int(request.get("limit", 10)))
+        jobs = {}
+        for job in self.scheduler.jobs():
+            if job.job_id in SERVICE_JOBS:
+                continue
+            account, _, suffix = job.job_id.rsplit(":", 2)
+            if name is not None and account != name:
+                continue
+            entries = jobs.setdefault(account, [])
+            if len(entries) < limit:
+                entries.append({"job_id": job.job_id, "type": suffix, "next_run": job.next_run})
+        return jobs
+    
+    def control_last(self, request):
+        """Latest punch per account - from this run, else from the ledger"""
+        name = request.get("account")
+        accounts = [self.control_account(name)] if name is not None else self.accounts
+        with self.state_lock:
+            results = {account["name"]: self.last_results.get(account["name"]) for account in accounts}
+        for account_name, result in results.items():
+            if result is None:
+                row = self.ledger.last_punch(account_name)
+                if row is not None:
+                    results[account_name] = {
+                        "type": PUNCH_TYPE_NAMES.get(row["punch_type"], "?"),
+                        "at": row["actual_at"],
+                        "planned_at": row["planned_at"],
+                        "success": bool(row["success"]),
+                        "status_code": row["status_code"],
+                        "outcome": None,
+                        "error": row["error"]
+                    }
+        return results
+    
+    def control_punch(self, request):
+        """Queue a punch now; with "wait" the response carries the result"""
+        attendance_type = PUNCH_TYPE_ARGS.get(str(request.get("type", "")).lower())
+        if attendance_type is None:
+            raise ControlError("type must be checkin or checkout")
+        account = self.control_account(request.get("account"))
+        self.logger.info(f"[{account['name']}] {PUNCH_NAMES[attendance_type]} requested on the control socket")
+        future = self.submit_punch(account, attendance_type)
+        if future is None:
+            raise ControlError(f"{PUNCH_NAMES[attendance_type]} already in flight or service stopping")
+        response = {"account": account["name"], "type": PUNCH_TYPE_NAMES[attendance_type]}
+        if request.get("wait"):
+            try:
+                result = future.result(timeout=float(request.get("timeout", 140)))
+            except FutureTimeoutError:
+                raise ControlError(f"{PUNCH_NAMES[attendance_type]} still running - check 'last' later")
+            response["result"] = {key: (result or {}).get(key) for key in ("success", "status_code", "outcome", "error")}
+        return response
+    
+    def control_reload(self, request):
+        """Same as SIGHUP - the main loop performs the reload"""
+        self.reload_requested = True
+        self.scheduler.wake()
+        return {"reload": "requested"}
+    
+    def on_job_fired(self, job, account, attendance_type: int):
+        """Scheduler callback - record drift and hand the punch to the worker pool"""
+        if job.last_drift is not None:
+            SCHEDULE_DRIFT.observe(max(0.0, job.last_drift))
+        self.submit_punch(account, attendance_type, job.last_planned)
+    
+    def submit_punch(self, account, attendance_type: int, planned_at=None):
+        """Queue a punch on the worker pool so the scheduler loop never blocks on HTTP"""
+        name = account["name"]
+        key = (name, attendance_type)
+        with self.state_lock:
+            future = self.in_flight.get(key)
+            if future is not None and not future.done():
+                self.logger.warning(f"[{name}] {PUNCH_NAMES[attendance_type]} already in flight - skipping duplicate")
+                return None
+            if not self.running:
+                return None
+            queued_at = time.monotonic()
+            future = self.executor.submit(self.run_punch_job, account, attendance_type, queued_at, planned_at)
+            self.in_flight[key] = future
+        future.add_done_callback(lambda done: self._clear_in_flight(key, done))
+        return future
+    
+    def _clear_in_flight(self, key, future):
+        with self.state_lock:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+    
+    def run_punch_job(self, account, attendance_type: int, queued_at: float, planned_at=None):
+        """Worker entry point - drops jobs that waited in the queue past their deadline"""
+        name = account["name"]
+        job_deadline = self.config.get("service_settings", {}).get("punch_job_deadline_seconds", 300)
+        waited = time.monotonic() - queued_at
+        if job_deadline and waited > job_deadline:
+            self.logger.error(f"[ERROR] [{name}] {PUNCH_NAMES[attendance_type]} dropped: "
+                              f"queued {waited:.0f}s, past the {job_deadline}s job deadline")
+            return None
+        if not self.running:
+            self.logger.info(f"[{name}] {PUNCH_NAMES[attendance_type]} cancelled - service is stopping")
+            return None
         
-        # Calculate work duration
-        if self.punch_in_time:
-            work_duration = punch_out_time - self.punch_in_time
-            hours = work_duration.total_seconds() / 3600
-            self.logger.info(f"Today's work duration: {hours:.2f} hours")
+        if attendance_type == 1:
+            return self.punch_in(account, planned_at)
+        return self.punch_out(account, planned_at)
+    
+    def execute_punch(self, account, attendance_type: int, planned_at=None):
+        """Run one punch for an account and log the outcome"""
+        name = account["name"]
+        action = PUNCH_NAMES[attendance_type]
+        punch_time = self.clock()
+        result = None
         
         try:
-            result = punch_attendance(attendance_type=2)
+            result = self.punch_func(
+                attendance_type=attendance_type,
+                config_file=account["config_file"],
+                cookie_file=account["cookie_file"]
+            )
             if result["success"]:
-                self.logger.info(f"[SUCCESS] Punch-out successful! Time: {punch_out_time.strftime('%H:%M:%S')}")
-                self.logger.info(f"Response: {result['data']}")
-                self.handle_punch_success()
+                # Formatting the response is the costliest part of a fast punch - skip it when INFO is off
+                if self.logger.isEnabledFor(logging.INFO):
+                    self.logger.info(f"[SUCCESS] [{name}] {action} successful! Time: {punch_time.strftime('%H:%M:%S')}")
+                    self.logger.info(f"[{name}] Response: {result['data']}")
+                self.handle_punch_success(account)
             else:
                 error_msg = result.get('error', 'Unknown error')
-                self.logger.error(f"[ERROR] Punch-out failed! Error: {error_msg}")
-                self.handle_cookie_failure(error_msg)
+                self.logger.error(f"[ERROR] [{name}] {action} failed! Error: {error_msg} "
+                                  f"(attempts: {result.get('attempts', 0)}, circuit: {result.get('circuit_state', 'unknown')})")
+                self.handle_cookie_failure(error_msg, account)
+                self.log_token_state(account)
         except Exception as e:
-            self.logger.error(f"Punch-out exception: {str(e)}")
-    
-    def setup_schedule(self):
-        """Setup random schedule using config settings"""
-        schedule.clear()
-        
-        # Get workdays from config
-        workdays = self.config.get("service_settings", {}).get("workdays", ["monday", "tuesday", "wednesday", "thursday", "friday"])
+            self.logger.error(f"[{name}] {action} exception: {str(e)}")
+            result = {"success": False, "error": f"Exception: {str(e)}"}
         
-        # Generate random times for each workday
-        for day in workdays:
-            punch_in_time, punch_out_time = self.generate_random_punch_times()
+        with self.state_lock:
+            self.last_results[name] = {
+                "type": PUNCH_TYPE_NAMES[attendance_type],
+                "at": punch_time.isoformat(sep=' ', timespec='seconds'),
+                "planned_at": planned_at.isoformat(sep=' ', timespec='seconds') if planned_at else None,
+                "success": bool(result.get("success")),
+                "status_code": result.get("status_code"),
+                "outcome": result.get("outcome"),
+                "error": result.get("error")
+            }
+        try:
+            with span("ledger_record"):
+                record_result(self.ledger, name, attendance_type, result, punch_time, planned_at=planned_at)
+        except Exception as e:
+            self.logger.error(f"[{name}] Cannot record punch in ledger: {e}")
+        if planned_at is not None:
+            with span("plan_mark"):
+                self.mark_plan(name, planned_at.date(), attendance_type, DONE if result.get("success") else FAILED)
+        self.log_connection_stats()
+        return result
+    
+    def mark_plan(self, name, day, attendance_type: int, status: str):
+        """Persist a plan row's final state so a restart knows it was handled"""
+        try:
+            self.plans.mark([(name, day, attendance_type)], status, self.clock())
+        except Exception as e:
+            self.logger.error(f"[{name}] Cannot record plan state: {e}")
+    
+    def punch_in(self, account=None, planned_at=None):
+        """Punch in for work"""
+        account = account or DEFAULT_ACCOUNT
+        with span("punch", account=account["name"], type=PUNCH_TYPE_NAMES[1]) as punch_span:
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info(f"[{account['name']}] Starting punch-in process...")
+            result = self.execute_punch(account, 1, planned_at)
+            punch_span.set(success=bool(result.get("success")))
+        return result
+    
+    def punch_out(self, account=None, planned_at=None):
+        """Punch out from work"""
+        account = account or DEFAULT_ACCOUNT
+        name = account["name"]
+        with span("punch", account=name, type=PUNCH_TYPE_NAMES[2]) as punch_span:
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info(f"[{name}] Starting punch-out process...")
+            punch_out_time = self.clock()
             
-            getattr(schedule.every(), day).at(punch_in_time).do(self.punch_in)
-            getattr(schedule.every(), day).at(punch_out_time).do(self.punch_out)
+            # Calculate work duration from the ledger so it survives restarts
+            with span("ledger_first_success"):
+                punch_in_time = self.ledger.first_success(name, 1, punch_out_time.date())
+            if punch_in_time:
+                if self.logger.isEnabledFor(logging.INFO):
+                    hours = (punch_out_time - punch_in_time).total_seconds() / 3600
+                    self.logger.info(f"[{name}] Today's work duration: {hours:.2f} hours")
+            else:
+                self.logger.warning(f"[{name}] No successful punch-in recorded today")
             
-            self.logger.info(f"{day.title()}: Punch-in {punch_in_time}, Punch-out {punch_out_time}")
+            result = self.execute_punch(account, 2, planned_at)
+            punch_span.set(success=bool(result.get("success")))
+        return result
+    
+    def setup_schedule(self):
+        """Plan every account's punches ahead and schedule the ones due soon"""
+        self.scheduler.clear()
+        self.planned_through = None
+        config_inputs = {}
+        self.schedule_inputs = {account["name"]: self.account_schedule_inputs(account, config_inputs)
+                                for account in self.accounts}
+        self.refill_plans()
+        # A standby leaves missed rows to the leader, and reconciles them itself on takeover
+        if self.lease is None or self.lease.is_leader():
+            self.recover_missed_punches()
+        if self.lease is not None:
+            self.scheduler.run_at(LEASE_RENEW_JOB, self.clock() + timedelta(seconds=self.lease_renew_seconds),
+                                  lambda job: self.renew_lease())
         
         work_duration = self.config.get("work_schedule", {}).get("work_duration_hours", 9)
-        self.logger.info(f"Random schedule setup completed (work duration: {work_duration} hours)")
+        self.logger.info(f"Random schedule setup completed for {len(self.accounts)} account(s) "
+                         f"(minimum work duration: {work_duration} hours)")
+    
+    def recover_missed_punches(self):
+        """Reconcile plan rows whose time passed while the service was down.
+        
+        Rows already punched (by the service or by hand) are closed, rows
+        still inside service_settings.catch_up_grace_seconds are punched now,
+        and older ones are flagged as missed. One index range on the plan
+        store and one on the ledger, so restarts stay fast at any scale.
+        """
+        started = time.monotonic()
+        now = self.clock()
+        rows = self.plans.unresolved_until(now)
+        self.recovery = {"caught_up": 0, "missed": 0, "already_done": 0, "skipped": 0, "elapsed_ms": 0.0}
+        if not rows:
+            return self.recovery
+        
+        grace = self.config.get("service_settings", {}).get("catch_up_grace_seconds", DEFAULT_CATCH_UP_GRACE_SECONDS)
+        done = self.ledger.successful_keys(rows[0][1], now.date())
+        resolved = {DONE: [], SKIPPED: [], MISSED: []}
+        calendars = {}  # config file -> (calendar, weekdays), so each file is checked once
+        for name, day, attendance_type, planned_at in rows:
+            key = (name, day, attendance_type)
+            account = self.accounts_by_name.get(name)
+            if (name, day.isoformat(), attendance_type) in done:
+                resolved[DONE].append(key)
+                continue
+            if account is None:
+                resolved[SKIPPED].append(key)
+                continue
+            if account["config_file"] not in calendars:
+                config = load_config(account["config_file"])
+                calendars[account["config_file"]] = (get_calendar(config), workday_numbers(config))
+            calendar, weekdays = calendars[account["config_file"]]
+            if not calendar.is_workday(name, day, weekdays):
+                resolved[SKIPPED].append(key)
+            elif (now - planned_at).total_seconds() <= grace:
+                # Rows come oldest first, so a punch-in is queued ahead of its punch-out
+                self.scheduler.run_at(catch_up_job_id(name, day, attendance_type), now,
+                                      lambda job, account=account, attendance_type=attendance_type, planned_at=planned_at:
+                                      self.on_catch_up_fired(account, attendance_type, planned_at))
+                self.recovery["caught_up"] += 1
+            else:
+                resolved[MISSED].append(key)
+                if len(resolved[MISSED]) <= MAX_MISSED_LOG_LINES:
+                    self.logger.error(f"[MISSED] [{name}] {PUNCH_NAMES[attendance_type]} planned at "
+                                      f"{planned_at.strftime('%Y-%m-%d %H:%M:%S')} was missed while the service was down")
+        
+        for status, keys in resolved.items():
+            if keys:
+                self.plans.mark(keys, status, now)
+        self.recovery.update(already_done=len(resolved[DONE]), skipped=len(resolved[SKIPPED]),
+                             missed=len(resolved[MISSED]), elapsed_ms=round((time.monotonic() - started) * 1000, 1))
+        CATCH_UPS.inc(self.recovery["caught_up"], action="caught_up")
+        CATCH_UPS.inc(self.recovery["missed"], action="missed")
+        self.logger.info(f"[RECOVERY] {len(rows)} unresolved punch(es): {self.recovery['caught_up']} caught up, "
+                         f"{self.recovery['missed']} missed (older than {grace}s), "
+                         f"{self.recovery['already_done']} already done, {self.recovery['skipped']} skipped "
+                         f"in {self.recovery['elapsed_ms']}ms")
+        return self.recovery
+    
+    def on_catch_up_fired(self, account, attendance_type: int, planned_at):
+        """Late punch for a plan row missed during downtime; keeps the original planned time"""
+        if not self.claim_plan(account["name"], planned_at.date(), attendance_type):
+            return
+        self.logger.warning(f"[CATCH-UP] [{account['name']}] {PUNCH_NAMES[attendance_type]} planned at "
+                            f"{planned_at.strftime('%H:%M:%S')} is being punched late")
+        self.submit_punch(account, attendance_type, planned_at)
+    
+    def extend_plans(self, accounts):
+        """Generate the missing days of the plan window for `accounts` in one batch"""
+        days = plan_days(self.clock().date(), plan_settings(self.config)["days_ahead"])
+        if accounts is self.accounts:
+            window_end = days[-1]
+            # After the first pass only the newly uncovered days need generating
+            if self.planned_through is not None:
+                days = [day for day in days if day > self.planned_through]
+            self.planned_through = window_end
+            if not days:
+                return 0
+            planned = self.plans.planned_days(days[0], days[-1])
+        else:
+            planned = set()
+            for account in accounts:
+                planned |= self.plans.planned_days(days[0], days[-1], account["name"])
+        rows = generate_plans(((account["name"], load_config(account["config_file"])) for account in accounts),
+                              days, skip=planned)
+        return self.plans.save(rows, now=self.clock())
+    
+    def schedule_planned(self, accounts=None):
+        """Turn plan rows between now and the end of tomorrow into one-shot jobs"""
+        now = self.clock()
+        today = now.date()
+        if accounts is None:
+            horizon = datetime.combine(today + timedelta(days=2), datetime.min.time())
+            rows = self.plans.due_between(now, horizon)
+        else:
+            rows = []
+            for account in accounts:
+                rows.extend(self.plans.plans_between(today, today + timedelta(days=1), account["name"]))
+        
+        preflight = preflight_settings(self.config)
+        lead = timedelta(seconds=preflight["lead_seconds"])
+        scheduled = 0
+        for name, day, attendance_type, planned_at in rows:
+            job_id = plan_job_id(name, day, attendance_type)
+            if planned_at <= now or name not in self.accounts_by_name or self.scheduler.get_job(job_id):
+                continue
+            self.scheduler.run_at(job_id, planned_at,
+                                  lambda job, name=name, attendance_type=attendance_type:
+                                  self.on_plan_fired(job, name, attendance_type))
+            # Warm-up and validation run a few minutes before the window, not inside it
+            if preflight["enabled"] and planned_at - lead > now:
+                self.scheduler.run_at(preflight_job_id(name, day, attendance_type), planned_at - lead,
+                                      lambda job, name=name, attendance_type=attendance_type, planned_at=planned_at:
+                                      self.on_preflight_fired(name, attendance_type, planned_at))
+            scheduled += 1
+        return scheduled
+    
+    def cancel_planned_jobs(self, name, days):
+        for day in days:
+            for attendance_type in PUNCH_NAMES:
+                self.scheduler.cancel(plan_job_id(name, day, attendance_type))
+                self.scheduler.cancel(preflight_job_id(name, day, attendance_type))
+    
+    def refill_plans(self):
+        """Daily job: top up the plan window and schedule the next day's punches"""
+        generated = self.extend_plans(self.accounts)
+        scheduled = self.schedule_planned()
+        self.logger.info(f"[PLAN] {generated} punch time(s) generated, {scheduled} job(s) scheduled")
+        tomorrow = self.clock().date() + timedelta(days=1)
+        self.scheduler.run_at(PLAN_REFILL_JOB, datetime.combine(tomorrow, datetime.min.time()) + timedelta(seconds=30),
+                              lambda job: self.refill_plans())
+    
+    def on_plan_fired(self, job, name, attendance_type: int):
+        """Resolve the account at fire time so reloaded account settings apply"""
+        account = self.accounts_by_name.get(name)
+        if account is None:
+            self.logger.warning(f"[{name}] Planned {PUNCH_NAMES[attendance_type]} skipped - account no longer configured")
+            return
+        # Leave or holidays added after the plan was generated still cancel the punch
+        reason = self.day_off_reason(account, job.next_run.date())
+        if reason:
+            self.logger.info(f"[{name}] Planned {PUNCH_NAMES[attendance_type]} skipped - {reason}")
+            self.mark_plan(name, job.next_run.date(), attendance_type, SKIPPED)
+            return
+        if not self.claim_plan(name, job.next_run.date(), attendance_type):
+            return
+        self.on_job_fired(job, account, attendance_type)
+    
+    def setup_coordination(self):
+        """Join the replica group when service_settings.coordination is enabled"""
+        settings = coordination_settings(self.config)
+        if not settings["enabled"]:
+            return
+        self.lease = ReplicaLease(self.plans.db_path, self.replica_id or settings["replica_id"],
+                                  settings["lease_seconds"], clock=lambda: self.clock().timestamp(),
+                                  journal_mode=ledger_journal_mode(self.config))
+        self.lease_renew_seconds = settings["renew_seconds"]
+        fence = self.lease.acquire()
+        if fence is not None:
+            self.logger.info(f"[LEADER] {self.lease.replica_id} holds the punch lease (fence {fence})")
+        else:
+            holder = self.lease.holder() or {}
+            self.logger.info(f"[STANDBY] {self.lease.replica_id} standing by; {holder.get('holder')} "
+                             f"holds the punch lease (fence {holder.get('fence')})")
+    
+    def renew_lease(self):
+        """Scheduler job: renew the lease, or take it over once the leader's has lapsed"""
+        previous = self.lease.fence
+        try:
+            fence = self.lease.acquire()
+        except Exception as e:
+            # Without a renewal the lease lapses on its own and claims start failing
+            self.logger.error(f"Cannot renew the punch lease: {e}")
+            fence = None
+        if fence is not None and fence != previous:
+            self.logger.warning(f"[LEADER] {self.lease.replica_id} took over the punch lease (fence {fence})")
+            self.recover_missed_punches()
+        elif fence is None and previous is not None:
+            holder = self.lease.holder() or {}
+            self.logger.warning(f"[STANDBY] Punch lease lost to {holder.get('holder')} (fence {holder.get('fence')})")
+        self.scheduler.run_at(LEASE_RENEW_JOB, self.clock() + timedelta(seconds=self.lease_renew_seconds),
+                              lambda job: self.renew_lease())
+    
+    def claim_plan(self, name, day, attendance_type: int):
+        """Whether this replica may run the plan row - always, unless coordination is enabled"""
+        if self.lease is None:
+            return True
+        try:
+            claimed = self.lease.claim_plan(name, day, attendance_type)
+        except Exception as e:
+            self.logger.error(f"[{name}] Cannot claim {PUNCH_NAMES[attendance_type]}: {e}")
+            return False
+        if not claimed:
+            self.logger.debug(f"[{name}] {PUNCH_NAMES[attendance_type]} left to the lease holder")
+        return claimed
+    
+    def replica_status(self):
+        if self.lease is None:
+            return None
+        return {"replica_id": self.lease.replica_id, "leader": self.lease.is_leader(),
+                "fence": self.lease.fence, "lease": self.lease.holder()}
+    
+    def day_off_reason(self, account, day):
+        """Why `day` is not a workday for the account, or None when it is"""
+        config = load_config(account["config_file"])
+        is_workday, reason = get_calendar(config).day_status(account["name"], day, workday_numbers(config))
+        return None if is_workday else reason
+    
+    def on_preflight_fired(self, name, attendance_type: int, planned_at):
+        """Hand the pre-flight check to the pre-flight pool - it does network I/O"""
+        account = self.accounts_by_name.get(name)
+        if account is None or self.day_off_reason(account, planned_at.date()) or not self.running:
+            return
+        if self.lease is not None and not self.lease.is_leader():
+            return
+        future = self.preflight_executor.submit(self.run_preflight, account, attendance_type, planned_at)
+        with self.state_lock:
+            self.preflights.add(future)
+        future.add_done_callback(self.forget_preflight)
+    
+    def forget_preflight(self, future):
+        with self.state_lock:
+            self.preflights.discard(future)
+    
+    def run_preflight(self, account, attendance_type: int, planned_at):
+        """Warm the connection and cookies for an upcoming punch; alert now if it cannot succeed"""
+        # A check still queued at shutdown or at the punch itself would only compete with it
+        if not self.running or self.clock() >= planned_at:
+            return None
+        name = account["name"]
+        action = PUNCH_NAMES[attendance_type]
+        try:
+            result = self.preflight_func(config_file=account["config_file"], cookie_file=account["cookie_file"],
+                                         punch_at=planned_at)
+        except Exception as e:
+            result = {"status": "inconclusive", "ok": False, "error": f"Exception: {str(e)}"}
+        
+        when = planned_at.strftime('%H:%M:%S')
+        if result["ok"]:
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info(f"[PREFLIGHT] [{name}] {action} at {when} ready "
+                                 f"(dns {result.get('dns_ms')}ms, request {result.get('request_ms')}ms)")
+        elif result["status"] == "auth_expired":
+            self.logger.error(f"[PREFLIGHT] [{name}] {action} at {when} will fail: {result.get('error')}")
+            self.handle_cookie_failure(f"Cookie expired (pre-flight): {result.get('error')}", account)
+        else:
+            self.logger.warning(f"[PREFLIGHT] [{name}] {action} at {when}: {result['status']} - "
+                                f"{result.get('error')}; the punch will retry on its own")
+        return result
     
     def run(self):
         """Main service loop"""
         self.logger.info(f"Attendance service started... (PID: {os.getpid()})")
+        for account in self.accounts:
+            self.log_token_state(account)
+        self.setup_metrics()
+        self.setup_tracing()
+        self.setup_control_socket()
+        self.setup_coordination()
         self.setup_schedule()
         
         try:
-            check_interval = self.config.get("service_settings", {}).get("check_interval_seconds", 30)
             while self.running:
-                schedule.run_pending()
-                time.sleep(check_interval)  # Check interval from config
+                if self.reload_requested:
+                    self.reload()
+                self.scheduler.run_pending()
+                
+                next_run = self.scheduler.next_run()
+                if next_run:
+                    self.logger.debug(f"Sleeping until next job at {next_run}")
+                # Cap the sleep so wall-clock jumps (NTP, DST) are picked up eventually
+                max_sleep = self.config.get("service_settings", {}).get("max_sleep_seconds", 3600)
+                self.scheduler.wait_for_next(max_sleep)
         except Exception as e:
             self.logger.error(f"Service runtime exception: {str(e)}")
         finally:
-            self.remove_pid()
-            self.logger.info("Attendance service stopped")
+            self.shutdown()
+    
+    def shutdown(self):
+        """Release workers, exporters, files and flush the log pipeline"""
+        self.shutdown_workers()
+        if self.lease is not None:
+            self.lease.release()
+            self.lease.close()
+        self.stop_control_socket()
+        self.stop_metrics()
+        self.stop_tracing()
+        self.scheduler.close()
+        self.ledger.close()
+        self.plans.close()
+        self.remove_pid()
+        self.logger.info("Attendance service stopped")
+        self.log_listener.stop()
+
+    def shutdown_workers(self):
+        """Cancel queued punches and wait for in-flight ones to finish.
+        
+        A running punch is never abandoned: its ledger entry and plan state
+        are what stop a restart (or a standby replica) from punching again,
+        so the ledger stays open until it has been recorded. Each punch is
+        bounded by retry.punch_deadline_seconds; shutdown_grace_seconds
+        only decides when to start warning about the wait. A leader keeps
+        renewing its lease meanwhile - otherwise a standby would take over
+        and claim the rows these punches still hold.
+        """
+        self.running = False
+        with self.state_lock:
+            futures = list(self.in_flight.values())
+            preflights = list(self.preflights)
+        for future in preflights:
+            future.cancel()
+        cancelled = sum(1 for future in futures if future.cancel())
+        if cancelled:
+            self.logger.info(f"Cancelled {cancelled} queued punch job(s)")
+        
+        grace = self.config.get("service_settings", {}).get("shutdown_grace_seconds", 10)
+        warn_at = time.monotonic() + grace
+        holds_lease = self.lease is not None and self.lease.fence is not None
+        pending = [future for future in futures if not future.done()]
+        while pending:
+            timeout = self.lease_renew_seconds if holds_lease else None
+            if warn_at is not None:
+                timeout = max(0.0, min(timeout or grace, warn_at - time.monotonic()))
+            wait_for_futures(pending, timeout=timeout)
+            pending = [future for future in pending if not future.done()]
+            if not pending:
+                break
+            if holds_lease:
+                holds_lease = self.keep_lease()
+            if warn_at is not None and time.monotonic() >= warn_at:
+                self.logger.warning(f"{len(pending)} punch job(s) still running after {grace}s grace period - "
+                                    f"waiting for them to be recorded before closing the ledger")
+                warn_at = None
+        self.executor.shutdown(wait=False)
+        # A running pre-flight is bounded by preflight.timeout_seconds; it may still write cookies and log
+        self.preflight_executor.shutdown(wait=True)
+    
+    def keep_lease(self):
+        """Renew the lease while draining; False once another replica holds it.
+        
+        This goes through acquire(), so a lease that lapsed without anyone
+        taking it over is simply taken back, under a new fence.
+        """
+        try:
+            if self.lease.acquire() is not None:
+                return True
+        except Exception as e:
+            self.logger.error(f"Cannot renew the punch lease: {e}")
+            return False
+        self.logger.error("[STANDBY] Punch lease lost while punches are still running")
+        return False
 
 def main():
     # Check if instance is already running
@@ -0,0 +1,132 @@
+"""CLI start-up benchmark based on `python -X importtime`.
+
+Runs manual_punch.py commands in a scratch workspace and adds up the
+import time each one spends beyond a bare interpreter start:
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --runs 9 --budget-ms 40
+
+`analyze` and `report` are held to --budget-ms and must not load any
+network or scheduling module; the exit code is 1 when one does or runs
+over budget, so the script can guard against an eager import creeping
+back.
+Nothing here talks to the network.
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Set, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("requests", "urllib3", "http.server", "sqlite3", "concurrent.futures", "punch_scheduler")
+
+# (label, argv after the interpreter, budgeted)
+COMMANDS = [
+    ("analyze", [os.path.join(ROOT, "manual_punch.py"), "analyze"], True),
+    ("report", [os.path.join(ROOT, "manual_punch.py"), "report"], True),
+    ("workdays", [os.path.join(ROOT, "manual_punch.py"), "workdays", "1"], False),
+    ("ledger today", [os.path.join(ROOT, "manual_punch.py"), "ledger", "today"], False),
+    ("service_control", [os.path.join(ROOT, "service_control.py"), "status", "--socket", "missing.sock"], False),
+    ("import attendance_service", ["-c", "import attendance_service"], False)
+]
+
+
+def write_workspace(root: str) -> None:
+    """Config with a decodable (fake) JWT so `analyze` runs its full path.
+
+    There is no cookies.json, so the token is read from the config the way
+    a fresh install falls back to it.
+    """
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": int(time.time()) + 3600}).encode()).decode().rstrip("=")
+    config = {
+        "authentication": {"module_session_cookie": f"eyJhbGciOiJub25lIn0.{payload}.sig"},
+        "service_settings": {"base_url": "http://127.0.0.1:9", "ledger_file": os.path.join(root, "ledger.db")}
+    }
+    with open(os.path.join(root, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+
+
+def parse_importtime(stderr: str) -> Tuple[Dict[str, int], Set[str]]:
+    """Top-level cumulative microseconds per module, and every module imported"""
+    top_level: Dict[str, int] = {}
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        modules.add(name.strip())
+        if not name.startswith("  "):
+            top_level[name.strip()] = int(cumulative)
+    return top_level, modules
+
+
+def run_importtime(argv: List[str], cwd: str) -> Tuple[Dict[str, int], Set[str], float]:
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime"] + argv, cwd=cwd, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=60)
+    wall = time.perf_counter() - started
+    top_level, modules = parse_importtime(completed.stderr)
+    return top_level, modules, wall
+
+
+def measure(argv: List[str], cwd: str, runs: int, baseline: Set[str]) -> Dict[str, object]:
+    import_ms, wall_ms = [], []
+    modules: Set[str] = set()
+    for _ in range(runs):
+        top_level, modules, wall = run_importtime(argv, cwd)
+        import_ms.append(sum(us for name, us in top_level.items() if name not in baseline) / 1000)
+        wall_ms.append(wall * 1000)
+    return {
+        "import_ms": statistics.median(import_ms),
+        "wall_ms": statistics.median(wall_ms),
+        "heavy": sorted(name for name in HEAVY_MODULES if name in modules)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CLI import time with -X importtime")
+    parser.add_argument("--runs", type=int, default=5, help="runs per command (median is reported)")
+    parser.add_argument("--budget-ms", type=float, default=40.0, help="import-time budget for `analyze` and `report`")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="punch-import-") as root:
+        write_workspace(root)
+        # Warm the bytecode cache so compilation is not counted
+        subprocess.run([sys.executable, "-m", "compileall", "-q", ROOT], stdout=subprocess.DEVNULL)
+        baseline, _, _ = run_importtime(["-c", "pass"], root)
+        results = {label: dict(measure(argv, root, max(1, args.runs), set(baseline)), budgeted=budgeted)
+                   for label, argv, budgeted in COMMANDS}
+
+    failures = []
+    for label, result in results.items():
+        if not result["budgeted"]:
+            continue
+        if result["import_ms"] > args.budget_ms:
+            failures.append(f"{label}: imports took {result['import_ms']:.1f}ms (budget {args.budget_ms:.0f}ms)")
+        if result["heavy"]:
+            failures.append(f"{label}: loaded {', '.join(result['heavy'])}")
+
+    if args.json:
+        print(json.dumps({"budget_ms": args.budget_ms, "results": results, "failures": failures}, indent=2))
+    else:
+        print(f"{'command':<28}  {'imports':>9}  {'process':>9}  heavy modules loaded")
+        for label, result in results.items():
+            print(f"{label:<28}  {result['import_ms']:>7.1f}ms  {result['wall_ms']:>7.1f}ms  "
+                  f"{', '.join(result['heavy']) or '-'}")
+        for failure in failures:
+            print(f"OVER BUDGET  {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""Punch-path benchmark against the local mock HR backend.
+
+Drives manual_punch.punch_batch and the AttendanceService worker pool at
+several account counts and reports throughput, latency percentiles and
+retries:
+
+    python benchmarks/bench_punch.py --accounts 1,10,100,1000 --latency-ms 40 \\
+        --fault unauthorized=0.02 --fault reset=0.01
+    python benchmarks/bench_punch.py --accounts 200 --punch-rate 20 --burst 5
+
+The HR rate limiters are off unless --punch-rate / --refresh-rate are given;
+`delayed` and `max_wait_s` then show how long requests queued for a slot.
+
+The backend is always a MockHRServer started in-process unless --base-url
+points at one started separately; the real apollo.mayohr.com is refused.
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_hr_server import MockHRServer, parse_faults  # noqa: E402
+
+
+def make_jwt(lifetime_seconds: int = 86400) -> str:
+    """Unsigned JWT with a valid exp claim - the mock never verifies signatures"""
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+    now = int(time.time())
+    return f"{encode({'alg': 'none'})}.{encode({'iat': now, 'exp': now + lifetime_seconds})}.mock"
+
+
+def write_accounts(root: str, count: int, base_url: str, timeout: float,
+                   rate_limits: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+    """Create per-account config and cookie files pointing at the mock backend"""
+    config = {
+        "service_settings": {
+            "base_url": base_url,
+            "max_retries": 2,
+            "timeout_seconds": timeout,
+            "retry": {"backoff_base_seconds": 0.05, "backoff_max_seconds": 0.5, "punch_deadline_seconds": timeout * 4},
+            "rate_limits": rate_limits or {}
+        }
+    }
+    config_file = os.path.join(root, "config.json")
+    with open(config_file, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+
+    accounts = []
+    token = make_jwt()
+    for index in range(count):
+        name = f"bench{index:05d}"
+        cookie_file = os.path.join(root, f"cookies_{name}.json")
+        with open(cookie_file, "w", encoding="utf-8") as f:
+            json.dump({"__ModuleSessionCookie": token, "incap_ses_mock": "seed"}, f)
+        accounts.append({"name": name, "config_file": config_file, "cookie_file": cookie_file})
+    return accounts
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(label: str, count: int, elapsed: float, latencies: List[float],
+              results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    return {
+        "mode": label,
+        "accounts": count,
+        "elapsed_seconds": round(elapsed, 3),
+        "punches_per_second": round(len(results) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "succeeded": sum(1 for result in results if result.get("success")),
+        "failed": sum(1 for result in results if not result.get("success")),
+        "retries": sum(max(0, result.get("attempts", 1) - 1) for result in results),
+        **rate_limit_columns()
+    }
+
+
+def rate_limit_columns() -> Dict[str, Any]:
+    """Punch limiter statistics for the run that just finished, then start the next one afresh"""
+    from rate_limiter import rate_limit_stats, reset_rate_limiters
+    stats = rate_limit_stats().get("punch", {})
+    reset_rate_limiters()
+    return {"delayed": stats.get("delayed", 0), "max_wait_s": stats.get("wait_max_seconds", 0.0)}
+
+
+def timed_punch(latencies: List[float], lock: threading.Lock):
+    """Wrap punch_attendance so every call records its wall-clock latency"""
+    import manual_punch
+    original = manual_punch.punch_attendance
+
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+    return original, wrapper
+
+
+def bench_batch(accounts: List[Dict[str, str]], concurrency: int) -> Dict[str, Any]:
+    import manual_punch
+    latencies, lock = [], threading.Lock()
+    original, wrapper = timed_punch(latencies, lock)
+    manual_punch.punch_attendance = wrapper
+    try:
+        started = time.perf_counter()
+        results = manual_punch.punch_batch(accounts, attendance_type=1, max_concurrency=concurrency)
+        elapsed = time.perf_counter() - started
+    finally:
+        manual_punch.punch_attendance = original
+    return summarize("batch", len(accounts), elapsed, latencies, list(results.values()))
+
+
+def bench_service(root: str, accounts: List[Dict[str, str]], concurrency: int) -> Dict[str, Any]:
+    import attendance_service
+    import manual_punch
+
+    with open(os.path.join(root, "accounts.json"), "w", encoding="utf-8") as f:
+        json.dump({"accounts": accounts}, f)
+    service_config = manual_punch.load_config(accounts[0]["config_file"])
+    service_config = dict(service_config, service_settings=dict(
+        service_config["service_settings"], accounts_file=os.path.join(root, "accounts.json"),
+        max_in_flight_punches=concurrency))
+    with open("config.json", "w", encoding="utf-8") as f:
+        json.dump(service_config, f)
+
+    latencies, lock = [], threading.Lock()
+    original, wrapper = timed_punch(latencies, lock)
+    attendance_service.punch_attendance = wrapper
+    service = attendance_service.AttendanceService()
+    try:
+        started = time.perf_counter()
+        futures = [service.submit_punch(account, 1) for account in service.accounts]
+        results = [future.result() or {} for future in futures if future is not None]
+        elapsed = time.perf_counter() - started
+    finally:
+        attendance_service.punch_attendance = original
+        service.shutdown()
+    return summarize("service", len(accounts), elapsed, latencies, results)
+
+
+def print_table(rows: List[Dict[str, Any]]) -> None:
+    columns = ["mode", "accounts", "punches_per_second", "p50_ms", "p95_ms", "p99_ms",
+               "succeeded", "failed", "retries", "delayed", "max_wait_s", "elapsed_seconds"]
+    widths = {column: max(len(column), *(len(str(row[column])) for row in rows)) for column in columns}
+    print("  ".join(column.rjust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row[column]).rjust(widths[column]) for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the punch path against a mock HR backend")
+    parser.add_argument("--accounts", default="1,10,100,1000", help="comma separated account counts")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mode", choices=["batch", "service", "both"], default="both")
+    parser.add_argument("--base-url", default=None, help="use an already running mock instead of an in-process one")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--fault", action="append", metavar="KIND=P", help="fault probability for the mock")
+    parser.add_argument("--timeout", type=float, default=2.0, help="client timeout_seconds")
+    parser.add_argument("--punch-rate", type=float, default=None, help="punch requests per second (default: unlimited)")
+    parser.add_argument("--refresh-rate", type=float, default=None, help="cookie refreshes per second (default: unlimited)")
+    parser.add_argument("--burst", type=float, default=1.0, help="token bucket size for the limits above")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = MockHRServer(("127.0.0.1", 0), args.latency_ms, args.latency_jitter_ms,
+                              parse_faults(args.fault), hang_seconds=args.timeout + 1, seed=args.seed)
+        server.start_background()
+        base_url = server.base_url
+    elif urlparse(base_url).hostname and urlparse(base_url).hostname.endswith("mayohr.com"):
+        parser.error("refusing to benchmark against the real HR backend")
+
+    rate_limits = {endpoint: {"rate_per_second": rate, "burst": args.burst}
+                   for endpoint, rate in (("punch", args.punch_rate), ("refresh", args.refresh_rate))}
+
+    # Keep the per-punch print/log chatter out of the measurements
+    logging.disable(logging.CRITICAL)
+    devnull = open(os.devnull, "w")
+    rows = []
+    workdir = os.getcwd()
+    try:
+        for count in [int(value) for value in args.accounts.split(",") if value]:
+            with tempfile.TemporaryDirectory(prefix="punch-bench-") as root:
+                os.chdir(root)
+                accounts = write_accounts(root, count, base_url, args.timeout, rate_limits)
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    if args.mode in ("batch", "both"):
+                        rows.append(bench_batch(accounts, args.concurrency))
+                    if args.mode in ("service", "both"):
+                        rows.append(bench_service(root, accounts, args.concurrency))
+                finally:
+                    sys.stdout = stdout
+                    os.chdir(workdir)
+    finally:
+        devnull.close()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    if args.json:
+        print(json.dumps({"base_url": base_url, "results": rows,
+                          "server_counts": server.counts if server else None}, indent=2))
+    else:
+        print_table(rows)
+        if server is not None:
+            print(f"Mock backend requests: {json.dumps(server.counts, sort_keys=True)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""Local stand-in for the apollo.mayohr.com punch backend with fault injection.
+
+Serves the punch endpoint, the root page used by refresh_session_cookies and
+the web punch page loaded by pre-flight checks.
+Point `service_settings.base_url` at it to load-test without touching the
+real HR system:
+
+    python benchmarks/mock_hr_server.py --port 8089 --latency-ms 40 \\
+        --fault unauthorized=0.02 --fault reset=0.01 --fault timeout=0.005
+"""
+import argparse
+import json
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+PUNCH_PATH = "/backend/pt/api/checkIn/punch/web"
+
+# Fault kinds, each injected with an independent probability per punch request
+FAULT_KINDS = [
+    "unauthorized",    # HTTP 401
+    "login_redirect",  # 302 to /login
+    "json_error",      # 200 with an auth-style JSON error body
+    "server_error",    # HTTP 500
+    "timeout",         # hang past the client timeout
+    "reset",           # abort the TCP connection with RST
+]
+
+
+class MockHRServer(ThreadingHTTPServer):
+    """Threaded HTTP/1.1 server holding fault settings and request counters"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, latency_ms: float = 0.0, latency_jitter_ms: float = 0.0,
+                 faults: Optional[Dict[str, float]] = None, hang_seconds: float = 5.0, seed: Optional[int] = None):
+        super().__init__(address, MockHRHandler)
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.faults = dict(faults or {})
+        self.hang_seconds = hang_seconds
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self.counts_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str) -> None:
+        with self.counts_lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def pick_fault(self) -> Optional[str]:
+        with self.random_lock:
+            roll = self.random.random()
+        threshold = 0.0
+        for kind in FAULT_KINDS:
+            threshold += self.faults.get(kind, 0.0)
+            if roll < threshold:
+                return kind
+        return None
+
+    def latency(self) -> float:
+        if not self.latency_ms and not self.latency_jitter_ms:
+            return 0.0
+        with self.random_lock:
+            jitter = self.random.uniform(-self.latency_jitter_ms, self.latency_jitter_ms)
+        return max(0.0, self.latency_ms + jitter) / 1000.0
+
+    def start_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="mock-hr-server", daemon=True)
+        thread.start()
+        return thread
+
+
+class MockHRHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real backend
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json",
+              headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send(status, json.dumps(data).encode("utf-8"), headers=headers)
+
+    def _reset_connection(self) -> None:
+        # SO_LINGER with zero timeout makes close() send RST instead of FIN
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        self.close_connection = True
+        self.connection.close()
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split("?", 1)[0]
+        if path in ("/", "/ta"):
+            # "/ta" is the web punch page that pre-flight checks load
+            server.count("root" if path == "/" else "punch_page")
+            self._send(200, b"<html>apollo mock</html>", "text/html",
+                       {"Set-Cookie": f"incap_ses_mock=ses{int(time.time())}; Path=/"})
+        elif path == "/login":
+            server.count("login_page")
+            self._send(200, b"<html>Login</html>", "text/html")
+        else:
+            server.count("not_found")
+            self._send_json(404, {"Error": {"Title": "NotFound"}})
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        if self.path.split("?", 1)[0] != PUNCH_PATH:
+            server.count("not_found")
+            self._send_json(404, {"Error": {"Title": "NotFound"}})
+            return
+
+        delay = server.latency()
+        if delay:
+            time.sleep(delay)
+
+        fault = server.pick_fault()
+        server.count(f"punch_{fault or 'ok'}")
+
+        if fault == "unauthorized":
+            self._send_json(401, {"Error": {"Title": "Unauthorized", "Message": "invalid token"}})
+        elif fault == "login_redirect":
+            self._send(302, b"", "text/html", {"Location": "/login?ReturnUrl=%2Fta"})
+        elif fault == "json_error":
+            self._send_json(200, {"Error": {"Title": "Authentication", "Message": "Session expired, login required"}})
+        elif fault == "server_error":
+            self._send_json(500, {"Error": {"Title": "InternalServerError"}})
+        elif fault == "timeout":
+            time.sleep(server.hang_seconds)
+            self._reset_connection()
+        elif fault == "reset":
+            self._reset_connection()
+        else:
+            try:
+                attendance_type = json.loads(body or b"{}").get("AttendanceType")
+            except ValueError:
+                attendance_type = None
+            self._send_json(200, {
+                "Meta": {"HttpStatusCode": "200"},
+                "Data": {"punchDate": time.strftime("%Y-%m-%dT%H:%M:%S"), "AttendanceType": attendance_type}
+            })
+
+
+def parse_faults(values) -> Dict[str, float]:
+    """Parse repeated kind=probability options"""
+    faults = {}
+    for value in values or []:
+        kind, _, probability = value.partition("=")
+        if kind not in FAULT_KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown fault '{kind}', expected one of {', '.join(FAULT_KINDS)}")
+        faults[kind] = float(probability)
+    return faults
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock apollo.mayohr.com punch backend")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=5.0, help="how long 'timeout' faults hang")
+    parser.add_argument("--fault", action="append", metavar="KIND=P",
+                        help=f"fault probability, KIND in {', '.join(FAULT_KINDS)}")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockHRServer((args.host, args.port), args.latency_ms, args.latency_jitter_ms,
+                          parse_faults(args.fault), args.hang_seconds, args.seed)
+    print(f"Mock HR backend listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Request counts: {json.dumps(server.counts, sort_keys=True)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,428 @@
+"""Fast-forward AttendanceService on a virtual clock against a stub punch backend.
+
+Replays the real planning, scheduling, worker and ledger code over any date
+range without waiting or touching the network:
+
+    python benchmarks/simulate_service.py --start 2026-01-01 --days 365 --accounts 20 --quiet
+    python benchmarks/simulate_service.py --start 2026-01-01 --days 28 --accounts 300 --no-preflight --quiet
+    python benchmarks/simulate_service.py --days 30 --accounts 5 --failure-rate 0.05 --reload-every-days 7
+    python benchmarks/simulate_service.py --start 2026-01-05 --days 3 --accounts 500 \
+        --outage-at "2026-01-05 09:00" --outage-minutes 45
+    python benchmarks/simulate_service.py --start 2026-01-05 --days 3 --accounts 500 --replicas 3 \
+        --crash-leader-at "2026-01-05 09:15"
+
+Every fired punch, its drift, each failure and every planned punch that never
+fired (missed) or fired twice (duplicate) is reported; the exit code is 1 when
+anything was missed or duplicated, so the run doubles as a regression check.
+With --outage-at the service is stopped for --outage-minutes and a fresh
+instance is started on the same ledger, exercising start-up recovery:
+punches it flags as missed are reported as `flagged`, not as missed.
+--replicas runs several services against one shared ledger and lease, and
+--crash-leader-at kills the lease holder so a standby has to take over.
+Times are naive local wall-clock times, exactly as the service uses them.
+Every punch goes through the full service path. Runs that never restart keep
+the ledger and plans in memory (nothing else reads them), which puts one core
+at roughly 7000 punches per second: the first four runs above take seconds and
+a year of 1000 accounts (522k punches) a little over a minute. Outage and
+replica runs need the shared SQLite file, and with --replicas its rollback
+journal syncs to disk on every commit, so that run takes tens of seconds.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PUNCH_TYPE_NAMES = {1: "checkin", 2: "checkout"}
+LATE_SECONDS = 1.0
+
+
+class VirtualClock:
+    """Callable clock that only moves when told to"""
+
+    def __init__(self, start: datetime):
+        self.current = start
+
+    def __call__(self) -> datetime:
+        return self.current
+
+    def advance_to(self, when: datetime) -> None:
+        if when > self.current:
+            self.current = when
+
+
+class StubPunchBackend:
+    """Drop-in for punch_attendance that fails with a fixed probability"""
+
+    def __init__(self, failure_rate: float = 0.0, seed: int = 1):
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.preflights = 0
+
+    def preflight(self, config_file: str = "config.json", cookie_file: str = "cookies.json",
+                  punch_at: datetime = None) -> Dict[str, Any]:
+        """Drop-in for preflight_account - always ready"""
+        self.preflights += 1
+        return {"status": "ok", "ok": True, "dns_ms": 0.0, "request_ms": 0.0}
+
+    def __call__(self, attendance_type: int = 1, is_override: bool = False, max_retries: int = None,
+                 config_file: str = "config.json", cookie_file: str = "cookies.json") -> Dict[str, Any]:
+        self.calls += 1
+        if self.random.random() < self.failure_rate:
+            return {"success": False, "status_code": 500, "outcome": "server_error",
+                    "error": "HTTP 500: simulated failure", "attempts": 1, "elapsed_seconds": 0.0}
+        return {"success": True, "status_code": 200, "outcome": "success",
+                "data": {"Data": {"punchDate": "simulated"}}, "attempts": 1, "elapsed_seconds": 0.0}
+
+
+class DeferredExecutor:
+    """Worker pool stand-in: queued punches run when the simulation drains them, at the current virtual time"""
+
+    def __init__(self):
+        self.queue = []
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        self.queue.append((future, fn, args, kwargs))
+        return future
+
+    def run_queued(self) -> None:
+        queue, self.queue = self.queue, []
+        for future, fn, args, kwargs in queue:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        for future, _, _, _ in self.queue:
+            future.cancel()
+        self.queue = []
+
+
+class MemoryLedger:
+    """Dict-backed stand-in for PunchLedger in runs without a restart - nothing has to outlive the process"""
+
+    db_path = ":memory:"
+
+    def __init__(self):
+        self.rows: List[Dict[str, Any]] = []
+        self.successes: Dict[tuple, datetime] = {}  # (account, iso date, punch type) -> first success
+
+    def record(self, account: str, punch_type: int, actual_at: datetime, success: bool,
+               planned_at: Optional[datetime] = None, latency_ms: Optional[float] = None,
+               status_code: Optional[int] = None, error: Optional[str] = None) -> int:
+        self.rows.append({"id": len(self.rows) + 1, "account": account, "punch_type": punch_type,
+                          "punch_date": actual_at.date().isoformat(), "planned_at": planned_at, "actual_at": actual_at,
+                          "latency_ms": latency_ms, "status_code": status_code, "success": int(success), "error": error})
+        if success:
+            self.successes.setdefault((account, actual_at.date().isoformat(), punch_type), actual_at)
+        return len(self.rows)
+
+    def first_success(self, account: str, punch_type: int, day: date) -> Optional[datetime]:
+        return self.successes.get((account, day.isoformat(), punch_type))
+
+    def successful_keys(self, start: date, end: date) -> set:
+        start, end = start.isoformat(), end.isoformat()
+        return {key for key in self.successes if start <= key[1] <= end}
+
+    def last_punch(self, account: str) -> Optional[Dict[str, Any]]:
+        return next((row for row in reversed(self.rows) if row["account"] == account), None)
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryPlanStore:
+    """Dict-backed stand-in for PunchPlanStore with the same row states and query semantics"""
+
+    db_path = ":memory:"
+
+    def __init__(self):
+        self.rows: Dict[tuple, list] = {}  # (account, day, punch type) -> [planned_at, status]
+        self.by_day: Dict[date, set] = {}
+
+    def save(self, rows, replace: bool = False, now: Optional[datetime] = None) -> int:
+        rows = list(rows)
+        for account, day, punch_type, planned_at in rows:
+            key = (account, day, punch_type)
+            status = "planned" if planned_at > now else "skipped"
+            existing = self.rows.get(key)
+            if existing is None:
+                self.rows[key] = [planned_at, status]
+                self.by_day.setdefault(day, set()).add(key)
+            elif replace and existing[1] == "planned":
+                existing[:] = [planned_at, status]
+        return len(rows)
+
+    def _keys_between(self, start: date, end: date) -> List[tuple]:
+        keys = []
+        day = start
+        while day <= end:
+            keys.extend(self.by_day.get(day, ()))
+            day += timedelta(days=1)
+        return keys
+
+    def planned_days(self, start: date, end: date, account: Optional[str] = None) -> set:
+        return {(name, day.isoformat()) for name, day, _ in self._keys_between(start, end)
+                if account is None or name == account}
+
+    def plans_between(self, start: date, end: date, account: Optional[str] = None) -> List[tuple]:
+        return [(name, day, punch_type, self.rows[(name, day, punch_type)][0])
+                for name, day, punch_type in sorted(self._keys_between(start, end), key=lambda key: (key[1], key[0], key[2]))
+                if account is None or name == account]
+
+    def due_between(self, start: datetime, end: datetime) -> List[tuple]:
+        # A punch-out can run past midnight, so look one day back
+        rows = [(name, day, punch_type, self.rows[(name, day, punch_type)][0])
+                for name, day, punch_type in self._keys_between(start.date() - timedelta(days=1), end.date())]
+        return sorted((row for row in rows if start <= row[3] < end), key=lambda row: row[3])
+
+    def unresolved_until(self, end: datetime) -> List[tuple]:
+        return sorted(((name, day, punch_type, planned_at) for (name, day, punch_type), (planned_at, status)
+                       in self.rows.items() if status in ("planned", "running") and planned_at <= end),
+                      key=lambda row: row[3])
+
+    def mark(self, keys, status: str, completed_at: Optional[datetime] = None) -> int:
+        marked = 0
+        for key in keys:
+            row = self.rows.get(key)
+            if row is not None:
+                row[1] = status
+                marked += 1
+        return marked
+
+    def delete_from(self, accounts, start: date) -> int:
+        accounts = set(accounts)
+        doomed = [key for key in self.rows if key[0] in accounts and key[1] >= start]
+        for key in doomed:
+            del self.rows[key]
+            self.by_day[key[1]].discard(key)
+        return len(doomed)
+
+    def close(self) -> None:
+        pass
+
+
+def write_workspace(root: str, accounts: int, seed: int, durable: bool = False, coordinated: bool = False,
+                    preflight: bool = True) -> None:
+    """Config and accounts for the simulated service; the ledger stays in memory unless it must survive a restart"""
+    config = {
+        "work_schedule": {"work_duration_hours": 9},
+        "service_settings": {
+            "accounts_file": os.path.join(root, "accounts.json"),
+            "ledger_file": os.path.join(root, "ledger.db") if durable else ":memory:",
+            "plan": {"seed": seed},
+            "coordination": {"enabled": coordinated},
+            "preflight": {"enabled": preflight},
+            "logging": {"level": "WARNING", "file": os.path.join(root, "logs", "simulation.log"), "console": False}
+        }
+    }
+    with open(os.path.join(root, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    entries = [{"name": f"sim{index:05d}", "config_file": "config.json"} for index in range(accounts)]
+    with open(os.path.join(root, "accounts.json"), "w", encoding="utf-8") as f:
+        json.dump({"accounts": entries}, f)
+
+
+def simulate(start: date, days: int, accounts: int, failure_rate: float = 0.0, wake_latency_ms: float = 0.0,
+             reload_every_days: int = 0, seed: int = 1, quiet: bool = False,
+             outage_at: Optional[datetime] = None, outage_minutes: float = 0.0,
+             replicas: int = 1, crash_leader_at: Optional[datetime] = None, preflight: bool = True) -> Dict[str, Any]:
+    import attendance_service
+
+    root = os.getcwd()
+    durable = outage_at is not None or replicas > 1
+    write_workspace(root, accounts, seed, durable=durable, coordinated=replicas > 1, preflight=preflight)
+    clock = VirtualClock(datetime.combine(start, datetime.min.time()))
+    end = clock() + timedelta(days=days)
+    backend = StubPunchBackend(failure_rate, seed)
+    latency = random.Random(seed)
+
+    fired: Dict[tuple, int] = {}
+    fired_by: Dict[str, int] = {}
+    drifts: List[float] = []
+    failures = []
+    caught_up = []
+    recovery = {}
+    restarted_at = None
+    crashed = None
+
+    def start_service(replica_id):
+        executor = DeferredExecutor()
+        service = attendance_service.AttendanceService(clock=clock, punch_func=backend, executor=executor,
+                                                       preflight_func=backend.preflight, replica_id=replica_id,
+                                                       preflight_executor=executor)
+        if not durable:
+            # Nothing restarts, so the stores only have to answer the running service - skip SQLite
+            service.ledger.close()
+            service.plans.close()
+            service.ledger, service.plans = MemoryLedger(), MemoryPlanStore()
+        execute_punch = service.execute_punch
+        service.execute_punch = lambda account, attendance_type, planned_at=None: record_punch(
+            execute_punch, replica_id, account, attendance_type, planned_at)
+        service.setup_coordination()
+        return service, executor
+
+    def record_punch(execute_punch, replica_id, account, attendance_type, planned_at=None):
+        result = execute_punch(account, attendance_type, planned_at)
+        key = (account["name"], planned_at.date(), attendance_type)
+        fired[key] = fired.get(key, 0) + 1
+        fired_by[replica_id] = fired_by.get(replica_id, 0) + 1
+        drift = (clock() - planned_at).total_seconds()
+        # Punched after a restart or a takeover rather than on schedule
+        if drift > LATE_SECONDS:
+            caught_up.append(drift)
+        else:
+            drifts.append(drift)
+        if not result.get("success"):
+            failures.append((key, result.get("error")))
+        if not quiet:
+            outcome = "ok" if result.get("success") else f"FAILED {result.get('error')}"
+            print(f"{clock().isoformat(sep=' ')}  {account['name']:<10}  {PUNCH_TYPE_NAMES[attendance_type]:<8}  "
+                  f"planned {planned_at.strftime('%H:%M:%S')}  drift {drift:+.3f}s  {outcome}  {replica_id}")
+        return result
+
+    replica_ids = [f"replica-{index + 1}" for index in range(max(1, replicas))]
+    live = [start_service(replica_id) for replica_id in replica_ids]
+    started = time.perf_counter()
+    try:
+        for service, _ in live:
+            service.setup_schedule()
+        next_reload = clock() + timedelta(days=reload_every_days) if reload_every_days else None
+        while True:
+            for service, executor in live:
+                service.scheduler.run_pending()
+                executor.run_queued()
+            next_run = min((service.scheduler.next_run() or end for service, _ in live), default=end)
+            if outage_at is not None and restarted_at is None and next_run >= outage_at:
+                # Stop, stay down, then start fresh instances that only have the database to go on
+                clock.advance_to(outage_at)
+                for service, _ in live:
+                    service.shutdown()
+                clock.advance_to(outage_at + timedelta(minutes=outage_minutes))
+                restarted_at = clock()
+                live = [start_service(replica_id) for replica_id in replica_ids]
+                for service, _ in live:
+                    service.setup_schedule()
+                recovery = live[0][0].recovery
+                continue
+            if crash_leader_at is not None and crashed is None and next_run >= crash_leader_at:
+                # The leader vanishes without releasing its lease; a standby must notice the lapse
+                clock.advance_to(crash_leader_at)
+                crashed = next((entry for entry in live if entry[0].lease.is_leader()), live[0])
+                live.remove(crashed)
+                crashed[1].queue = []
+                continue
+            if next_reload is not None and clock() >= next_reload:
+                live[0][0].reload()
+                next_reload += timedelta(days=reload_every_days)
+            if next_run >= end:
+                break
+            if next_reload is not None and next_reload < next_run:
+                clock.advance_to(next_reload)
+                continue
+            clock.advance_to(next_run + timedelta(milliseconds=latency.uniform(0, wake_latency_ms)))
+        elapsed = time.perf_counter() - started
+
+        # Everything planned inside the range should have fired exactly once
+        service = live[0][0]
+        planned = service.plans.due_between(datetime.combine(start, datetime.min.time()), end)
+        planned_keys = {(name, day, attendance_type) for name, day, attendance_type, _ in planned}
+        if crashed is not None:
+            recovery = next((entry[0].recovery for entry in live if entry[0].lease.is_leader()), recovery)
+    finally:
+        for service, _ in live + ([crashed] if crashed else []):
+            service.shutdown()
+
+    # Punches due during the outage but older than the catch-up grace are expected to be flagged, not fired
+    flagged = set()
+    if restarted_at is not None:
+        grace = timedelta(seconds=service.config.get("service_settings", {}).get(
+            "catch_up_grace_seconds", attendance_service.DEFAULT_CATCH_UP_GRACE_SECONDS))
+        flagged = {(name, day, attendance_type) for name, day, attendance_type, planned_at in planned
+                   if outage_at <= planned_at < restarted_at - grace}
+    missed = sorted(planned_keys - set(fired) - flagged)
+    duplicates = sorted(key for key, count in fired.items() if count > 1)
+    if not quiet:
+        for name, day, attendance_type in missed:
+            print(f"MISSED     {day.isoformat()}  {name:<10}  {PUNCH_TYPE_NAMES[attendance_type]}")
+        for name, day, attendance_type in duplicates:
+            print(f"DUPLICATE  {day.isoformat()}  {name:<10}  {PUNCH_TYPE_NAMES[attendance_type]}")
+
+    summary = {
+        "start": start.isoformat(),
+        "days": days,
+        "accounts": accounts,
+        "planned": len(planned_keys),
+        "fired": sum(fired.values()),
+        "preflights": backend.preflights,
+        "failed": len(failures),
+        "missed": len(missed),
+        "duplicates": len(duplicates),
+        "caught_up": len(caught_up),
+        "flagged": len(flagged),
+        "max_drift_seconds": round(max(drifts), 3) if drifts else 0.0,
+        "mean_drift_seconds": round(sum(drifts) / len(drifts), 3) if drifts else 0.0,
+        "max_catch_up_seconds": round(max(caught_up), 3) if caught_up else 0.0,
+        "wall_seconds": round(elapsed, 2),
+        "punches_per_second": round(sum(fired.values()) / elapsed) if elapsed else 0,
+        "recovery": recovery or None
+    }
+    if replicas > 1:
+        summary["fired_by"] = fired_by
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the attendance service on a virtual clock")
+    parser.add_argument("--start", default=date.today().isoformat(), help="first simulated day (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="probability a stub punch fails")
+    parser.add_argument("--wake-latency-ms", type=float, default=0.0, help="random scheduler wake-up lateness")
+    parser.add_argument("--reload-every-days", type=int, default=0, help="run a hot reload every N days")
+    parser.add_argument("--outage-at", help="stop the service at this time (YYYY-MM-DD HH:MM) and restart it later")
+    parser.add_argument("--outage-minutes", type=float, default=60.0, help="how long the service stays down")
+    parser.add_argument("--replicas", type=int, default=1, help="run N replicas sharing one ledger and lease")
+    parser.add_argument("--crash-leader-at", help="kill the lease holder at this time (YYYY-MM-DD HH:MM) without cleanup")
+    parser.add_argument("--no-preflight", action="store_true",
+                        help="do not schedule pre-flight checks (halves the jobs in long runs)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    workdir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="punch-sim-") as root:
+        os.chdir(root)
+        try:
+            summary = simulate(date.fromisoformat(args.start), args.days, args.accounts, args.failure_rate,
+                               args.wake_latency_ms, args.reload_every_days, args.seed, args.quiet or args.json,
+                               datetime.fromisoformat(args.outage_at) if args.outage_at else None, args.outage_minutes,
+                               args.replicas, datetime.fromisoformat(args.crash_leader_at) if args.crash_leader_at else None,
+                               not args.no_preflight)
+        finally:
+            os.chdir(workdir)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print("  ".join(f"{key}={value}" for key, value in summary.items()))
+    return 1 if summary["missed"] or summary["duplicates"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
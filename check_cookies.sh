@@ -18,30 +18,9 @@ if [ -f "$ALERT_FILE" ]; then
     exit 1
 fi
 
-# Test cookies by running a test punch
-echo "Testing current cookies..."
-python -c "
-from manual_punch import punch_attendance
-import sys
-
-try:
-    result = punch_attendance(attendance_type=1)
-    if result.get('success', False):
-        print('✅ Cookies are working fine!')
-        sys.exit(0)
-    else:
-        error = result.get('error', 'Unknown error')
-        if 'Cookie expired' in error or 'refresh failed' in error:
-            print('❌ Cookies are expired!')
-            print('💡 Run: python manual_punch.py update')
-            sys.exit(2)
-        else:
-            print(f'⚠️  Test failed but may not be cookie issue: {error}')
-            sys.exit(1)
-except Exception as e:
-    print(f'❌ Test failed with exception: {e}')
-    sys.exit(1)
-"
+# Check every account's JWT expiry offline - a test punch would record a real check-in
+echo "Checking cookie expiry..."
+python manual_punch.py report "$@"
 
 EXIT_CODE=$?
 case $EXIT_CODE in
@@ -49,12 +28,22 @@ case $EXIT_CODE in
         echo "✅ All systems operational!"
         ;;
     1)
-        echo "⚠️  Test failed - check system status"
+        echo "⚠️  A token expires soon - renew it before the next punch"
+        echo "Run: python manual_punch.py update"
         ;;
     2)
         echo "🍪 Cookie update required!"
         echo "Run: python manual_punch.py update"
         ;;
+    3)
+        echo "❌ Invalid arguments - nothing was checked"
+        ;;
+    4)
+        echo "❌ Cannot read the accounts file - fix it and run the check again"
+        ;;
+    *)
+        echo "❌ Cookie report failed (exit code $EXIT_CODE)"
+        ;;
 esac
 
 exit $EXIT_CODE 
\ No newline at end of file
@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+
+class CookieStoreError(Exception):
+    """A cookie file exists but cannot be used (corrupt or not a JSON object)"""
+
+
+# Serialises writers inside one process; the file lock covers other processes
+_process_locks: Dict[str, threading.Lock] = {}
+_process_locks_guard = threading.Lock()
+
+
+def _process_lock(path: str) -> threading.Lock:
+    with _process_locks_guard:
+        lock = _process_locks.get(path)
+        if lock is None:
+            lock = _process_locks[path] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def locked(cookie_file: str):
+    """Hold the account's exclusive lock (a sidecar .lock file) for a read-modify-write"""
+    path = os.path.abspath(cookie_file)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with _process_lock(path):
+        with open(path + ".lock", "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            elif msvcrt is not None:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                elif msvcrt is not None:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def read_cookies(cookie_file: str) -> Optional[Dict[str, str]]:
+    """Read one account's cookie file; None if it does not exist.
+
+    Writers always rename a complete file into place, so readers never
+    need the lock and never see a half-written file.
+    """
+    try:
+        with open(cookie_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (ValueError, UnicodeDecodeError) as e:
+        raise CookieStoreError(f"Cookie file {cookie_file} is corrupt: {e}")
+    if not isinstance(data, dict):
+        raise CookieStoreError(f"Cookie file {cookie_file} does not contain a JSON object")
+    return data
+
+
+def _write_atomic(cookie_file: str, cookies: Dict[str, str]) -> None:
+    directory = os.path.dirname(os.path.abspath(cookie_file))
+    fd, temp_path = tempfile.mkstemp(prefix=".cookies-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(cookies, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(cookie_file):
+            os.chmod(temp_path, os.stat(cookie_file).st_mode & 0o777)
+        os.replace(temp_path, cookie_file)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_cookies(cookie_file: str, cookies: Dict[str, str]) -> None:
+    """Replace one account's cookies with write-to-temp and rename"""
+    with locked(cookie_file):
+        _write_atomic(cookie_file, cookies)
+
+
+def update_cookies(cookie_file: str, changes: Dict[str, str], remove: Iterable[str] = ()) -> Dict[str, str]:
+    """Merge `changes` into one account's cookies under its lock and return the result.
+
+    A corrupt file raises CookieStoreError instead of being overwritten.
+    """
+    with locked(cookie_file):
+        cookies = read_cookies(cookie_file) or {}
+        updated = dict(cookies)
+        updated.update(changes)
+        for name in remove:
+            updated.pop(name, None)
+        if updated != cookies:
+            _write_atomic(cookie_file, updated)
+        return updated
@@ -0,0 +1,126 @@
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 10
+
+_session = None
+_pool_size = None
+_session_lock = threading.Lock()
+
+
+class _RejectAllCookiesPolicy(DefaultCookiePolicy):
+    """Keep the shared session stateless - cookies are always passed per request"""
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+def _build_session(pool_size: int) -> requests.Session:
+    """Build a keep-alive session with a bounded connection pool"""
+    session = requests.Session()
+    # Accounts share this session, so server-set cookies must never leak between them
+    session.cookies.set_policy(_RejectAllCookiesPolicy())
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def configure_http_session(pool_size: Optional[int] = None) -> requests.Session:
+    """(Re)create the shared session if the requested pool size differs"""
+    global _session, _pool_size
+    pool_size = max(1, int(pool_size or DEFAULT_POOL_SIZE))
+    with _session_lock:
+        if _session is None or _pool_size != pool_size:
+            old_session = _session
+            _session = _build_session(pool_size)
+            _pool_size = pool_size
+            if old_session is not None:
+                old_session.close()
+        return _session
+
+
+def get_http_session() -> requests.Session:
+    """Get the shared long-lived HTTP session, creating it on first use"""
+    session = _session
+    if session is not None:
+        return session
+    return configure_http_session(_pool_size)
+
+
+_connections_traced = False
+
+
+def trace_connections() -> None:
+    """Wrap urllib3's connection setup in dns / tcp_connect / connect spans (used by --profile and service tracing).
+
+    The TLS handshake shows up as the self time of `connect`. Only installed
+    on demand, so untraced runs keep urllib3's code path untouched.
+    """
+    global _connections_traced
+    import socket
+    import urllib3.connection
+    import urllib3.util.connection
+    from tracing import span
+
+    with _session_lock:
+        if _connections_traced:
+            return
+        _connections_traced = True
+        create_connection = urllib3.util.connection.create_connection
+        connect = urllib3.connection.HTTPConnection.connect
+
+        def traced_create_connection(address, *args, **kwargs):
+            host, port = address
+            with span("dns", host=host):
+                # Time the lookup on its own, but still hand create_connection the host name so it
+                # can fall back to the other addresses; its repeat lookup (cheap when the resolver
+                # caches) lands in tcp_connect
+                try:
+                    socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+                except OSError:
+                    pass  # let create_connection raise its usual error
+            with span("tcp_connect"):
+                return create_connection(address, *args, **kwargs)
+
+        def traced_connect(self, *args, **kwargs):
+            with span("connect", host=self.host):
+                return connect(self, *args, **kwargs)
+
+        urllib3.util.connection.create_connection = traced_create_connection
+        urllib3.connection.HTTPConnection.connect = traced_connect
+        if urllib3.connection.HTTPSConnection.connect is not connect:
+            https_connect = urllib3.connection.HTTPSConnection.connect
+
+            def traced_https_connect(self, *args, **kwargs):
+                with span("connect", host=self.host, tls=True):
+                    return https_connect(self, *args, **kwargs)
+            urllib3.connection.HTTPSConnection.connect = traced_https_connect
+
+
+def get_connection_stats() -> Dict[str, int]:
+    """Get request and connection counts across all pooled hosts"""
+    stats = {"pool_size": _pool_size or DEFAULT_POOL_SIZE, "requests": 0, "connections": 0, "reused": 0}
+    session = _session
+    if session is None:
+        return stats
+
+    seen = set()
+    for adapter in session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats["requests"] += pool.num_requests
+            stats["connections"] += pool.num_connections
+
+    stats["reused"] = max(0, stats["requests"] - stats["connections"])
+    return stats
@@ -0,0 +1,102 @@
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+DEFAULT_LOG_SETTINGS = {
+    "level": "INFO",
+    "file": "logs/attendance_service.log",
+    "max_bytes": 10 * 1024 * 1024,
+    "rotate_when": None,
+    "backup_count": 7,
+    "compress": True,
+    "json_file": None,
+    "console": True
+}
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line for log shippers"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    # Runs on the listener thread, never on the thread that logged
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def _rotating_handler(path: str, settings: Dict[str, Any]) -> logging.Handler:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if settings["rotate_when"]:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=settings["rotate_when"], backupCount=settings["backup_count"], encoding='utf-8')
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=settings["max_bytes"], backupCount=settings["backup_count"], encoding='utf-8')
+    if settings["compress"]:
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+    return handler
+
+
+def setup_log_pipeline(log_settings: Optional[Dict[str, Any]] = None) -> logging.handlers.QueueListener:
+    """Route all logging through a queue so callers never block on disk or stdout I/O.
+
+    Returns the started QueueListener; call stop() on shutdown to flush.
+    """
+    settings = dict(DEFAULT_LOG_SETTINGS, **(log_settings or {}))
+
+    handlers = []
+    text_handler = _rotating_handler(settings["file"], settings)
+    text_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handlers.append(text_handler)
+
+    if settings["json_file"]:
+        json_handler = _rotating_handler(settings["json_file"], settings)
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
+
+    if settings["console"]:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers.append(console_handler)
+
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(getattr(logging, str(settings["level"]).upper(), logging.INFO))
+
+    listener.start()
+    return listener
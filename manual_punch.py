@@ -1,26 +1,100 @@
-import requests
 import json
 import os
+import sys
 import base64
 import time
-from datetime import datetime
-from typing import Dict, Any, Optional
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Callable, Dict, Any, List, Optional, Tuple
+from cookie_store import CookieStoreError, read_cookies, update_cookies, write_cookies
+from tracing import span
+
+# Network, SQLite and metrics modules are imported inside the functions that use them,
+# so read-only commands such as `analyze` start without loading requests
+if TYPE_CHECKING:
+    from punch_ledger import PunchLedger
+    from punch_plan import PunchPlanStore
+    from tracing import ProfileReport
+
+DEFAULT_BASE_URL = "https://apollo.mayohr.com"
+PUNCH_TYPE_NAMES = {1: "checkin", 2: "checkout"}
+# Exit code for bad command-line arguments, shared by every subcommand
+USAGE_EXIT_CODE = 3
+PUNCH_PATH = "/backend/pt/api/checkIn/punch/web"
+PLACEHOLDER_SESSION_COOKIE = "YOUR_MODULE_SESSION_COOKIE_HERE"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36 Edg/139.0.0.0"
+
+DEFAULT_PREFLIGHT_SETTINGS = {
+    "enabled": True,
+    # Well inside the usual keep-alive idle timeout, so the warmed connection is still open at punch time
+    "lead_seconds": 30,
+    "timeout_seconds": 10,
+    "workers": 2,
+    # The web punch page: loading it is what a browser does before punching, and it changes nothing
+    "validate_path": "/ta?id=webpunch"
+}
+
+def get_base_url(config: Dict[str, Any]) -> str:
+    """HR backend base URL - point it at a local mock for load testing"""
+    return config.get("service_settings", {}).get("base_url", DEFAULT_BASE_URL).rstrip('/')
+
+# Parsed JSON files keyed by the path as given, revalidated on (mtime, size, inode, device)
+_file_cache: Dict[str, Tuple[Tuple[int, int, int, int], Any]] = {}
+_file_cache_lock = threading.Lock()
+
+def load_json_cached(path: str, loader: Optional[Callable[[str], Any]] = None) -> Any:
+    """Load a JSON file, reusing the parsed object until the file changes on disk.
+    
+    Every caller gets the same object, so treat the result as read-only.
+    The inode in the signature tells apart two files reached through the
+    same relative path from different working directories, so the hot
+    path is a single stat() with no abspath().
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino, stat.st_dev)
+    
+    cached = _file_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    
+    with _file_cache_lock:
+        cached = _file_cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        if loader is not None:
+            data = loader(path)
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        _file_cache[path] = (signature, data)
+        return data
+
+def invalidate_file_cache(path: Optional[str] = None) -> None:
+    """Drop one cached file (or all of them) so the next load re-reads disk"""
+    with _file_cache_lock:
+        if path is None:
+            _file_cache.clear()
+            return
+        target = os.path.abspath(path)
+        for cached_path in [cached_path for cached_path in _file_cache if os.path.abspath(cached_path) == target]:
+            del _file_cache[cached_path]
 
 def load_config(config_file: str = "config.json") -> Dict[str, Any]:
-    """Load configuration from JSON file"""
+    """Load configuration from JSON file (cached, treat as read-only)"""
     try:
-        with open(config_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return load_json_cached(config_file)
     except (json.JSONDecodeError, FileNotFoundError) as e:
-        print(f"Warning: Cannot load config file {config_file}: {e}")
-        print("Using default configuration...")
+        # stderr, so commands printing JSON (report --json) stay parseable
+        print(f"Warning: Cannot load config file {config_file}: {e}", file=sys.stderr)
+        print("Using default configuration...", file=sys.stderr)
         return get_default_config()
 
 def get_default_config() -> Dict[str, Any]:
     """Get default configuration"""
     return {
         "authentication": {
-            "module_session_cookie": "YOUR_MODULE_SESSION_COOKIE_HERE"
+            "module_session_cookie": PLACEHOLDER_SESSION_COOKIE
         },
         "work_schedule": {
             "punch_in": {"hour": 9, "minute_range": {"min": 10, "max": 20}},
@@ -28,35 +102,83 @@ def get_default_config() -> Dict[str, Any]:
             "work_duration_hours": 9
         },
         "service_settings": {
+            "base_url": "https://apollo.mayohr.com",
             "max_retries": 2,
             "timeout_seconds": 30,
-            "check_interval_seconds": 30,
+            "max_sleep_seconds": 3600,
+            "batch_concurrency": 8,
+            "pool_size": 10,
+            "accounts_file": "accounts.json",
+            "ledger_file": "data/punch_ledger.db",
+            "logging": {
+                "level": "INFO",
+                "file": "logs/attendance_service.log",
+                "max_bytes": 10485760,
+                "rotate_when": None,
+                "backup_count": 7,
+                "compress": True,
+                "json_file": None,
+                "console": True
+            },
+            "metrics": {"port": None, "host": "127.0.0.1", "textfile": None, "textfile_interval_seconds": 15},
+            "tracing": {"enabled": False, "file": "logs/punch_traces.jsonl"},
+            "control_socket": "attendance_service.sock",
+            "max_in_flight_punches": 4,
+            "punch_job_deadline_seconds": 300,
+            "shutdown_grace_seconds": 10,
+            "catch_up_grace_seconds": 1800,
+            "coordination": {"enabled": False, "lease_seconds": 15, "renew_seconds": 5, "replica_id": None},
+            "rate_limits": {
+                "punch": {"rate_per_second": 10, "burst": 20},
+                "refresh": {"rate_per_second": 2, "burst": 5},
+                "preflight": {"rate_per_second": 5, "burst": 10}
+            },
+            "retry": {
+                "backoff_base_seconds": 1,
+                "backoff_max_seconds": 30,
+                "jitter": True,
+                "punch_deadline_seconds": 120,
+                "budget_ratio": 0.2,
+                "budget_capacity": 10
+            },
+            "circuit_breaker": {"failure_threshold": 5, "reset_timeout_seconds": 60},
+            "preflight": {"enabled": True, "lead_seconds": 30, "timeout_seconds": 10, "workers": 2,
+                          "validate_path": "/ta?id=webpunch"},
+            "plan": {"days_ahead": 28, "seed": None, "jitter_seconds": 59},
+            "calendar": {"holiday_files": [], "leave_file": None},
             "workdays": ["monday", "tuesday", "wednesday", "thursday", "friday"]
         }
     }
 
-def load_cookies_from_file(cookie_file: str = "cookies.json") -> Dict[str, str]:
-    """Load cookies from JSON file"""
-    if os.path.exists(cookie_file):
-        try:
-            with open(cookie_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            pass
-    return get_default_cookies()
+def load_cookies_from_file(cookie_file: str = "cookies.json", config_file: str = "config.json") -> Dict[str, str]:
+    """Load one account's cookies (cached, treat as read-only).
+    
+    Only a missing file falls back to the config defaults; a corrupt one
+    raises CookieStoreError instead of silently sending stale cookies.
+    """
+    try:
+        return load_json_cached(cookie_file, read_cookies)
+    except FileNotFoundError:
+        return get_default_cookies(config_file)
 
 def save_cookies_to_file(cookies: Dict[str, str], cookie_file: str = "cookies.json") -> None:
-    """Save cookies to JSON file"""
+    """Atomically replace the cookie file"""
     try:
-        with open(cookie_file, 'w', encoding='utf-8') as f:
-            json.dump(cookies, f, indent=2, ensure_ascii=False)
+        write_cookies(cookie_file, cookies)
+        invalidate_file_cache(cookie_file)
     except Exception as e:
         print(f"Warning: Cannot save cookies to file: {e}")
 
-def get_default_cookies() -> Dict[str, str]:
+def update_cookie_file(changes: Dict[str, str], cookie_file: str = "cookies.json") -> Dict[str, str]:
+    """Merge changed cookies into the cookie file under its lock"""
+    cookies = update_cookies(cookie_file, changes)
+    invalidate_file_cache(cookie_file)
+    return cookies
+
+def get_default_cookies(config_file: str = "config.json") -> Dict[str, str]:
     """Get default cookies using config file"""
-    config = load_config()
-    session_cookie = config.get("authentication", {}).get("module_session_cookie", "YOUR_MODULE_SESSION_COOKIE_HERE")
+    config = load_config(config_file)
+    session_cookie = config.get("authentication", {}).get("module_session_cookie", PLACEHOLDER_SESSION_COOKIE)
     
     return {
         "visid_incap_3031870": "ikOVvzafQ6SmzJKU6lvbzRP5m2gAAAAAQUIPAAAAAABW/+3GQKNwri2eiKsie5nP",
@@ -96,108 +218,279 @@ def decode_jwt_payload(jwt_token: str) -> Optional[Dict[str, Any]]:
     except:
         return None
 
-def is_jwt_expired(jwt_token: str) -> bool:
-    """Check if JWT token is expired"""
-    payload = decode_jwt_payload(jwt_token)
-    if not payload:
-        return True
+class TokenState:
+    """JWT decoded once, with its exp/iat claims cached for cheap expiry checks"""
     
-    exp_time = payload.get('exp')
-    if not exp_time:
-        return True
+    __slots__ = ('token', 'payload', 'exp', 'iat')
+    
+    def __init__(self, token: str, payload: Optional[Dict[str, Any]]):
+        self.token = token
+        self.payload = payload
+        self.exp = payload.get('exp') if payload else None
+        self.iat = payload.get('iat') if payload else None
+    
+    @property
+    def decoded(self) -> bool:
+        return self.payload is not None
+    
+    @property
+    def remaining_seconds(self) -> Optional[int]:
+        """Seconds until expiry (negative once expired), None without an exp claim"""
+        if not self.exp:
+            return None
+        return self.exp - int(time.time())
+    
+    @property
+    def expired(self) -> bool:
+        """Undecodable tokens and tokens without exp count as expired"""
+        remaining = self.remaining_seconds
+        return remaining is None or remaining <= 0
     
-    current_time = int(time.time())
-    return current_time >= exp_time
+    @property
+    def expires_at(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self.exp) if self.exp else None
+    
+    @property
+    def issued_at(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self.iat) if self.iat else None
+
+# Token states keyed by raw token value, least recently used evicted first
+_token_states: "OrderedDict[str, TokenState]" = OrderedDict()
+_token_states_lock = threading.Lock()
+TOKEN_STATE_CACHE_SIZE = 4096
+
+def get_token_state(jwt_token: str) -> TokenState:
+    """Get the cached TokenState for a JWT, decoding it only the first time"""
+    with _token_states_lock:
+        state = _token_states.get(jwt_token)
+        if state is not None:
+            _token_states.move_to_end(jwt_token)
+            return state
+    
+    state = TokenState(jwt_token, decode_jwt_payload(jwt_token))
+    with _token_states_lock:
+        _token_states[jwt_token] = state
+        if len(_token_states) > TOKEN_STATE_CACHE_SIZE:
+            _token_states.popitem(last=False)
+    return state
+
+def is_jwt_expired(jwt_token: str) -> bool:
+    """Check if JWT token is expired"""
+    return get_token_state(jwt_token).expired
 
 def is_cookie_expired(response, cookies: Dict[str, str]) -> bool:
     """Enhanced cookie expiration check including JWT validation"""
+    from response_classifier import classify_response
     
     # First check JWT expiration
     session_cookie = cookies.get('__ModuleSessionCookie')
-    if session_cookie and is_jwt_expired(session_cookie):
+    if session_cookie and get_token_state(session_cookie).expired:
         print("JWT token is expired based on 'exp' claim")
         return True
     
-    # Check HTTP response indicators
-    if response.status_code == 401:
-        return True
-    
-    try:
-        if response.headers.get('content-type', '').startswith('application/json'):
-            data = response.json()
-            error_indicators = [
-                'unauthorized', 'expired', 'invalid token', 
-                'authentication', 'login required', 'session',
-                'access denied', 'forbidden'
-            ]
-            response_text = str(data).lower()
-            return any(indicator in response_text for indicator in error_indicators)
-    except:
-        pass
-    
-    # Check if redirected to login page
-    if response.status_code in [302, 303, 307, 308]:
-        location = response.headers.get('location', '')
-        if 'login' in location.lower() or 'auth' in location.lower():
-            return True
-    
-    return False
+    return classify_response(response).auth_failed
 
-def refresh_session_cookies() -> Optional[Dict[str, str]]:
+def refresh_session_cookies(cookie_file: str = "cookies.json", config_file: str = "config.json") -> Optional[Dict[str, str]]:
     """Attempt to refresh session cookies - limited effectiveness with JWT"""
+    from http_session import get_http_session
+    from metrics import COOKIE_REFRESHES
+    from rate_limiter import throttle
+    
     try:
         headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36 Edg/139.0.0.0"
+            "User-Agent": USER_AGENT
         }
         
         # Visit main page to get session cookies (won't refresh JWT)
-        session = requests.Session()
-        response = session.get("https://apollo.mayohr.com/", headers=headers, timeout=30)
+        config = load_config(config_file)
+        base_url = get_base_url(config)
+        if not throttle(config.get("service_settings", {}), "refresh", max_wait=30):
+            print("Cookie refresh skipped: rate limit wait too long")
+            COOKIE_REFRESHES.inc(result="rate_limited")
+            return None
+        response = get_http_session().get(f"{base_url}/", headers=headers, timeout=30)
         
         if response.status_code == 200:
+            # Shared session keeps no cookie state, so collect them from the responses
             cookies = {}
-            for cookie in session.cookies:
-                cookies[cookie.name] = cookie.value
+            for hop in response.history + [response]:
+                for cookie in hop.cookies:
+                    cookies[cookie.name] = cookie.value
             
+            # Never overwrite the JWT token with a value from an anonymous page visit
+            cookies.pop('__ModuleSessionCookie', None)
             if cookies:
-                # Only save non-JWT cookies, preserve existing JWT
-                current_cookies = load_cookies_from_file()
-                
-                # Don't overwrite JWT token with potentially empty value
-                jwt_cookie = current_cookies.get('__ModuleSessionCookie')
-                cookies.update(current_cookies)  # Merge with existing
-                
-                if jwt_cookie:
-                    cookies['__ModuleSessionCookie'] = jwt_cookie
-                
-                save_cookies_to_file(cookies)
+                if not os.path.exists(cookie_file):
+                    # First refresh seeds the file with the config's JWT
+                    cookies = dict(get_default_cookies(config_file), **cookies)
+                cookies = update_cookie_file(cookies, cookie_file)
+                COOKIE_REFRESHES.inc(result="success")
                 return cookies
     except Exception as e:
         print(f"Failed to refresh cookies: {e}")
     
+    COOKIE_REFRESHES.inc(result="failure")
     return None
 
-def punch_attendance(attendance_type: int = 1, is_override: bool = False, max_retries: int = None) -> Dict[str, Any]:
+def preflight_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """service_settings.preflight merged over the defaults"""
+    return dict(DEFAULT_PREFLIGHT_SETTINGS, **config.get("service_settings", {}).get("preflight", {}))
+
+def preflight_account(config_file: str = "config.json", cookie_file: str = "cookies.json",
+                      punch_at: Optional[datetime] = None) -> Dict[str, Any]:
+    """Warm up and validate an account ahead of a punch without punching.
+    
+    Resolves DNS, opens a pooled connection with one GET of the punch page,
+    checks the JWT (and that it outlives `punch_at`) and the session cookies,
+    and stores any Incapsula cookies the page hands out. The status is ok,
+    auth_expired, server_error, unreachable or inconclusive.
+    """
+    import socket
+    from urllib.parse import urlsplit
+    import requests
+    from http_session import get_http_session
+    from metrics import PREFLIGHTS
+    from rate_limiter import throttle
+    from response_classifier import SERVER_ERROR, classify_response
+    
+    config = load_config(config_file)
+    settings = preflight_settings(config)
+    base_url = get_base_url(config)
+    result = {"status": "inconclusive", "ok": False}
+    
+    def finish(status: str, error: Optional[str] = None) -> Dict[str, Any]:
+        result["status"] = status
+        result["ok"] = status == "ok"
+        if error:
+            result["error"] = error
+        PREFLIGHTS.inc(status=status)
+        return result
+    
+    try:
+        cookies = load_cookies_from_file(cookie_file, config_file)
+    except CookieStoreError as e:
+        return finish("auth_expired", str(e))
+    
+    jwt_token = cookies.get('__ModuleSessionCookie')
+    token_state = get_token_state(jwt_token) if jwt_token else None
+    if token_state is None or token_state.expired:
+        return finish("auth_expired", "JWT token missing or expired - run 'python manual_punch.py update'")
+    result["jwt_expires_at"] = token_state.expires_at
+    if punch_at is not None and token_state.expires_at <= punch_at:
+        return finish("auth_expired", f"JWT token expires at {token_state.expires_at}, "
+                                      f"before the punch at {punch_at.isoformat(sep=' ', timespec='seconds')}")
+    
+    url = urlsplit(base_url)
+    started = time.perf_counter()
+    try:
+        socket.getaddrinfo(url.hostname, url.port or (443 if url.scheme == "https" else 80), proto=socket.IPPROTO_TCP)
+    except socket.gaierror as e:
+        return finish("unreachable", f"DNS lookup for {url.hostname} failed: {e}")
+    result["dns_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    
+    if not throttle(config.get("service_settings", {}), "preflight", max_wait=settings["timeout_seconds"]):
+        return finish("inconclusive", "Rate limited - pre-flight skipped")
+    started = time.perf_counter()
+    try:
+        response = get_http_session().get(
+            f"{base_url}{settings['validate_path']}",
+            headers={"User-Agent": USER_AGENT, "referer": f"{base_url}/"},
+            cookies=cookies,
+            timeout=settings["timeout_seconds"],
+            allow_redirects=False
+        )
+    except requests.exceptions.RequestException as e:
+        return finish("unreachable", f"Pre-flight request failed: {e}")
+    result["request_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    result["status_code"] = response.status_code
+    
+    outcome = classify_response(response)
+    if outcome.auth_failed:
+        return finish("auth_expired", f"Session rejected ({outcome.reason or outcome.kind})")
+    if outcome.kind == SERVER_ERROR:
+        return finish("server_error", outcome.reason)
+    
+    # Keep the Incapsula/session cookies current so the punch itself needs no refresh round trip
+    changes = {cookie.name: cookie.value for cookie in response.cookies
+               if cookie.name != '__ModuleSessionCookie' and cookies.get(cookie.name) != cookie.value}
+    result["refreshed_cookies"] = sorted(changes)
+    if changes:
+        if not os.path.exists(cookie_file):
+            changes = dict(get_default_cookies(config_file), **changes)
+        try:
+            update_cookie_file(changes, cookie_file)
+        except CookieStoreError as e:
+            return finish("inconclusive", str(e))
+    
+    if not outcome.success:
+        return finish("inconclusive", outcome.reason or f"HTTP {response.status_code}")
+    return finish("ok")
+
+def punch_outcome(result: Dict[str, Any]) -> str:
+    """Short outcome label for a punch_attendance result"""
+    if result.get("success"):
+        return "success"
+    if result.get("jwt_expired"):
+        return "jwt_expired"
+    error = result.get("error", "")
+    if "Circuit breaker open" in error:
+        return "circuit_open"
+    if "Cookie expired" in error:
+        return "cookie_expired"
+    return "failure"
+
+def record_punch_metrics(attendance_type: int, result: Dict[str, Any]) -> None:
+    """Count a finished punch in the metrics registry"""
+    from metrics import PUNCHES, PUNCH_LATENCY, PUNCH_RETRIES
+    punch_type = PUNCH_TYPE_NAMES.get(attendance_type, str(attendance_type))
+    PUNCHES.inc(type=punch_type, outcome=punch_outcome(result))
+    if result.get("attempts", 0) > 1:
+        PUNCH_RETRIES.inc(result["attempts"] - 1)
+    if "elapsed_seconds" in result:
+        PUNCH_LATENCY.observe(result["elapsed_seconds"], type=punch_type)
+
+def punch_attendance(attendance_type: int = 1, is_override: bool = False, max_retries: int = None,
+                     config_file: str = "config.json", cookie_file: str = "cookies.json") -> Dict[str, Any]:
     """Punch attendance with enhanced JWT-aware cookie handling"""
+    with span("punch_attendance", type=attendance_type) as punch_span:
+        result = _punch_attendance(attendance_type, is_override, max_retries, config_file, cookie_file)
+        punch_span.set(success=result.get("success"), attempts=result.get("attempts", 0))
+    return result
+
+
+def _punch_attendance(attendance_type: int, is_override: bool, max_retries: Optional[int],
+                      config_file: str, cookie_file: str) -> Dict[str, Any]:
+    # Only the first punch in a process pays for these; the span makes that cold start visible
+    with span("imports"):
+        import requests
+        from http_session import get_http_session
+        from rate_limiter import throttle
+        from retry_policy import RetryPolicy, get_circuit_breaker, get_retry_budget
+        from response_classifier import SERVER_ERROR, classify_response
+    
+    started = time.perf_counter()
+    
     # Load configuration
-    config = load_config()
+    with span("load_config"):
+        config = load_config(config_file)
     
     # Get settings from config
     if max_retries is None:
         max_retries = config.get("service_settings", {}).get("max_retries", 2)
     timeout = config.get("service_settings", {}).get("timeout_seconds", 30)
     
-    url = "https://apollo.mayohr.com/backend/pt/api/checkIn/punch/web"
+    base_url = get_base_url(config)
+    url = f"{base_url}{PUNCH_PATH}"
     
     headers = {
         "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36 Edg/139.0.0.0",
+        "User-Agent": USER_AGENT,
         "accept": "*/*",
         "accept-language": "zh-tw",
         "actioncode": "Default",
         "functioncode": "PunchCard",
-        "origin": "https://apollo.mayohr.com",
-        "referer": "https://apollo.mayohr.com/ta?id=webpunch",
+        "origin": base_url,
+        "referer": f"{base_url}/ta?id=webpunch",
         "sec-fetch-dest": "empty",
         "sec-fetch-mode": "cors",
         "sec-fetch-site": "same-origin"
@@ -208,102 +501,223 @@ def punch_attendance(attendance_type: int = 1, is_override: bool = False, max_re
         "IsOverride": is_override
     }
     
-    cookies = load_cookies_from_file()
+    try:
+        with span("load_cookies"):
+            cookies = load_cookies_from_file(cookie_file, config_file)
+    except CookieStoreError as e:
+        result = {
+            "success": False,
+            "error": f"{e} - run 'python manual_punch.py update' to rewrite it",
+            "attempts": 0,
+            "elapsed_seconds": time.perf_counter() - started
+        }
+        record_punch_metrics(attendance_type, result)
+        return result
     
     # Pre-check JWT expiration
     jwt_token = cookies.get('__ModuleSessionCookie')
-    if jwt_token and is_jwt_expired(jwt_token):
-        payload_data = decode_jwt_payload(jwt_token)
-        if payload_data and 'exp' in payload_data:
-            exp_time = datetime.fromtimestamp(payload_data['exp'])
-            return {
+    with span("jwt_decode"):
+        token_state = get_token_state(jwt_token) if jwt_token else None
+    if token_state and token_state.expired:
+        if token_state.exp:
+            exp_time = token_state.expires_at
+            result = {
                 "success": False,
                 "error": f"JWT token expired at {exp_time}. Manual login required for new token.",
                 "jwt_expired": True
             }
+            record_punch_metrics(attendance_type, result)
+            return result
+    
+    service_settings = config.get("service_settings", {})
+    with span("prepare"):
+        policy = RetryPolicy.from_settings(service_settings, max_retries)
+        budget = get_retry_budget(service_settings)
+        breaker = get_circuit_breaker(service_settings)
+        deadline = policy.start_deadline()
+        session = get_http_session()
+        budget.record_request()
     
-    for attempt in range(max_retries + 1):
+    result = {
+        "success": False,
+        "error": "All retry attempts failed"
+    }
+    requests_sent = 0
+    
+    for attempt in range(policy.max_retries + 1):
+        if attempt > 0:
+            with span("backoff", attempt=attempt + 1):
+                stop_reason = policy.wait_before_retry(attempt, budget, deadline)
+            if stop_reason:
+                print(f"Not retrying: {stop_reason}")
+                result["error"] = f"{result['error']} ({stop_reason})"
+                break
+        
+        # Spread bursts over time; checked before the breaker so a half-open probe never waits
+        with span("rate_limit"):
+            allowed = throttle(service_settings, "punch", None if deadline is None else deadline - time.monotonic())
+        if not allowed:
+            result = {
+                "success": False,
+                "error": "Rate limit wait exceeds the punch deadline - request skipped"
+            }
+            break
+        
+        # Fail fast while the HR backend is known to be down
+        if not breaker.allow_request():
+            result = {
+                "success": False,
+                "error": "Circuit breaker open - HR backend is failing, request skipped"
+            }
+            break
+        
+        request_timeout = timeout
+        if deadline is not None:
+            request_timeout = max(0.1, min(timeout, deadline - time.monotonic()))
+        
         try:
-            response = requests.post(
-                url=url,
-                headers=headers,
-                cookies=cookies,
-                json=payload,
-                timeout=timeout
-            )
-            
-            # Check if cookies are expired (JWT-aware)
-            if is_cookie_expired(response, cookies):
-                if attempt < max_retries:
-                    print(f"Cookie expired, attempting to refresh... (attempt {attempt + 1}/{max_retries})")
-                    fresh_cookies = refresh_session_cookies()
-                    if fresh_cookies:
-                        cookies = fresh_cookies
-                        continue
-                    else:
-                        # Fall back to default cookies
-                        cookies = get_default_cookies()
-                        continue
-                else:
-                    error_msg = "Cookie expired and refresh failed. JWT token likely needs manual renewal."
-                    if jwt_token and is_jwt_expired(jwt_token):
-                        error_msg += " JWT token is expired - please login again to get new token."
-                    
-                    return {
-                        "success": False,
-                        "error": error_msg,
-                        "status_code": response.status_code,
-                        "jwt_expired": jwt_token and is_jwt_expired(jwt_token)
-                    }
-            
-            # Check HTTP status code
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    return {
-                        "success": True,
-                        "status_code": response.status_code,
-                        "data": data
-                    }
-                except json.JSONDecodeError:
-                    return {
-                        "success": True,
-                        "status_code": response.status_code,
-                        "data": response.text
-                    }
-            else:
-                return {
-                    "success": False,
-                    "status_code": response.status_code,
-                    "error": f"HTTP {response.status_code}: {response.text}"
-                }
-                
+            requests_sent += 1
+            with span("http", attempt=attempt + 1) as http_span:
+                response = session.post(
+                    url=url,
+                    headers=headers,
+                    cookies=cookies,
+                    json=payload,
+                    timeout=request_timeout,
+                    # A login redirect is itself the answer; following it costs a round trip
+                    allow_redirects=False
+                )
+                # elapsed runs from sending the request to parsing the response headers
+                http_span.set(status=response.status_code,
+                              server_ms=round(response.elapsed.total_seconds() * 1000, 1))
         except requests.exceptions.Timeout:
-            if attempt < max_retries:
-                continue
-            return {
+            breaker.record_failure()
+            result = {
                 "success": False,
                 "error": "Request timeout"
             }
+            continue
         except requests.exceptions.ConnectionError:
-            if attempt < max_retries:
-                continue
-            return {
+            breaker.record_failure()
+            result = {
                 "success": False,
                 "error": "Connection error"
             }
+            continue
         except requests.exceptions.RequestException as e:
-            if attempt < max_retries:
-                continue
-            return {
+            breaker.record_failure()
+            result = {
                 "success": False,
                 "error": f"Request failed: {str(e)}"
             }
+            continue
+        
+        with span("classify") as classify_span:
+            outcome = classify_response(response)
+            classify_span.set(outcome=outcome.kind)
+        if outcome.kind == SERVER_ERROR:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        
+        # Check if cookies are expired (JWT-aware)
+        jwt_expired = bool(token_state and token_state.expired)
+        if outcome.auth_failed or jwt_expired:
+            error_msg = "Cookie expired and refresh failed. JWT token likely needs manual renewal."
+            if jwt_expired:
+                error_msg += " JWT token is expired - please login again to get new token."
+            
+            result = {
+                "success": False,
+                "error": error_msg,
+                "status_code": response.status_code,
+                "outcome": outcome.kind,
+                "jwt_expired": jwt_expired
+            }
+            
+            if attempt < policy.max_retries:
+                print(f"Cookie expired ({outcome.reason or outcome.kind}), attempting to refresh... "
+                      f"(attempt {attempt + 1}/{policy.max_retries})")
+                # Keep the current cookies if the refresh fails - the defaults are older still
+                with span("refresh_cookies"):
+                    cookies = refresh_session_cookies(cookie_file, config_file) or cookies
+            continue
+        
+        if outcome.success:
+            result = {
+                "success": True,
+                "status_code": response.status_code,
+                "outcome": outcome.kind,
+                "data": outcome.data
+            }
+        else:
+            result = {
+                "success": False,
+                "status_code": response.status_code,
+                "outcome": outcome.kind,
+                "error": outcome.reason
+            }
+        break
     
-    return {
-        "success": False,
-        "error": "All retry attempts failed"
-    }
+    result["attempts"] = requests_sent
+    result["circuit_state"] = breaker.state
+    result["elapsed_seconds"] = time.perf_counter() - started
+    record_punch_metrics(attendance_type, result)
+    return result
+
+
+DEFAULT_ACCOUNT = {"name": "default", "config_file": "config.json", "cookie_file": "cookies.json"}
+
+def load_accounts(accounts_file: str = "accounts.json") -> List[Dict[str, str]]:
+    """Load account profiles (name, config file, cookie file) for batch punching"""
+    with open(accounts_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    
+    entries = data.get("accounts", []) if isinstance(data, dict) else data
+    accounts = []
+    for index, entry in enumerate(entries):
+        name = entry.get("name") or f"account{index + 1}"
+        accounts.append({
+            "name": name,
+            "config_file": entry.get("config_file", "config.json"),
+            "cookie_file": entry.get("cookie_file", f"cookies_{name}.json")
+        })
+    return accounts
+
+def punch_batch(accounts: List[Dict[str, str]], attendance_type: int = 1, is_override: bool = False,
+                max_concurrency: int = None) -> Dict[str, Dict[str, Any]]:
+    """Punch many accounts concurrently, returning punch_attendance results keyed by account name"""
+    from concurrent.futures import ThreadPoolExecutor
+    from http_session import configure_http_session
+    
+    if not accounts:
+        return {}
+    
+    service_settings = load_config().get("service_settings", {})
+    if max_concurrency is None:
+        max_concurrency = service_settings.get("batch_concurrency", 8)
+    max_concurrency = max(1, min(int(max_concurrency), len(accounts)))
+    
+    # Size the shared pool so every worker can hold a warm connection
+    configure_http_session(max(service_settings.get("pool_size", 10), max_concurrency))
+    
+    def punch_account(account: Dict[str, str]) -> Dict[str, Any]:
+        try:
+            return punch_attendance(
+                attendance_type=attendance_type,
+                is_override=is_override,
+                config_file=account.get("config_file", "config.json"),
+                cookie_file=account.get("cookie_file", "cookies.json")
+            )
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Punch raised exception: {str(e)}"
+            }
+    
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [(account["name"], executor.submit(punch_account, account)) for account in accounts]
+        return {name: future.result() for name, future in futures}
 
 
 def analyze_jwt_token():
@@ -311,7 +725,12 @@ def analyze_jwt_token():
     print("JWT Token Analysis")
     print("=" * 25)
     
-    cookies = load_cookies_from_file()
+    try:
+        cookies = load_cookies_from_file()
+    except CookieStoreError as e:
+        print(e)
+        print("Run 'python manual_punch.py update' to rewrite it")
+        return False
     jwt_token = cookies.get('__ModuleSessionCookie')
     
     if not jwt_token:
@@ -321,34 +740,27 @@ def analyze_jwt_token():
     print(f"JWT Token (first 50 chars): {jwt_token[:50]}...")
     print()
     
-    payload = decode_jwt_payload(jwt_token)
-    if not payload:
+    token_state = get_token_state(jwt_token)
+    if not token_state.decoded:
         print("Failed to decode JWT payload")
         return True
     
-    current_time = int(time.time())
-    is_expired = False
+    is_expired = token_state.expired
     
-    if 'exp' in payload:
-        exp_time = payload['exp']
-        exp_datetime = datetime.fromtimestamp(exp_time)
-        is_expired = current_time >= exp_time
-        
-        print(f"Expires at: {exp_datetime}")
+    if token_state.exp:
+        print(f"Expires at: {token_state.expires_at}")
         if is_expired:
             print("Status: EXPIRED")
         else:
-            remaining = exp_time - current_time
+            remaining = token_state.remaining_seconds
             hours = remaining // 3600
             minutes = (remaining % 3600) // 60
             print(f"Status: Valid (expires in {hours}h {minutes}m)")
     else:
         print("No expiration time found")
-        is_expired = True
     
-    if 'iat' in payload:
-        iat_datetime = datetime.fromtimestamp(payload['iat'])
-        print(f"Issued at: {iat_datetime}")
+    if token_state.iat:
+        print(f"Issued at: {token_state.issued_at}")
     
     print()
     return is_expired
@@ -377,9 +789,16 @@ def update_session_cookie_interactive():
         
         try:
             # Update cookie
-            current_cookies = load_cookies_from_file()
-            current_cookies['__ModuleSessionCookie'] = user_input
-            save_cookies_to_file(current_cookies)
+            changes = {'__ModuleSessionCookie': user_input}
+            try:
+                if not os.path.exists("cookies.json"):
+                    # A new file starts from the default Incapsula cookies, as the first refresh does
+                    changes = dict(get_default_cookies(), **changes)
+                update_cookie_file(changes)
+            except CookieStoreError as e:
+                print(f"{e} - replacing it with the new token")
+                save_cookies_to_file(dict(get_default_cookies(), **changes))
+                refresh_session_cookies()
             
             print("Session cookie updated successfully!")
             
@@ -409,10 +828,441 @@ def show_cookie_extraction_guide():
     print("5. Or go to Network tab, perform a punch action, and copy cookies from request")
     print()
 
+def open_ledger(config: Optional[Dict[str, Any]] = None) -> "PunchLedger":
+    """Open the punch ledger configured in service_settings.ledger_file"""
+    from punch_ledger import DEFAULT_LEDGER_FILE, PunchLedger, ledger_journal_mode
+    config = config if config is not None else load_config()
+    return PunchLedger(config.get("service_settings", {}).get("ledger_file", DEFAULT_LEDGER_FILE),
+                       ledger_journal_mode(config))
+
+def open_plan_store(config: Optional[Dict[str, Any]] = None) -> "PunchPlanStore":
+    """Open the punch plan table, stored alongside the ledger"""
+    from punch_ledger import DEFAULT_LEDGER_FILE, ledger_journal_mode
+    from punch_plan import PunchPlanStore
+    config = config if config is not None else load_config()
+    return PunchPlanStore(config.get("service_settings", {}).get("ledger_file", DEFAULT_LEDGER_FILE),
+                          ledger_journal_mode(config))
+
+def load_known_accounts(config: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+    """Accounts from service_settings.accounts_file, or the single default account"""
+    config = config if config is not None else load_config()
+    accounts_file = config.get("service_settings", {}).get("accounts_file", "accounts.json")
+    if os.path.exists(accounts_file):
+        return load_accounts(accounts_file)
+    return [dict(DEFAULT_ACCOUNT)]
+
+def punch_window_end(config: Dict[str, Any], attendance_type: int) -> Tuple[int, int]:
+    """Latest (hour, minute) a scheduled punch of this type can happen"""
+    key = "punch_in" if attendance_type == 1 else "punch_out"
+    defaults = {"punch_in": (9, 20), "punch_out": (18, 30)}[key]
+    punch_config = config.get("work_schedule", {}).get(key, {})
+    return punch_config.get("hour", defaults[0]), punch_config.get("minute_range", {}).get("max", defaults[1])
+
+def expected_punches(accounts: List[Dict[str, str]], days: List[date], now: Optional[datetime] = None) -> List[Tuple[str, date, int]]:
+    """(account, day, punch_type) that should have happened by `now` on effective workdays"""
+    from work_calendar import get_calendar, workday_numbers
+    now = now or datetime.now()
+    expected = []
+    for account in accounts:
+        config = load_config(account["config_file"])
+        calendar = get_calendar(config)
+        weekdays = workday_numbers(config)
+        for day in days:
+            if not calendar.is_workday(account["name"], day, weekdays):
+                continue
+            for attendance_type in (1, 2):
+                hour, minute = punch_window_end(config, attendance_type)
+                if datetime(day.year, day.month, day.day, hour, minute) <= now:
+                    expected.append((account["name"], day, attendance_type))
+    return expected
+
+def print_ledger_rows(rows: List[Dict[str, Any]]) -> None:
+    """Print ledger rows as a table"""
+    if not rows:
+        print("No punches recorded")
+        return
+    print(f"{'Date':<10}  {'Account':<16}  {'Type':<8}  {'Planned':<8}  {'Actual':<8}  {'Latency':>8}  {'Status':>6}  Result")
+    for row in rows:
+        planned = row["planned_at"][11:19] if row["planned_at"] else "-"
+        latency = f"{row['latency_ms']:.0f}ms" if row["latency_ms"] is not None else "-"
+        outcome = "OK" if row["success"] else f"FAIL {row['error'] or ''}".strip()
+        print(f"{row['punch_date']:<10}  {row['account']:<16}  {PUNCH_TYPE_NAMES.get(row['punch_type'], '?'):<8}  "
+              f"{planned:<8}  {row['actual_at'][11:19]:<8}  {latency:>8}  {str(row['status_code'] or '-'):>6}  {outcome}")
+
+def ledger_command(args: List[str]) -> int:
+    """Query the punch ledger: today, days N, missing [N]"""
+    from punch_ledger import days_back
+    usage = "Usage: python manual_punch.py ledger [today|days N|missing N]"
+    query = args[0].lower() if args else "today"
+    if query not in ("today", "days", "missing"):
+        print(usage, file=sys.stderr)
+        return USAGE_EXIT_CODE
+    try:
+        count = int(args[1]) if len(args) > 1 else 7
+    except ValueError:
+        count = 0
+    if count < 1:
+        print(f"{query} needs a positive whole number of days, got {args[1]!r}", file=sys.stderr)
+        print(usage, file=sys.stderr)
+        return USAGE_EXIT_CODE
+    ledger = open_ledger()
+    
+    try:
+        if query == "today":
+            today = date.today()
+            print_ledger_rows(ledger.punches_between(today, today))
+        elif query == "days":
+            days = days_back(count)
+            print_ledger_rows(ledger.punches_between(days[0], days[-1]))
+        elif query == "missing":
+            missing = ledger.missing_punches(expected_punches(load_known_accounts(), days_back(count)))
+            if not missing:
+                print(f"No missing punches in the last {count} days")
+                return 0
+            print(f"Missing punches in the last {count} days:")
+            for account, day, attendance_type in missing:
+                print(f"  {day.isoformat()} ({day.strftime('%a')})  {account:<16}  {PUNCH_TYPE_NAMES[attendance_type]}")
+            return 1
+    finally:
+        ledger.close()
+    return 0
+
+def plan_command(args: List[str]) -> int:
+    """Generate and show punch plans: plan [days] [--regenerate]"""
+    from punch_plan import generate_plans, plan_days
+    regenerate = '--regenerate' in args
+    numbers = [arg for arg in args if arg.isdigit()]
+    days = plan_days(date.today(), int(numbers[0]) if numbers else 7)
+    accounts = load_known_accounts()
+    store = open_plan_store()
+    
+    try:
+        skip = None if regenerate else store.planned_days(days[0], days[-1])
+        rows = generate_plans(((account["name"], load_config(account["config_file"])) for account in accounts),
+                              days, skip=skip)
+        store.save(rows, replace=regenerate)
+        print(f"Generated {len(rows)} punch time(s) for {len(accounts)} account(s), "
+              f"{days[0].isoformat()} to {days[-1].isoformat()}")
+        print()
+        
+        plans = {}
+        for account, day, attendance_type, planned_at in store.plans_between(days[0], days[-1]):
+            plans.setdefault((day, account), {})[attendance_type] = planned_at
+        print(f"{'date':<10}  {'account':<16}  {'checkin':<8}  {'checkout':<8}  span")
+        for (day, account), times in sorted(plans.items()):
+            punch_in, punch_out = times.get(1), times.get(2)
+            worked = f"{(punch_out - punch_in).total_seconds() / 3600:.2f}h" if punch_in and punch_out else "-"
+            print(f"{day.isoformat():<10}  {account:<16}  {punch_in.strftime('%H:%M:%S') if punch_in else '-':<8}  "
+                  f"{punch_out.strftime('%H:%M:%S') if punch_out else '-':<8}  {worked}")
+    finally:
+        store.close()
+    return 0
+
+def workdays_command(args: List[str]) -> int:
+    """Show the next N effective workdays: workdays [N] [account] [--all]"""
+    from work_calendar import get_calendar, workday_numbers
+    show_all = '--all' in args
+    args = [arg for arg in args if arg != '--all']
+    numbers = [arg for arg in args if arg.isdigit()]
+    names = [arg for arg in args if not arg.isdigit()]
+    count = int(numbers[0]) if numbers else 10
+    accounts = load_known_accounts()
+    if names:
+        accounts = [account for account in accounts if account["name"] in names]
+        if not accounts:
+            print(f"Unknown account: {', '.join(names)}")
+            return 1
+    
+    today = date.today()
+    for account in accounts:
+        config = load_config(account["config_file"])
+        calendar = get_calendar(config)
+        weekdays = workday_numbers(config)
+        workdays = calendar.next_workdays(account["name"], today, count, weekdays)
+        print(f"Next {len(workdays)} workday(s) for {account['name']}:")
+        end = workdays[-1] if workdays else today
+        day = today
+        while day <= end:
+            is_workday, reason = calendar.day_status(account["name"], day, weekdays)
+            # Plain weekends are noise; other days off are shown so the skip is explained
+            if is_workday or show_all or reason != "weekend":
+                marker = "  " if is_workday else "--"
+                print(f"  {marker} {day.isoformat()} ({day.strftime('%a')})  {reason}")
+            day += timedelta(days=1)
+        print()
+    return 0
+
+def preflight_command(args: List[str]) -> int:
+    """Run pre-flight checks without punching: preflight [account ...]"""
+    accounts = load_known_accounts()
+    if args:
+        accounts = [account for account in accounts if account["name"] in args]
+        if not accounts:
+            print(f"Unknown account: {', '.join(args)}")
+            return 1
+    
+    failures = 0
+    for account in accounts:
+        result = preflight_account(account["config_file"], account["cookie_file"])
+        if not result["ok"]:
+            failures += 1
+        timings = f"dns {result['dns_ms']}ms, request {result['request_ms']}ms" if "request_ms" in result else ""
+        refreshed = f", refreshed {', '.join(result['refreshed_cookies'])}" if result.get("refreshed_cookies") else ""
+        print(f"[{'OK' if result['ok'] else 'FAIL':<4}] {account['name']}: {result['status']}"
+              f"{' - ' + result['error'] if result.get('error') else ''}"
+              f"{' (' + timings + refreshed + ')' if timings else ''}")
+    return 1 if failures else 0
+
+# Cookie report statuses, most urgent first; the exit code is the worst one found
+REPORT_STATUSES = ("missing", "malformed", "expired", "expiring", "ok")
+REPORT_EXIT_CODES = {"ok": 0, "expiring": 1, "expired": 2, "missing": 2, "malformed": 2}
+REPORT_USAGE_EXIT_CODE = USAGE_EXIT_CODE
+REPORT_CONFIG_EXIT_CODE = 4
+REPORT_USAGE = "Usage: python manual_punch.py report [account ...] [--json] [--warn-hours H]"
+DEFAULT_REPORT_WARN_HOURS = 24
+
+def format_remaining(seconds: int) -> str:
+    """Compact signed duration: 2d 03h, 5h 07m, -12m"""
+    sign = "-" if seconds < 0 else ""
+    minutes = abs(seconds) // 60
+    days, minutes = divmod(minutes, 1440)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{sign}{days}d {hours:02d}h"
+    if hours:
+        return f"{sign}{hours}h {minutes:02d}m"
+    return f"{sign}{minutes}m"
+
+def cookie_report(accounts: List[Dict[str, str]], now: Optional[int] = None,
+                  warn_seconds: int = DEFAULT_REPORT_WARN_HOURS * 3600) -> List[Dict[str, Any]]:
+    """JWT expiry of every account's session cookie, read from disk only - no request is sent.
+    
+    Rows are sorted by soonest expiry; tokens that are missing or cannot be
+    decoded have no expiry and come first.
+    """
+    now = int(time.time()) if now is None else now
+    # Accounts often share a token or an expiry time, so each is decoded / formatted once
+    payloads: Dict[str, Any] = {}
+    timestamps: Dict[float, str] = {}
+    
+    def format_timestamp(value: float) -> str:
+        text = timestamps.get(value)
+        if text is None:
+            text = timestamps[value] = datetime.fromtimestamp(value).isoformat(sep=' ', timespec='seconds')
+        return text
+    
+    rows = []
+    for account in accounts:
+        row = {"account": account["name"], "cookie_file": account["cookie_file"], "status": "ok",
+               "exp": None, "iat": None, "expires_at": None, "issued_at": None, "remaining_seconds": None, "detail": None}
+        rows.append(row)
+        try:
+            cookies = read_cookies(account["cookie_file"])
+        except CookieStoreError as e:
+            row.update(status="malformed", detail=str(e))
+            continue
+        if cookies is None:
+            # Punches fall back to the token in config.json, so that is what gets checked
+            try:
+                cookies = get_default_cookies(account["config_file"])
+            except (AttributeError, TypeError):
+                row.update(status="malformed", detail=f"{account['config_file']} has no valid authentication section")
+                continue
+            row["detail"] = "no cookie file - using the config token"
+        jwt_token = cookies.get('__ModuleSessionCookie')
+        if not jwt_token or jwt_token == PLACEHOLDER_SESSION_COOKIE:
+            row.update(status="missing", detail="no cookie file or token in config" if row["detail"] else "no __ModuleSessionCookie")
+            continue
+        if not isinstance(jwt_token, str):
+            row.update(status="malformed", detail="__ModuleSessionCookie is not a string")
+            continue
+        payload = payloads.get(jwt_token)
+        if payload is None:
+            payload = payloads[jwt_token] = decode_jwt_payload(jwt_token)
+        if not isinstance(payload, dict):
+            row.update(status="malformed", detail="JWT payload cannot be decoded")
+            continue
+        exp, iat = payload.get('exp'), payload.get('iat')
+        if isinstance(iat, (int, float)):
+            row.update(iat=iat, issued_at=format_timestamp(iat))
+        if not isinstance(exp, (int, float)):
+            row.update(status="malformed", detail="JWT has no exp claim")
+            continue
+        remaining = int(exp) - now
+        row.update(exp=exp, expires_at=format_timestamp(exp), remaining_seconds=remaining)
+        if remaining <= 0:
+            row["status"] = "expired"
+        elif remaining <= warn_seconds:
+            row["status"] = "expiring"
+    rows.sort(key=lambda row: (row["exp"] is not None, row["exp"] or 0, row["account"]))
+    return rows
+
+def report_command(args: List[str]) -> int:
+    """Offline cookie expiry report: report [account ...] [--json] [--warn-hours H]
+    
+    Exit code 0 when every token is valid beyond the warning window, 1 when
+    one expires within it, 2 when one is expired, missing or malformed,
+    3 (REPORT_USAGE_EXIT_CODE) for bad arguments or unknown accounts and
+    4 (REPORT_CONFIG_EXIT_CODE) when the accounts file cannot be read.
+    """
+    as_json = "--json" in args
+    warn_hours = DEFAULT_REPORT_WARN_HOURS
+    names = []
+    remaining_args = iter(args)
+    for arg in remaining_args:
+        if arg == "--warn-hours":
+            value = next(remaining_args, None)
+            try:
+                warn_hours = float(value)
+            except (TypeError, ValueError):
+                warn_hours = -1
+            if not 0 <= warn_hours < float("inf"):
+                print(f"--warn-hours needs a non-negative number of hours, got {value!r}", file=sys.stderr)
+                print(REPORT_USAGE, file=sys.stderr)
+                return REPORT_USAGE_EXIT_CODE
+        elif arg != "--json":
+            names.append(arg)
+    
+    try:
+        accounts = load_known_accounts()
+    except (OSError, ValueError, AttributeError, TypeError) as e:
+        print(f"Cannot load accounts: {e}", file=sys.stderr)
+        return REPORT_CONFIG_EXIT_CODE
+    if names:
+        accounts = [account for account in accounts if account["name"] in names]
+        if not accounts:
+            print(f"Unknown account: {', '.join(names)}", file=sys.stderr)
+            print(REPORT_USAGE, file=sys.stderr)
+            return REPORT_USAGE_EXIT_CODE
+    
+    now = int(time.time())
+    rows = cookie_report(accounts, now, int(warn_hours * 3600))
+    summary = {status: 0 for status in REPORT_STATUSES}
+    for row in rows:
+        summary[row["status"]] += 1
+    exit_code = max((REPORT_EXIT_CODES[row["status"]] for row in rows), default=0)
+    
+    if as_json:
+        print(json.dumps({
+            "generated_at": datetime.fromtimestamp(now).isoformat(sep=' ', timespec='seconds'),
+            "warn_seconds": int(warn_hours * 3600),
+            "exit_code": exit_code,
+            "summary": summary,
+            "accounts": rows
+        }, ensure_ascii=False))
+        return exit_code
+    
+    print(f"Cookie report: {len(rows)} account(s) at {datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')}, "
+          f"warning within {warn_hours:g}h")
+    print(f"{'account':<20}  {'status':<9}  {'expires':<19}  {'remaining':>9}  {'issued':<19}  detail")
+    for row in rows:
+        remaining = format_remaining(row["remaining_seconds"]) if row["remaining_seconds"] is not None else "-"
+        print(f"{row['account']:<20}  {row['status']:<9}  {row['expires_at'] or '-':<19}  {remaining:>9}  "
+              f"{row['issued_at'] or '-':<19}  {row['detail'] or ''}")
+    print("Summary: " + ", ".join(f"{count} {status}" for status, count in summary.items()))
+    if exit_code == 2:
+        print("Run 'python manual_punch.py update' for the accounts above that are not ok")
+    return exit_code
+
+def batch_punch_command(args: List[str]) -> int:
+    """Run a concurrent batch punch from command line arguments"""
+    from http_session import get_connection_stats
+    from punch_ledger import record_result
+    
+    attendance_type = 1
+    accounts_file = "accounts.json"
+    max_concurrency = None
+    
+    index = 0
+    while index < len(args):
+        arg = args[index].lower()
+        if arg in ['checkin', 'in', '1']:
+            attendance_type = 1
+        elif arg in ['checkout', 'out', '2']:
+            attendance_type = 2
+        elif arg in ['--concurrency', '-c']:
+            value = args[index + 1] if index + 1 < len(args) else None
+            try:
+                max_concurrency = int(value)
+            except (TypeError, ValueError):
+                max_concurrency = 0
+            if max_concurrency < 1:
+                print(f"--concurrency needs a positive whole number, got {value!r}", file=sys.stderr)
+                print("Usage: python manual_punch.py batch [checkin|checkout] [accounts.json] [--concurrency N]",
+                      file=sys.stderr)
+                return USAGE_EXIT_CODE
+            index += 1
+        else:
+            accounts_file = args[index]
+        index += 1
+    
+    try:
+        accounts = load_accounts(accounts_file)
+    except (json.JSONDecodeError, FileNotFoundError) as e:
+        print(f"Cannot load accounts file {accounts_file}: {e}")
+        return 1
+    
+    action = "Check-in" if attendance_type == 1 else "Check-out"
+    print(f"Batch {action.lower()} for {len(accounts)} accounts...")
+    
+    started_at = datetime.now()
+    results = punch_batch(accounts, attendance_type, max_concurrency=max_concurrency)
+    
+    ledger = open_ledger()
+    for name, result in results.items():
+        record_result(ledger, name, attendance_type, result, started_at)
+    ledger.close()
+    
+    failures = 0
+    for name, result in results.items():
+        if result["success"]:
+            print(f"[OK]   {name}: {action} successful")
+        else:
+            failures += 1
+            print(f"[FAIL] {name}: {result.get('error', 'Unknown error')}")
+    
+    print(f"Batch completed: {len(results) - failures} succeeded, {failures} failed")
+    stats = get_connection_stats()
+    print(f"Connections: {stats['connections']} opened, {stats['reused']} reused for {stats['requests']} requests")
+    print_rate_limit_stats()
+    return 1 if failures else 0
+
+def print_rate_limit_stats() -> None:
+    """One line per throttled endpoint - the numbers to size service_settings.rate_limits with"""
+    from rate_limiter import rate_limit_stats
+    for endpoint, stats in rate_limit_stats().items():
+        print(f"Rate limit {endpoint}: {stats['requests']} requests at {stats['rate_per_second']:g}/s "
+              f"(burst {stats['burst']:g}), {stats['delayed']} delayed, {stats['rejected']} rejected, "
+              f"wait mean {stats['wait_mean_seconds']}s max {stats['wait_max_seconds']}s")
+
+def enable_profiling() -> "ProfileReport":
+    """Collect spans for --profile, including DNS, TCP and TLS set-up of new connections"""
+    from http_session import trace_connections
+    from tracing import ProfileReport, add_sink
+    
+    report = ProfileReport()
+    add_sink(report)
+    trace_connections()
+    return report
+
+
 def main():
     """Main function with interactive menu"""
-    import sys
-    
+    # --profile works with any command: time every phase and print the breakdown on exit
+    if '--profile' not in sys.argv:
+        run_command()
+        return
+    sys.argv.remove('--profile')
+    report = enable_profiling()
+    try:
+        with span(" ".join(["manual_punch"] + sys.argv[1:2])):
+            run_command()
+    finally:
+        report.print()
+
+
+def run_command():
+    """Dispatch the command line"""
     if len(sys.argv) > 1:
         command = sys.argv[1].lower()
         
@@ -423,6 +1273,18 @@ def main():
             show_cookie_extraction_guide()
             update_session_cookie_interactive()
             return
+        elif command == 'batch':
+            sys.exit(batch_punch_command(sys.argv[2:]))
+        elif command in ['plan', 'plans']:
+            sys.exit(plan_command(sys.argv[2:]))
+        elif command in ['ledger', 'history']:
+            sys.exit(ledger_command(sys.argv[2:]))
+        elif command in ['workdays', 'calendar']:
+            sys.exit(workdays_command(sys.argv[2:]))
+        elif command == 'preflight':
+            sys.exit(preflight_command(sys.argv[2:]))
+        elif command == 'report':
+            sys.exit(report_command(sys.argv[2:]))
         elif command in ['checkin', 'in', '1']:
             attendance_type = 1
         elif command in ['checkout', 'out', '2']:
@@ -434,14 +1296,29 @@ def main():
             print("  python manual_punch.py 2      # Check-out") 
             print("  python manual_punch.py analyze # Analyze JWT token")
             print("  python manual_punch.py update  # Update cookies")
+            print("  python manual_punch.py batch [checkin|checkout] [accounts.json] [--concurrency N]")
+            print("  python manual_punch.py plan [days] [--regenerate]")
+            print("  python manual_punch.py ledger [today|days N|missing N]")
+            print("  python manual_punch.py workdays [N] [account] [--all]")
+            print("  python manual_punch.py preflight [account ...]")
+            print("  python manual_punch.py report [account ...] [--json] [--warn-hours H]  # Offline cookie expiry")
+            print("  Add --profile to any command for a per-phase timing breakdown")
             return
     else:
         # Default test
         print("Testing punch...")
         attendance_type = 2
     
+    from punch_ledger import record_result
+    
+    punch_time = datetime.now()
     result = punch_attendance(attendance_type)
     
+    with span("ledger_record"):
+        ledger = open_ledger()
+        record_result(ledger, DEFAULT_ACCOUNT["name"], attendance_type, result, punch_time)
+        ledger.close()
+    
     if result["success"]:
         action = "Check-in" if attendance_type == 1 else "Check-out"
         print(f"{action} successful!")
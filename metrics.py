@@ -0,0 +1,248 @@
+import bisect
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+DEFAULT_DRIFT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 60.0)
+DEFAULT_WAIT_BUCKETS = (0.0, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    """Value that can go up and down, or be computed at scrape time by a callback"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> List[str]:
+        if self.callback is None:
+            return super().samples()
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warning(f"Metric callback {self.name} failed: {e}")
+            return []
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in values.items()]
+
+
+class Histogram:
+    """Fixed-bucket histogram - observe() is a bisect plus two additions"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts, then +Inf, sum and count
+                series = self._series[key] = [0.0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, (("le", _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None) -> Gauge:
+        gauge = self._register(Gauge(name, documentation, labelnames, callback))
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Punch-path metrics shared by manual_punch and the service
+PUNCHES = REGISTRY.counter("attendance_punches_total", "Punches by type and outcome", ["type", "outcome"])
+PUNCH_RETRIES = REGISTRY.counter("attendance_punch_retries_total", "Punch requests retried after a failed attempt")
+COOKIE_REFRESHES = REGISTRY.counter("attendance_cookie_refreshes_total", "Session cookie refresh attempts", ["result"])
+PREFLIGHTS = REGISTRY.counter("attendance_preflight_checks_total", "Pre-flight checks ahead of punches", ["status"])
+CATCH_UPS = REGISTRY.counter("attendance_catch_up_punches_total",
+                             "Planned punches found unresolved at start-up", ["action"])
+PUNCH_LATENCY = REGISTRY.histogram("attendance_punch_duration_seconds", "punch_attendance wall-clock duration", ["type"])
+RATE_LIMIT_WAIT = REGISTRY.histogram("attendance_rate_limit_wait_seconds",
+                                     "Time requests waited for the HR rate limiter", ["endpoint"],
+                                     buckets=DEFAULT_WAIT_BUCKETS)
+RATE_LIMIT_REJECTED = REGISTRY.counter("attendance_rate_limit_rejected_total",
+                                       "Requests dropped because their rate-limit slot was past their deadline", ["endpoint"])
+SCHEDULE_DRIFT = REGISTRY.histogram("attendance_schedule_drift_seconds",
+                                    "Scheduler fire time minus planned time", buckets=DEFAULT_DRIFT_BUCKETS)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_exporter(port: int, host: str = "127.0.0.1", registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return server
+
+
+def write_textfile(path: str, registry: MetricsRegistry = REGISTRY) -> None:
+    """Atomically write the registry for node_exporter's textfile collector"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(temp_path, path)
+
+
+class TextfileWriter:
+    """Rewrite a metrics textfile every `interval` seconds from a daemon thread"""
+
+    def __init__(self, path: str, interval: float = 15.0, registry: MetricsRegistry = REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-textfile", daemon=True)
+
+    def start(self) -> "TextfileWriter":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                write_textfile(self.path, self.registry)
+            except Exception as e:
+                logger.warning(f"Cannot write metrics textfile {self.path}: {e}")
+            self._stop.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+        try:
+            write_textfile(self.path, self.registry)
+        except Exception:
+            pass
@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_LEDGER_FILE = "data/punch_ledger.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS punches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL,
+    punch_type INTEGER NOT NULL,
+    punch_date TEXT NOT NULL,
+    planned_at TEXT,
+    actual_at TEXT NOT NULL,
+    latency_ms REAL,
+    status_code INTEGER,
+    success INTEGER NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_punches_account_date ON punches (account, punch_date, punch_type);
+CREATE INDEX IF NOT EXISTS idx_punches_date ON punches (punch_date);
+"""
+
+COLUMNS = ["id", "account", "punch_type", "punch_date", "planned_at", "actual_at",
+           "latency_ms", "status_code", "success", "error"]
+
+
+def ledger_journal_mode(config: Dict[str, Any]) -> str:
+    """Journal mode for the ledger file (shared by the ledger, plan store and replica lease).
+
+    WAL keeps its index in shared memory, so it only works while every
+    process opening the file runs on one host. Replicas on several hosts
+    (service_settings.coordination.enabled) use a rollback journal instead.
+    """
+    return "DELETE" if config.get("service_settings", {}).get("coordination", {}).get("enabled") else "WAL"
+
+
+def apply_journal_mode(conn: sqlite3.Connection, journal_mode: str) -> None:
+    """Switch a connection's database to `journal_mode`, failing loudly if SQLite refuses"""
+    mode = conn.execute(f"PRAGMA journal_mode={journal_mode}").fetchone()[0]
+    if mode.lower() == "memory":
+        return  # ":memory:" databases always keep their journal in memory; nothing else can open them
+    if mode.upper() != journal_mode.upper():
+        raise sqlite3.OperationalError(f"Cannot switch the ledger to journal_mode={journal_mode} (still {mode}) - "
+                                       f"stop every other process using it first")
+    # NORMAL is only crash-safe with WAL; a rollback journal needs FULL
+    conn.execute(f"PRAGMA synchronous={'NORMAL' if mode.upper() == 'WAL' else 'FULL'}")
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat(sep=' ', timespec='seconds') if value else None
+
+
+class PunchLedger:
+    """Append-only SQLite record of every punch attempt.
+
+    Rows are only ever inserted; all lookups go through the
+    (account, punch_date, punch_type) or punch_date indexes so they stay
+    O(log n) regardless of how much history accumulates.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_LEDGER_FILE, journal_mode: str = "WAL"):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        apply_journal_mode(self._conn, journal_mode)
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def record(self, account: str, punch_type: int, actual_at: datetime, success: bool,
+               planned_at: Optional[datetime] = None, latency_ms: Optional[float] = None,
+               status_code: Optional[int] = None, error: Optional[str] = None) -> int:
+        """Append one punch attempt and return its row id"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO punches (account, punch_type, punch_date, planned_at, actual_at, "
+                "latency_ms, status_code, success, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (account, punch_type, actual_at.date().isoformat(), _timestamp(planned_at), _timestamp(actual_at),
+                 latency_ms, status_code, 1 if success else 0, error)
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def _rows(self, sql: str, params: Iterable[Any]) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(sql, tuple(params)).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def first_success(self, account: str, punch_type: int, day: date) -> Optional[datetime]:
+        """Time of the first successful punch of this type for the account on `day`"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(actual_at) FROM punches "
+                "WHERE account = ? AND punch_date = ? AND punch_type = ? AND success = 1",
+                (account, day.isoformat(), punch_type)
+            ).fetchone()
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+    def last_punch(self, account: str) -> Optional[Dict[str, Any]]:
+        """Most recent attempt for the account - two index seeks, however long the history"""
+        rows = self._rows(
+            f"SELECT {', '.join(COLUMNS)} FROM punches WHERE account = ? AND punch_date = "
+            "(SELECT MAX(punch_date) FROM punches WHERE account = ?) ORDER BY id DESC LIMIT 1",
+            (account, account))
+        return rows[0] if rows else None
+
+    def punches_between(self, start: date, end: date, account: Optional[str] = None) -> List[Dict[str, Any]]:
+        """All recorded attempts with punch_date in [start, end], oldest first"""
+        sql = f"SELECT {', '.join(COLUMNS)} FROM punches WHERE punch_date BETWEEN ? AND ?"
+        params = [start.isoformat(), end.isoformat()]
+        if account is not None:
+            sql = (f"SELECT {', '.join(COLUMNS)} FROM punches "
+                   "WHERE account = ? AND punch_date BETWEEN ? AND ?")
+            params.insert(0, account)
+        return self._rows(sql + " ORDER BY punch_date, actual_at", params)
+
+    def successful_keys(self, start: date, end: date) -> set:
+        """(account, punch_date, punch_type) for every successful punch in [start, end]"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT account, punch_date, punch_type FROM punches "
+                "WHERE punch_date BETWEEN ? AND ? AND success = 1",
+                (start.isoformat(), end.isoformat())
+            ).fetchall()
+        return set(rows)
+
+    def missing_punches(self, expected: Iterable[tuple]) -> List[tuple]:
+        """Filter expected (account, date, punch_type) tuples down to those never punched successfully"""
+        expected = sorted(set(expected), key=lambda item: (item[1], item[0], item[2]))
+        if not expected:
+            return []
+        done = self.successful_keys(expected[0][1], expected[-1][1])
+        return [item for item in expected if (item[0], item[1].isoformat(), item[2]) not in done]
+
+
+def days_back(count: int, today: Optional[date] = None) -> List[date]:
+    """The last `count` days ending today, oldest first"""
+    today = today or date.today()
+    return [today - timedelta(days=offset) for offset in range(max(1, count) - 1, -1, -1)]
+
+
+def record_result(ledger: PunchLedger, account: str, punch_type: int, result: Dict[str, Any], actual_at: datetime,
+                  latency_seconds: Optional[float] = None, planned_at: Optional[datetime] = None) -> int:
+    """Append a punch_attendance result dict to the ledger"""
+    if latency_seconds is None:
+        latency_seconds = result.get("elapsed_seconds")
+    return ledger.record(
+        account=account,
+        punch_type=punch_type,
+        actual_at=actual_at,
+        success=bool(result.get("success")),
+        planned_at=planned_at,
+        latency_ms=latency_seconds * 1000 if latency_seconds is not None else None,
+        status_code=result.get("status_code"),
+        error=result.get("error")
+    )
@@ -0,0 +1,258 @@
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from punch_ledger import DEFAULT_LEDGER_FILE, apply_journal_mode
+from work_calendar import get_calendar, workday_numbers
+
+DEFAULT_PLAN_SETTINGS = {
+    "days_ahead": 28,
+    "seed": None,
+    "jitter_seconds": 59
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS punch_plans (
+    account TEXT NOT NULL,
+    punch_date TEXT NOT NULL,
+    punch_type INTEGER NOT NULL,
+    planned_at TEXT NOT NULL,
+    generated_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'planned',
+    completed_at TEXT,
+    fence INTEGER,
+    PRIMARY KEY (account, punch_date, punch_type)
+) WITHOUT ROWID;
+"""
+
+# Created after the migration below, since older tables have no status column
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_plans_planned_at ON punch_plans (planned_at);
+CREATE INDEX IF NOT EXISTS idx_plans_status ON punch_plans (status, planned_at);
+CREATE INDEX IF NOT EXISTS idx_plans_date ON punch_plans (punch_date);
+"""
+
+# Job states: every plan row starts planned and ends in exactly one of the others
+PLANNED = "planned"
+RUNNING = "running"  # claimed by a replica (replica_lease.py); only used when coordination is enabled
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+MISSED = "missed"
+
+# (account, punch_date, punch_type, planned_at)
+PlanRow = Tuple[str, date, int, datetime]
+
+
+def _timestamp(value: datetime) -> str:
+    return value.isoformat(sep=' ', timespec='seconds')
+
+
+def plan_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """service_settings.plan merged over the defaults"""
+    return dict(DEFAULT_PLAN_SETTINGS, **config.get("service_settings", {}).get("plan", {}))
+
+
+class _DigestRandom:
+    """Deterministic randint() from a keyed hash - far cheaper to seed than random.Random"""
+
+    __slots__ = ("_value", )
+
+    def __init__(self, key: str):
+        self._value = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=32).digest(), "big")
+
+    def randint(self, a: int, b: int) -> int:
+        # Five small draws use ~50 of the 256 bits, so the pool never runs dry in practice
+        self._value, draw = divmod(self._value, b - a + 1)
+        return a + draw
+
+
+class PlanSpec:
+    """The parts of a config that plan generation needs, resolved once per config"""
+
+    __slots__ = ("in_hour", "in_minutes", "out_hour", "out_minutes", "jitter", "seed", "min_span", "weekdays",
+                 "calendar")
+
+    def __init__(self, config: Dict[str, Any]):
+        work_schedule = config.get("work_schedule", {})
+        settings = plan_settings(config)
+        punch_in = work_schedule.get("punch_in", {})
+        punch_out = work_schedule.get("punch_out", {})
+        self.in_hour = punch_in.get("hour", 9)
+        self.in_minutes = (punch_in.get("minute_range", {}).get("min", 10), punch_in.get("minute_range", {}).get("max", 20))
+        self.out_hour = punch_out.get("hour", 18)
+        self.out_minutes = (punch_out.get("minute_range", {}).get("min", 10), punch_out.get("minute_range", {}).get("max", 30))
+        self.jitter = max(0, settings["jitter_seconds"])
+        self.seed = settings["seed"]
+        self.min_span = int(work_schedule.get("work_duration_hours", 9) * 3600)
+        self.weekdays = workday_numbers(config)
+        self.calendar = get_calendar(config)
+
+    def is_workday(self, account: str, day: date) -> bool:
+        """Weekly workdays adjusted for holidays, make-up workdays and the account's leave"""
+        return self.calendar.is_workday(account, day, self.weekdays)
+
+    def plan_day(self, account: str, day: date, midnight: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+        rng = _DigestRandom(f"{self.seed}:{account}:{day.isoformat()}") if self.seed is not None else random
+        # Whole-second offsets from midnight keep this to two datetime additions
+        punch_in = self.in_hour * 3600 + rng.randint(*self.in_minutes) * 60 + rng.randint(0, self.jitter)
+        punch_out = self.out_hour * 3600 + rng.randint(*self.out_minutes) * 60 + rng.randint(0, self.jitter)
+        if punch_out - punch_in < self.min_span:
+            punch_out = punch_in + self.min_span + rng.randint(0, self.jitter)
+        midnight = midnight or datetime.combine(day, time())
+        return midnight + timedelta(seconds=punch_in), midnight + timedelta(seconds=punch_out)
+
+
+def plan_day(account: str, day: date, config: Dict[str, Any]) -> Tuple[datetime, datetime]:
+    """Punch-in and punch-out times for one account on one day.
+
+    With service_settings.plan.seed set, the same (seed, account, day)
+    always yields the same times; every day still gets its own draw.
+    Punch-out is pushed back so the day spans at least work_duration_hours.
+    """
+    return PlanSpec(config).plan_day(account, day)
+
+
+def generate_plans(accounts: Iterable[Tuple[str, Dict[str, Any]]], days: Iterable[date],
+                   skip: Optional[Set[Tuple[str, str]]] = None) -> List[PlanRow]:
+    """Plan rows for every (account name, config) on its effective workdays, minus (account, iso date) pairs in `skip`"""
+    days = [(day, day.isoformat(), datetime.combine(day, time())) for day in days]
+    skip = skip or set()
+    specs: Dict[int, PlanSpec] = {}
+    rows = []
+    for name, config in accounts:
+        spec = specs.get(id(config))
+        if spec is None:
+            spec = specs[id(config)] = PlanSpec(config)
+        for day, iso_day, midnight in days:
+            if (name, iso_day) in skip or not spec.is_workday(name, day):
+                continue
+            punch_in, punch_out = spec.plan_day(name, day, midnight)
+            rows.append((name, day, 1, punch_in))
+            rows.append((name, day, 2, punch_out))
+    return rows
+
+
+class PunchPlanStore:
+    """Pre-computed punch times, one row per (account, day, punch type).
+
+    Lives next to the punch ledger; a month for thousands of accounts is
+    written with a single executemany in one transaction.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_LEDGER_FILE, journal_mode: str = "WAL"):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        apply_journal_mode(self._conn, journal_mode)
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(punch_plans)")}
+        if "status" not in columns:
+            self._conn.execute(f"ALTER TABLE punch_plans ADD COLUMN status TEXT NOT NULL DEFAULT '{PLANNED}'")
+            self._conn.execute("ALTER TABLE punch_plans ADD COLUMN completed_at TEXT")
+        if "fence" not in columns:
+            self._conn.execute("ALTER TABLE punch_plans ADD COLUMN fence INTEGER")
+        self._conn.executescript(INDEXES)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def save(self, rows: Iterable[PlanRow], replace: bool = False, now: Optional[datetime] = None) -> int:
+        """Store plan rows; existing rows are kept unless `replace`, which never touches rows already handled.
+
+        Rows whose time has already passed when they are generated (today on
+        a first run, say) are stored as skipped so restart recovery never
+        mistakes them for missed punches.
+        """
+        now = now or datetime.now()
+        generated_at = _timestamp(now)
+        params = [(account, day.isoformat(), punch_type, _timestamp(planned_at), generated_at,
+                   PLANNED if planned_at > now else SKIPPED)
+                  for account, day, punch_type, planned_at in rows]
+        conflict = ("ON CONFLICT DO UPDATE SET planned_at = excluded.planned_at, generated_at = excluded.generated_at, "
+                    f"status = excluded.status WHERE status = '{PLANNED}'") if replace else "ON CONFLICT DO NOTHING"
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO punch_plans (account, punch_date, punch_type, planned_at, generated_at, status) "
+                f"VALUES (?, ?, ?, ?, ?, ?) {conflict}", params)
+            self._conn.commit()
+        return len(params)
+
+    def planned_days(self, start: date, end: date, account: Optional[str] = None) -> Set[Tuple[str, str]]:
+        """(account, iso date) pairs that already have a plan in [start, end]"""
+        sql = "SELECT DISTINCT account, punch_date FROM punch_plans WHERE punch_date BETWEEN ? AND ?"
+        params = [start.isoformat(), end.isoformat()]
+        if account is not None:
+            sql += " AND account = ?"
+            params.append(account)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return set(rows)
+
+    def due_between(self, start: datetime, end: datetime) -> List[PlanRow]:
+        """Plan rows with planned_at in [start, end), earliest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT account, punch_date, punch_type, planned_at FROM punch_plans "
+                "WHERE planned_at >= ? AND planned_at < ? ORDER BY planned_at",
+                (_timestamp(start), _timestamp(end))
+            ).fetchall()
+        return [(account, date.fromisoformat(day), punch_type, datetime.fromisoformat(planned_at))
+                for account, day, punch_type, planned_at in rows]
+
+    def plans_between(self, start: date, end: date, account: Optional[str] = None) -> List[PlanRow]:
+        """Plan rows with punch_date in [start, end], optionally for one account"""
+        sql = "SELECT account, punch_date, punch_type, planned_at FROM punch_plans WHERE punch_date BETWEEN ? AND ?"
+        params = [start.isoformat(), end.isoformat()]
+        if account is not None:
+            sql += " AND account = ?"
+            params.append(account)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY punch_date, account, punch_type", params).fetchall()
+        return [(account, date.fromisoformat(day), punch_type, datetime.fromisoformat(planned_at))
+                for account, day, punch_type, planned_at in rows]
+
+    def mark(self, keys: Iterable[Tuple[str, date, int]], status: str, completed_at: Optional[datetime] = None) -> int:
+        """Set the job state of (account, punch_date, punch_type) rows in one transaction"""
+        completed = _timestamp(completed_at or datetime.now())
+        params = [(status, completed, account, day.isoformat(), punch_type) for account, day, punch_type in keys]
+        with self._lock:
+            cursor = self._conn.executemany(
+                "UPDATE punch_plans SET status = ?, completed_at = ? "
+                "WHERE account = ? AND punch_date = ? AND punch_type = ?", params)
+            self._conn.commit()
+        return cursor.rowcount
+
+    def unresolved_until(self, end: datetime) -> List[PlanRow]:
+        """Rows still unfinished with planned_at <= end - an index range, however long the history"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT account, punch_date, punch_type, planned_at FROM punch_plans "
+                "WHERE status IN (?, ?) AND planned_at <= ? ORDER BY planned_at",
+                (PLANNED, RUNNING, _timestamp(end))
+            ).fetchall()
+        return [(account, date.fromisoformat(day), punch_type, datetime.fromisoformat(planned_at))
+                for account, day, punch_type, planned_at in rows]
+
+    def delete_from(self, accounts: Iterable[str], start: date) -> int:
+        """Drop plans on or after `start` for the given accounts"""
+        params = [(account, start.isoformat()) for account in accounts]
+        with self._lock:
+            cursor = self._conn.executemany(
+                "DELETE FROM punch_plans WHERE account = ? AND punch_date >= ?", params)
+            self._conn.commit()
+        return cursor.rowcount
+
+
+def plan_days(start: date, count: int) -> List[date]:
+    """`count` consecutive days starting at `start`"""
+    return [start + timedelta(days=offset) for offset in range(max(1, count))]
@@ -0,0 +1,182 @@
+import heapq
+import itertools
+import logging
+import select
+import socket
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+
+class ScheduledJob:
+    """A one-shot job in the deadline heap.
+
+    `func` is called with the job itself, so it can read `last_planned`.
+    """
+
+    def __init__(self, job_id: str, func: Callable[["ScheduledJob"], None], next_run: datetime):
+        self.job_id = job_id
+        self.func = func
+        self.next_run = next_run
+        self.cancelled = False
+        self.last_planned = None
+        self.last_fired = None
+        self.last_drift = None
+
+    def __repr__(self):
+        return f"ScheduledJob({self.job_id!r}, next_run={self.next_run})"
+
+
+class DeadlineScheduler:
+    """Heap of upcoming jobs that sleeps exactly until the next deadline.
+
+    `wake()` is safe to call from signal handlers and other threads; it
+    interrupts `wait_for_next()` through a socket pair so the main loop can
+    react to shutdown and reload requests immediately.
+    """
+
+    def __init__(self, now: Callable[[], datetime] = datetime.now, logger: Optional[logging.Logger] = None):
+        self.now = now
+        self.logger = logger or logging.getLogger(__name__)
+        self._heap = []
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.RLock()
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+
+    def _push(self, job: ScheduledJob) -> None:
+        heapq.heappush(self._heap, (job.next_run, next(self._sequence), job))
+
+    def add_job(self, job: ScheduledJob) -> ScheduledJob:
+        """Add (or replace) a job keyed by its job_id"""
+        with self._lock:
+            previous = self._jobs.get(job.job_id)
+            if previous is not None:
+                previous.cancelled = True
+            self._jobs[job.job_id] = job
+            earliest = self._heap[0][0] if self._heap else None
+            self._push(job)
+        # The sleeper only needs interrupting when its deadline moved earlier
+        if earliest is None or job.next_run < earliest:
+            self.wake()
+        return job
+
+    def run_at(self, job_id: str, when: datetime, func: Callable[[ScheduledJob], None]) -> ScheduledJob:
+        """Schedule `func` once at `when`"""
+        return self.add_job(ScheduledJob(job_id, func, when))
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job; its heap entry is discarded lazily"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return False
+            job.cancelled = True
+        self.wake()
+        return True
+
+    def clear(self) -> None:
+        """Cancel every job"""
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancelled = True
+            self._jobs.clear()
+            self._heap = []
+        self.wake()
+
+    def get_job(self, job_id: str) -> Optional[ScheduledJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[ScheduledJob]:
+        """Active jobs ordered by next run time"""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.next_run)
+
+    def _discard_stale(self) -> None:
+        # Heap entries whose job was cancelled or rescheduled are dropped lazily
+        while self._heap:
+            planned, _, job = self._heap[0]
+            if job.cancelled or planned != job.next_run:
+                heapq.heappop(self._heap)
+            else:
+                break
+
+    def next_run(self) -> Optional[datetime]:
+        """Deadline of the earliest active job"""
+        with self._lock:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now: datetime) -> List[ScheduledJob]:
+        due = []
+        with self._lock:
+            self._discard_stale()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, job = heapq.heappop(self._heap)
+                due.append(job)
+                self._discard_stale()
+        return due
+
+    def _finish(self, job: ScheduledJob) -> None:
+        with self._lock:
+            if not job.cancelled:
+                self._jobs.pop(job.job_id, None)
+
+    def run_pending(self) -> int:
+        """Run every job whose deadline has passed; returns how many ran"""
+        count = 0
+        for job in self._pop_due(self.now()):
+            if job.cancelled:
+                continue
+            fired_at = self.now()
+            job.last_planned = job.next_run
+            job.last_fired = fired_at
+            job.last_drift = (fired_at - job.next_run).total_seconds()
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info(f"[SCHEDULE] {job.job_id} fired (planned {job.next_run.strftime('%H:%M:%S')}, "
+                                 f"drift {job.last_drift:+.3f}s)")
+            try:
+                job.func(job)
+            except Exception as e:
+                self.logger.error(f"[SCHEDULE] {job.job_id} raised exception: {str(e)}")
+            self._finish(job)
+            count += 1
+        return count
+
+    def seconds_until_next(self) -> Optional[float]:
+        deadline = self.next_run()
+        if deadline is None:
+            return None
+        return max(0.0, (deadline - self.now()).total_seconds())
+
+    def wait_for_next(self, max_seconds: Optional[float] = None) -> None:
+        """Sleep until the next deadline, `max_seconds`, or an explicit wake-up"""
+        timeout = self.seconds_until_next()
+        if max_seconds is not None:
+            timeout = max_seconds if timeout is None else min(timeout, max_seconds)
+        if timeout == 0:
+            return
+        readable, _, _ = select.select([self._wake_reader], [], [], timeout)
+        if readable:
+            self._drain_wakeups()
+
+    def _drain_wakeups(self) -> None:
+        try:
+            while self._wake_reader.recv(1024):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def wake(self) -> None:
+        """Interrupt a pending wait_for_next() - signal and thread safe"""
+        try:
+            self._wake_writer.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            # Buffer full means a wake-up is already pending
+            pass
+
+    def close(self) -> None:
+        self._wake_reader.close()
+        self._wake_writer.close()
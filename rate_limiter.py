@@ -0,0 +1,127 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from metrics import RATE_LIMIT_REJECTED, RATE_LIMIT_WAIT
+
+# Requests per second and burst size per HR endpoint; a null rate disables that limiter
+DEFAULT_RATE_LIMITS = {
+    "punch": {"rate_per_second": 10.0, "burst": 20},
+    "refresh": {"rate_per_second": 2.0, "burst": 5},
+    "preflight": {"rate_per_second": 5.0, "burst": 10}
+}
+
+
+class TokenBucket:
+    """Token bucket that hands out evenly spaced slots instead of failing.
+
+    `acquire` reserves the next token even when the bucket is empty - the
+    balance goes negative - and sleeps until that token has accrued, so a
+    burst of callers leaves at exactly `rate` per second in arrival order.
+    A caller whose slot would lie beyond its `max_wait` is refused without
+    taking one.
+    """
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.updated = clock()
+        self.requests = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """Take the next slot; seconds to wait for it, or None if that is longer than `max_wait`"""
+        with self._lock:
+            self._refill(self.clock())
+            wait = max(0.0, (1.0 - self.tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                self.rejected += 1
+                return None
+            self.tokens -= 1.0
+            self.requests += 1
+            if wait > 0:
+                self.delayed += 1
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+            return wait
+
+    def acquire(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """Block until a request may go out; seconds waited, or None when refused"""
+        wait = self.reserve(max_wait)
+        if wait:
+            self.sleep(wait)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "requests": self.requests,
+                "delayed": self.delayed,
+                "rejected": self.rejected,
+                "wait_total_seconds": round(self.wait_total, 3),
+                "wait_mean_seconds": round(self.wait_total / self.requests, 3) if self.requests else 0.0,
+                "wait_max_seconds": round(self.wait_max, 3)
+            }
+
+
+# Process-wide buckets keyed by endpoint and settings, shared by every account
+_buckets_lock = threading.Lock()
+_buckets: Dict[tuple, TokenBucket] = {}
+
+
+def rate_limit_settings(service_settings: Dict[str, Any], endpoint: str) -> Dict[str, Any]:
+    """service_settings.rate_limits.<endpoint> merged over the defaults"""
+    return dict(DEFAULT_RATE_LIMITS.get(endpoint, {}), **service_settings.get("rate_limits", {}).get(endpoint, {}))
+
+
+def get_rate_limiter(service_settings: Dict[str, Any], endpoint: str) -> Optional[TokenBucket]:
+    """The bucket shared by every request to `endpoint` in this process, or None when unlimited"""
+    settings = rate_limit_settings(service_settings, endpoint)
+    if not settings.get("rate_per_second"):
+        return None
+    key = (endpoint, settings["rate_per_second"], settings.get("burst", 1))
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket(key[1], key[2])
+        return bucket
+
+
+def throttle(service_settings: Dict[str, Any], endpoint: str, max_wait: Optional[float] = None) -> bool:
+    """Wait for the endpoint's rate limit and record the wait; False if it would exceed `max_wait`"""
+    bucket = get_rate_limiter(service_settings, endpoint)
+    if bucket is None:
+        return True
+    wait = bucket.acquire(max_wait)
+    if wait is None:
+        RATE_LIMIT_REJECTED.inc(endpoint=endpoint)
+        return False
+    RATE_LIMIT_WAIT.observe(wait, endpoint=endpoint)
+    return True
+
+
+def reset_rate_limiters() -> None:
+    """Forget every bucket and its statistics"""
+    with _buckets_lock:
+        _buckets.clear()
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    """Wait statistics per endpoint, for sizing the limits"""
+    with _buckets_lock:
+        buckets = list(_buckets.items())
+    return {endpoint: bucket.stats() for (endpoint, _, _), bucket in buckets}
@@ -0,0 +1,146 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import date
+from typing import Any, Callable, Dict, Optional
+
+from punch_ledger import DEFAULT_LEDGER_FILE, apply_journal_mode
+from punch_plan import PLANNED, RUNNING
+
+DEFAULT_COORDINATION_SETTINGS = {
+    "enabled": False,
+    "lease_seconds": 15,
+    "renew_seconds": 5,
+    "replica_id": None
+}
+
+LEADER_LEASE = "leader"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS replica_leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    fence INTEGER NOT NULL,
+    acquired_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def coordination_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """service_settings.coordination merged over the defaults"""
+    settings = dict(DEFAULT_COORDINATION_SETTINGS, **config.get("service_settings", {}).get("coordination", {}))
+    # Renewing less often than the lease lasts would let it lapse between renewals
+    settings["renew_seconds"] = min(settings["renew_seconds"], settings["lease_seconds"] / 2)
+    return settings
+
+
+def default_replica_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class ReplicaLease:
+    """Leader lease with a fencing token, kept in the SQLite file every replica shares.
+
+    The replica holding an unexpired lease runs the punches; the others stay
+    on standby and take over once it lapses. Each change of holder bumps
+    `fence`, and plan rows are only claimed while the claimant's fence is
+    still current, in the same statement - so a replica that lost the lease
+    without noticing (paused, partitioned) cannot start a punch.
+    Times are epoch seconds from `clock`; hosts need clocks synced well
+    within lease_seconds.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_LEDGER_FILE, replica_id: Optional[str] = None,
+                 lease_seconds: float = 15, clock: Callable[[], float] = time.time, name: str = LEADER_LEASE,
+                 journal_mode: str = "DELETE"):
+        self.db_path = db_path
+        self.replica_id = replica_id or default_replica_id()
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+        self.name = name
+        self.fence: Optional[int] = None
+        self.expires_at = 0.0
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Autocommit, so BEGIN IMMEDIATE below is the only transaction
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10, isolation_level=None)
+        # Replicas on other hosts open the same file, so no WAL (see punch_ledger.ledger_journal_mode)
+        apply_journal_mode(self._conn, journal_mode)
+        self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def acquire(self) -> Optional[int]:
+        """Take or renew the lease; the current fence while held, None while another replica holds it"""
+        now = self.clock()
+        expires_at = now + self.lease_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT holder, fence, expires_at FROM replica_leases WHERE name = ?",
+                                         (self.name, )).fetchone()
+                if row is None:
+                    fence = 1
+                    self._conn.execute("INSERT INTO replica_leases (name, holder, fence, acquired_at, expires_at) "
+                                       "VALUES (?, ?, ?, ?, ?)", (self.name, self.replica_id, fence, now, expires_at))
+                elif row[0] == self.replica_id and row[1] == self.fence and row[2] > now:
+                    fence = row[1]
+                    self._conn.execute("UPDATE replica_leases SET expires_at = ? WHERE name = ?", (expires_at, self.name))
+                elif row[2] <= now:
+                    fence = row[1] + 1
+                    self._conn.execute("UPDATE replica_leases SET holder = ?, fence = ?, acquired_at = ?, expires_at = ? "
+                                       "WHERE name = ?", (self.replica_id, fence, now, expires_at, self.name))
+                else:
+                    fence = None
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.fence = fence
+        self.expires_at = expires_at if fence is not None else 0.0
+        return fence
+
+    def release(self) -> None:
+        """Expire our lease now so a standby takes over without waiting it out"""
+        if self.fence is None:
+            return
+        with self._lock:
+            self._conn.execute("UPDATE replica_leases SET expires_at = 0 WHERE name = ? AND holder = ? AND fence = ?",
+                               (self.name, self.replica_id, self.fence))
+        self.fence = None
+        self.expires_at = 0.0
+
+    def is_leader(self) -> bool:
+        """Local view: we hold the lease and it has not lapsed since the last renewal"""
+        return self.fence is not None and self.clock() < self.expires_at
+
+    def holder(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT holder, fence, acquired_at, expires_at FROM replica_leases WHERE name = ?",
+                                     (self.name, )).fetchone()
+        return dict(zip(("holder", "fence", "acquired_at", "expires_at"), row)) if row else None
+
+    def claim_plan(self, account: str, day: date, punch_type: int) -> bool:
+        """Mark a plan row running under our fence; False if it is taken or our lease is no longer current.
+
+        A row left running under an older fence belonged to a replica that
+        lost its lease mid-punch, so it may be claimed again.
+        """
+        if self.fence is None:
+            return False
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE punch_plans SET status = ?, fence = ? "
+                "WHERE account = ? AND punch_date = ? AND punch_type = ? "
+                "AND (status = ? OR (status = ? AND COALESCE(fence, 0) < ?)) "
+                "AND EXISTS (SELECT 1 FROM replica_leases WHERE name = ? AND holder = ? AND fence = ? AND expires_at > ?)",
+                (RUNNING, self.fence, account, day.isoformat(), punch_type, PLANNED, RUNNING, self.fence,
+                 self.name, self.replica_id, self.fence, self.clock()))
+        return cursor.rowcount == 1
@@ -0,0 +1,135 @@
+import json
+import re
+from typing import Any, Optional
+
+SUCCESS = "success"
+AUTH_EXPIRED = "auth_expired"
+REDIRECT_TO_LOGIN = "redirect_to_login"
+SERVER_ERROR = "server_error"
+OTHER = "other"
+
+# Outcomes that mean the session cookies need refreshing
+AUTH_OUTCOMES = (AUTH_EXPIRED, REDIRECT_TO_LOGIN)
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Structured error fields the HR backend uses; a non-empty value means the request was rejected
+ERROR_FIELDS = ("Error", "error", "errors", "Errors", "ErrorMessage", "error_description")
+
+AUTH_ERROR_PATTERN = re.compile(
+    r"unauthori[sz]ed|expired|invalid[ _-]?token|authentication|login[ _-]?required|"
+    r"session|access[ _-]?denied|forbidden",
+    re.IGNORECASE
+)
+LOGIN_LOCATION_PATTERN = re.compile(r"login|auth|sso", re.IGNORECASE)
+
+
+class ResponseOutcome:
+    """Classified punch response - the body is decoded exactly once"""
+
+    __slots__ = ("kind", "status_code", "data", "reason")
+
+    def __init__(self, kind: str, status_code: int, data: Any = None, reason: Optional[str] = None):
+        self.kind = kind
+        self.status_code = status_code
+        self.data = data
+        self.reason = reason
+
+    @property
+    def success(self) -> bool:
+        return self.kind == SUCCESS
+
+    @property
+    def auth_failed(self) -> bool:
+        return self.kind in AUTH_OUTCOMES
+
+    def __repr__(self):
+        return f"ResponseOutcome({self.kind!r}, status_code={self.status_code}, reason={self.reason!r})"
+
+
+def _flatten_text(value: Any) -> str:
+    """Join the string leaves of a structured error value"""
+    if value is None or value is False:
+        return ""
+    if isinstance(value, dict):
+        return " ".join(filter(None, (_flatten_text(item) for item in value.values())))
+    if isinstance(value, (list, tuple)):
+        return " ".join(filter(None, (_flatten_text(item) for item in value)))
+    return str(value)
+
+
+def structured_error(data: Any) -> Optional[str]:
+    """Text of the first non-empty known error field in a decoded JSON body"""
+    if not isinstance(data, dict):
+        return None
+    for field in ERROR_FIELDS:
+        text = _flatten_text(data.get(field))
+        if text:
+            return text
+    return None
+
+
+def _login_redirect(response) -> Optional[str]:
+    for hop in list(getattr(response, "history", None) or []) + [response]:
+        if hop.status_code in REDIRECT_STATUSES:
+            location = hop.headers.get("location", "")
+            if LOGIN_LOCATION_PATTERN.search(location):
+                return location
+    return None
+
+
+def _decode_body(response) -> Any:
+    content_type = response.headers.get("content-type", "")
+    text = response.text
+    if "json" in content_type or text[:1] in ("{", "["):
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    return text
+
+
+def classify_response(response) -> ResponseOutcome:
+    """Classify a punch response as success, auth_expired, redirect_to_login, server_error or other.
+
+    Order: status line and redirects, then known structured error fields,
+    and only for non-2xx bodies without them the precompiled free-text
+    matcher - a successful body mentioning "session" is still a success.
+    A 401 always means the session expired; a 403 only when its JSON body
+    says so, since a WAF block is a 403 as well.
+    """
+    status = response.status_code
+
+    location = _login_redirect(response)
+    if location is not None:
+        return ResponseOutcome(REDIRECT_TO_LOGIN, status, reason=f"Redirected to {location}")
+
+    if status == 401:
+        return ResponseOutcome(AUTH_EXPIRED, status, _decode_body(response), f"HTTP {status}")
+
+    data = _decode_body(response)
+
+    if status == 403:
+        # A WAF block (Incapsula's HTML page) is also a 403; refreshing cookies and retrying would only
+        # hit the block again, so only a JSON body that names the session counts as an expired cookie
+        if not isinstance(data, str):
+            text = structured_error(data) or json.dumps(data, ensure_ascii=False)
+            if AUTH_ERROR_PATTERN.search(text):
+                return ResponseOutcome(AUTH_EXPIRED, status, data, f"HTTP 403: {text[:200]}")
+        return ResponseOutcome(OTHER, status, data, f"HTTP 403: {response.text[:200]}")
+
+    if status >= 500:
+        return ResponseOutcome(SERVER_ERROR, status, data, f"HTTP {status}: {response.text}")
+
+    error_text = structured_error(data)
+    if error_text:
+        kind = AUTH_EXPIRED if AUTH_ERROR_PATTERN.search(error_text) else OTHER
+        return ResponseOutcome(kind, status, data, error_text)
+
+    if 200 <= status < 300:
+        return ResponseOutcome(SUCCESS, status, data)
+
+    text = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    if AUTH_ERROR_PATTERN.search(text):
+        return ResponseOutcome(AUTH_EXPIRED, status, data, f"HTTP {status}: {text[:200]}")
+    return ResponseOutcome(OTHER, status, data, f"HTTP {status}: {text}")
@@ -0,0 +1,184 @@
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRY_SETTINGS = {
+    "backoff_base_seconds": 1.0,
+    "backoff_max_seconds": 30.0,
+    "jitter": True,
+    "punch_deadline_seconds": 120,
+    "budget_ratio": 0.2,
+    "budget_capacity": 10
+}
+
+DEFAULT_CIRCUIT_BREAKER_SETTINGS = {
+    "failure_threshold": 5,
+    "reset_timeout_seconds": 60
+}
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by a per-punch deadline"""
+
+    def __init__(self, max_retries: int = 2, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 jitter: bool = True, deadline_seconds: Optional[float] = None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.deadline_seconds = deadline_seconds
+
+    @classmethod
+    def from_settings(cls, service_settings: Dict[str, Any], max_retries: Optional[int] = None) -> "RetryPolicy":
+        retry = dict(DEFAULT_RETRY_SETTINGS, **service_settings.get("retry", {}))
+        if max_retries is None:
+            max_retries = service_settings.get("max_retries", 2)
+        return cls(
+            max_retries=max_retries,
+            backoff_base=retry["backoff_base_seconds"],
+            backoff_max=retry["backoff_max_seconds"],
+            jitter=retry["jitter"],
+            deadline_seconds=retry["punch_deadline_seconds"]
+        )
+
+    def backoff(self, retry_number: int) -> float:
+        """Delay before the given retry (1 = first retry)"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** max(0, retry_number - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def wait_before_retry(self, retry_number: int, budget: "RetryBudget", deadline: Optional[float]) -> Optional[str]:
+        """Back off before a retry; returns the reason to stop retrying, or None"""
+        delay = self.backoff(retry_number)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return "punch deadline exceeded"
+        if not budget.try_spend():
+            return "retry budget exhausted"
+        if delay > 0:
+            time.sleep(delay)
+        return None
+
+    def start_deadline(self) -> Optional[float]:
+        """Monotonic deadline for a punch starting now"""
+        if not self.deadline_seconds:
+            return None
+        return time.monotonic() + self.deadline_seconds
+
+
+class RetryBudget:
+    """Retry tokens shared across accounts.
+
+    Every first attempt deposits `ratio` tokens (up to `capacity`) and every
+    retry spends one, so retries stay a bounded fraction of total traffic
+    even when the backend fails for everyone at once.
+    """
+
+    def __init__(self, ratio: float = 0.2, capacity: float = 10):
+        self.ratio = ratio
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            self.denied += 1
+            return False
+
+
+class CircuitBreaker:
+    """Trips after consecutive backend failures, fails fast, then lets one probe through"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Whether a request may go out now; in half-open state only one probe is allowed"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                logger.warning("[CIRCUIT] Circuit breaker half-open - probing HR backend")
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.warning("[CIRCUIT] Circuit breaker closed - HR backend recovered")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"[CIRCUIT] Circuit breaker open after {self._failures} consecutive "
+                                   f"backend failures - failing fast for {self.reset_timeout}s")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+# Process-wide instances keyed by their settings, shared by every account using them
+_shared_lock = threading.Lock()
+_shared_budgets: Dict[tuple, RetryBudget] = {}
+_shared_breakers: Dict[tuple, CircuitBreaker] = {}
+
+
+def get_retry_budget(service_settings: Dict[str, Any]) -> RetryBudget:
+    """Get the retry budget shared by every punch in this process"""
+    retry = dict(DEFAULT_RETRY_SETTINGS, **service_settings.get("retry", {}))
+    key = (retry["budget_ratio"], retry["budget_capacity"])
+    with _shared_lock:
+        budget = _shared_budgets.get(key)
+        if budget is None:
+            budget = _shared_budgets[key] = RetryBudget(*key)
+        return budget
+
+
+def get_circuit_breaker(service_settings: Dict[str, Any]) -> CircuitBreaker:
+    """Get the circuit breaker guarding the HR backend"""
+    settings = dict(DEFAULT_CIRCUIT_BREAKER_SETTINGS, **service_settings.get("circuit_breaker", {}))
+    key = (settings["failure_threshold"], settings["reset_timeout_seconds"])
+    with _shared_lock:
+        breaker = _shared_breakers.get(key)
+        if breaker is None:
+            breaker = _shared_breakers[key] = CircuitBreaker(*key)
+        return breaker
@@ -0,0 +1,222 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTROL_SOCKET = "attendance_service.sock"
+MAX_REQUEST_BYTES = 64 * 1024
+
+# A handler gets the decoded request and returns a JSON-serialisable result
+Handler = Callable[[Dict[str, Any]], Any]
+
+
+class ControlError(Exception):
+    """A control command was rejected; the message is sent back to the client"""
+
+
+def control_socket_path(config: Dict[str, Any]) -> Optional[str]:
+    """service_settings.control_socket - null disables the socket"""
+    return config.get("service_settings", {}).get("control_socket", DEFAULT_CONTROL_SOCKET)
+
+
+class _ControlRequestHandler(socketserver.StreamRequestHandler):
+    """One JSON request per line, one JSON response per line"""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline(MAX_REQUEST_BYTES)
+            if not line.strip():
+                return
+            self.wfile.write(json.dumps(self.server.dispatch(line), default=str).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, handlers: Dict[str, Handler]):
+        self.handlers = handlers
+        super().__init__(path, _ControlRequestHandler)
+
+    def dispatch(self, line: bytes) -> Dict[str, Any]:
+        try:
+            request = json.loads(line)
+            command = request.get("command")
+            handler = self.handlers.get(command)
+            if handler is None:
+                raise ControlError(f"Unknown command {command!r} (expected one of: {', '.join(sorted(self.handlers))})")
+            return {"ok": True, "result": handler(request)}
+        except (ControlError, ValueError, AttributeError) as e:
+            return {"ok": False, "error": str(e)}
+        except Exception as e:
+            logger.error(f"Control command failed: {e}")
+            return {"ok": False, "error": f"Internal error: {e}"}
+
+
+def _clear_stale_socket(path: str) -> None:
+    """Remove a socket file left by a crashed service; refuse if one is still listening"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(f"Control socket {path} is already in use by another service")
+
+
+def start_control_server(path: str, handlers: Dict[str, Handler]) -> socketserver.BaseServer:
+    """Serve control commands on a Unix socket (owner-only) from a daemon thread"""
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("Unix domain sockets are not supported on this platform")
+    _clear_stale_socket(path)
+    server = _ControlServer(path, handlers)
+    os.chmod(path, 0o600)
+    threading.Thread(target=server.serve_forever, name="control-socket", daemon=True).start()
+    return server
+
+
+def stop_control_server(server: socketserver.BaseServer) -> None:
+    server.shutdown()
+    server.server_close()
+    try:
+        os.remove(server.server_address)
+    except OSError:
+        pass
+
+
+def send_command(path: str, command: str, timeout: float = 5.0, **args) -> Any:
+    """Send one command to a running service and return its result (raises ControlError on rejection)"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(path)
+        client.sendall(json.dumps(dict(args, command=command)).encode("utf-8") + b"\n")
+        response = b""
+        while not response.endswith(b"\n"):
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            response += chunk
+    reply = json.loads(response)
+    if not reply.get("ok"):
+        raise ControlError(reply.get("error", "Unknown error"))
+    return reply["result"]
+
+
+def _default_socket_path() -> str:
+    # Plain json keeps the client fast - manual_punch pulls in requests
+    try:
+        with open("config.json", "r", encoding="utf-8") as f:
+            return control_socket_path(json.load(f)) or DEFAULT_CONTROL_SOCKET
+    except (OSError, ValueError):
+        return DEFAULT_CONTROL_SOCKET
+
+
+def print_status(status: Dict[str, Any]) -> None:
+    print(f"Status: Running (PID: {status['pid']}, up {status['uptime_seconds'] / 3600:.1f} hours)")
+    print(f"Accounts: {status['accounts']}  Scheduled jobs: {status['jobs']}  In flight: {status['in_flight']}")
+    if status.get("next_job"):
+        print(f"Next job: {status['next_job']['job_id']} at {status['next_job']['next_run']}")
+    if status.get("reload_pending"):
+        print("Reload: pending")
+    replica = status.get("replica")
+    if replica:
+        lease = replica.get("lease") or {}
+        role = "leader" if replica["leader"] else "standby"
+        print(f"Replica: {replica['replica_id']} ({role}; lease held by {lease.get('holder')}, fence {lease.get('fence')})")
+    recovery = status.get("recovery") or {}
+    if recovery.get("caught_up") or recovery.get("missed"):
+        print(f"Start-up recovery: {recovery['caught_up']} punch(es) caught up, {recovery['missed']} missed")
+    for endpoint, stats in (status.get("rate_limits") or {}).items():
+        if stats["delayed"] or stats["rejected"]:
+            print(f"Rate limit {endpoint}: {stats['delayed']}/{stats['requests']} delayed "
+                  f"(max wait {stats['wait_max_seconds']}s), {stats['rejected']} rejected")
+    failures = {name: count for name, count in status.get("cookie_failures", {}).items() if count}
+    if failures:
+        print("Cookie failures: " + ", ".join(f"{name}={count}" for name, count in failures.items()))
+
+
+def print_jobs(jobs: Dict[str, Any]) -> None:
+    if not jobs:
+        print("No upcoming jobs")
+    for name, entries in jobs.items():
+        print(f"{name}:")
+        for job in entries:
+            print(f"  {job['next_run']}  {job['type']}")
+
+
+def print_last(results: Dict[str, Any]) -> None:
+    for name, result in results.items():
+        if result is None:
+            print(f"{name:<16}  no punches recorded")
+            continue
+        outcome = "OK" if result["success"] else f"FAIL {result.get('error') or ''}".strip()
+        print(f"{name:<16}  {result['type']:<8}  {result['at']}  {outcome}")
+
+
+def main() -> int:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--socket", help="control socket path (default: service_settings.control_socket)")
+    common.add_argument("--json", action="store_true", help="print the raw JSON result")
+    common.add_argument("--timeout", type=float, default=5.0)
+    parser = argparse.ArgumentParser(description="Query or control a running attendance service")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", parents=[common], help="service health and next job")
+    jobs = commands.add_parser("jobs", parents=[common], help="upcoming punches per account")
+    jobs.add_argument("account", nargs="?")
+    jobs.add_argument("--limit", type=int, default=10, help="jobs per account")
+    last = commands.add_parser("last", parents=[common], help="last punch result per account")
+    last.add_argument("account", nargs="?")
+    punch = commands.add_parser("punch", parents=[common], help="punch now through the service's worker pool")
+    punch.add_argument("type", choices=["checkin", "checkout", "in", "out", "1", "2"])
+    punch.add_argument("account", nargs="?")
+    punch.add_argument("--wait", action="store_true", help="wait for the punch result")
+    commands.add_parser("reload", parents=[common], help="reload configuration (same as SIGHUP)")
+    args = parser.parse_args()
+
+    request = {key: value for key, value in vars(args).items()
+               if key not in ("socket", "json", "timeout", "command") and value is not None}
+    timeout = max(args.timeout, 150.0) if getattr(args, "wait", False) else args.timeout
+    try:
+        result = send_command(args.socket or _default_socket_path(), args.command, timeout=timeout, **request)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print("Status: Not running (control socket not available)")
+        return 3
+    except socket.timeout:
+        print("Status: Not responding (control socket timed out)")
+        return 2
+    except ControlError as e:
+        print(f"Error: {e}")
+        return 1
+
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    elif args.command == "status":
+        print_status(result)
+    elif args.command == "jobs":
+        print_jobs(result)
+    elif args.command == "last":
+        print_last(result)
+    elif args.command == "punch":
+        if "result" in result:
+            outcome = "successful" if result["result"]["success"] else f"failed: {result['result'].get('error')}"
+            print(f"{result['account']}: {result['type']} {outcome}")
+            return 0 if result["result"]["success"] else 1
+        print(f"{result['account']}: {result['type']} queued")
+    else:
+        print("Reload requested")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,7 @@ SERVICE_NAME="attendance_service"
 PYTHON_SCRIPT="attendance_service.py"
 PID_FILE="attendance_service.pid"  # Windows compatible path
 LOG_FILE="logs/attendance_service.log"
+ERROR_FILE="logs/attendance_service.err"  # Start-up errors and tracebacks only; LOG_FILE is written and rotated by the service
 
 # Create logs directory
 mkdir -p logs
@@ -31,8 +32,9 @@ if [ -f "$PID_FILE" ]; then
     fi
 fi
 
-# Start service in background
-nohup python "$PYTHON_SCRIPT" > "$LOG_FILE" 2>&1 &
+# Start service in background; console logging duplicates LOG_FILE, so stdout is discarded
+# instead of growing an unrotated file - only stderr (crashes before logging is up) is kept
+nohup python "$PYTHON_SCRIPT" > /dev/null 2> "$ERROR_FILE" &
 SERVICE_PID=$!
 
 # Wait a moment to confirm service startup
@@ -50,6 +52,6 @@ if tasklist /FI "PID eq $SERVICE_PID" 2>/dev/null | grep -q "$SERVICE_PID"; then
     echo "  Stop service: ./stop_service.sh"
     echo "  Reload config: kill -HUP $SERVICE_PID"
 else
-    echo "❌ Service startup failed, please check logs: $LOG_FILE"
+    echo "❌ Service startup failed, please check logs: $ERROR_FILE"
     exit 1
 fi 
\ No newline at end of file
@@ -7,8 +7,17 @@ LOG_FILE="logs/attendance_service.log"
 echo "📊 Attendance Service Status Check"
 echo "=================================="
 
-# Check PID file
-if [ -f "$PID_FILE" ]; then
+# Ask the running service over its control socket first - answers in milliseconds
+if STATUS=$(python service_control.py status 2>/dev/null); then
+    echo "$STATUS"
+    echo ""
+    echo "Upcoming punches (as generated by the service):"
+    python service_control.py jobs --limit 4
+    echo ""
+    echo "Last punch per account:"
+    python service_control.py last
+# Fall back to the PID file when the control socket is unavailable
+elif [ -f "$PID_FILE" ]; then
     PID=$(cat "$PID_FILE")
     echo "PID file: $PID_FILE (PID: $PID)"
     
@@ -39,11 +48,6 @@ else
     fi
 fi
 
-echo ""
-echo "Schedule information:"
-echo "- Punch-in: Monday to Friday 09:10-09:20 (random)"
-echo "- Punch-out: Monday to Friday 18:10-18:30 (guaranteed 9 hours)"
-
 # Check log file
 echo ""
 if [ -f "$LOG_FILE" ]; then
@@ -64,4 +68,5 @@ echo "Management commands:"
 echo "- Start service: ./start_service.sh"
 echo "- Stop service: ./stop_service.sh"
 echo "- View full logs: tail -f $LOG_FILE"
-echo "- Reload config: kill -HUP <PID>" 
\ No newline at end of file
+echo "- Reload config: python service_control.py reload (or kill -HUP <PID>)"
+echo "- Punch now: python service_control.py punch checkin <account>" 
\ No newline at end of file
@@ -2,6 +2,7 @@
 
 # Configuration variables
 PID_FILE="attendance_service.pid"  # Windows compatible path
+STOP_TIMEOUT=130  # In-flight punches are recorded before exit: punch_deadline_seconds (120) plus a margin
 
 echo "🛑 Stopping attendance service..."
 
@@ -37,13 +38,13 @@ echo "Sending TERM signal to process $PID..."
 taskkill /PID $PID /T
 
 # Wait for process to end
-for i in {1..10}; do
+for i in $(seq 1 $STOP_TIMEOUT); do
     if ! tasklist /FI "PID eq $PID" 2>/dev/null | grep -q "$PID"; then
         echo "✅ Service stopped gracefully"
         rm -f "$PID_FILE"
         exit 0
     fi
-    echo "Waiting for service to stop... ($i/10)"
+    echo "Waiting for service to stop... ($i/$STOP_TIMEOUT)"
     sleep 1
 done
 
@@ -0,0 +1,199 @@
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+DEFAULT_TRACING_SETTINGS = {
+    "enabled": False,
+    "file": "logs/punch_traces.jsonl"
+}
+
+# Finished traces (root span first) are handed to every sink; no sinks means tracing is off
+Sink = Callable[[List["Span"]], None]
+_sinks: List[Sink] = []
+_local = threading.local()
+_ids = itertools.count(1)
+
+
+class Span:
+    """One timed phase; spans opened inside it on the same thread become its children"""
+
+    __slots__ = ("name", "attrs", "span_id", "parent_id", "trace_id", "depth", "started_at",
+                 "start", "end", "_trace")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = next(_ids)
+        self.end = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end if self.end is not None else time.perf_counter()) - self.start) * 1000
+
+    def __enter__(self) -> "Span":
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        if stack:
+            parent = stack[-1]
+            self.parent_id, self.trace_id, self.depth, self._trace = parent.span_id, parent.trace_id, parent.depth + 1, parent._trace
+        else:
+            # Random, so traces from successive runs appended to one file never share an id
+            self.parent_id, self.trace_id, self.depth, self._trace = None, os.urandom(8).hex(), 0, []
+        self._trace.append(self)
+        stack.append(self)
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.end = time.perf_counter()
+        if exc_type is not None and exc_type is not SystemExit:
+            self.attrs["error"] = exc_type.__name__
+        _local.stack.pop()
+        if self.depth == 0:
+            for sink in list(_sinks):
+                sink(self._trace)
+        return False
+
+
+class _NoopSpan:
+    """What span() returns while tracing is off - entering and leaving it does nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attrs):
+    """Time a phase: `with span("http", attempt=1) as s: ...; s.set(status=200)`"""
+    if not _sinks:
+        return _NOOP_SPAN
+    return Span(name, attrs)
+
+
+def add_sink(sink: Sink) -> None:
+    _sinks.append(sink)
+
+
+def remove_sink(sink: Sink) -> None:
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def tracing_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """service_settings.tracing merged over the defaults"""
+    return dict(DEFAULT_TRACING_SETTINGS, **config.get("service_settings", {}).get("tracing", {}))
+
+
+class JsonLinesSink:
+    """Append every span of a finished trace to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, trace: List[Span]) -> None:
+        lines = "".join(json.dumps({
+            "trace_id": item.trace_id,
+            "span_id": item.span_id,
+            "parent_id": item.parent_id,
+            "name": item.name,
+            "start": round(item.started_at, 6),
+            "duration_ms": round(item.duration_ms, 3),
+            "attrs": item.attrs
+        }, default=str) + "\n" for item in trace)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _span_path(span_item: Span, by_id: Dict[int, Span]) -> str:
+    names = [span_item.name]
+    while span_item.parent_id is not None:
+        span_item = by_id[span_item.parent_id]
+        names.append(span_item.name)
+    return " > ".join(reversed(names))
+
+
+class ProfileReport:
+    """Collects traces for --profile and prints a per-phase breakdown.
+
+    A single trace is printed as a tree with each phase's share of the
+    total and its self time (time not covered by child phases); several
+    traces - a batch - are aggregated by phase path instead.
+    """
+
+    def __init__(self):
+        self.traces: List[List[Span]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, trace: List[Span]) -> None:
+        with self._lock:
+            self.traces.append(trace)
+
+    def print(self) -> None:
+        with self._lock:
+            traces = list(self.traces)
+        if not traces:
+            print("\nProfile: no spans recorded")
+        elif len(traces) == 1:
+            self.print_tree(traces[0])
+        else:
+            self.print_aggregate(traces)
+
+    @staticmethod
+    def _format_attrs(attrs: Dict[str, Any]) -> str:
+        return ", ".join(f"{key}={value}" for key, value in attrs.items())
+
+    def print_tree(self, trace: List[Span]) -> None:
+        total = trace[0].duration_ms or 1e-9
+        child_time: Dict[int, float] = {}
+        for item in trace:
+            if item.parent_id is not None:
+                child_time[item.parent_id] = child_time.get(item.parent_id, 0.0) + item.duration_ms
+        print(f"\nProfile ({total:.1f}ms total)")
+        print(f"{'phase':<40}  {'ms':>9}  {'self ms':>9}  {'share':>6}  details")
+        for item in trace:
+            label = "  " * item.depth + item.name
+            self_ms = max(0.0, item.duration_ms - child_time.get(item.span_id, 0.0))
+            print(f"{label:<40}  {item.duration_ms:>9.1f}  {self_ms:>9.1f}  {item.duration_ms / total:>6.1%}  "
+                  f"{self._format_attrs(item.attrs)}")
+
+    def print_aggregate(self, traces: List[List[Span]]) -> None:
+        durations: Dict[str, List[float]] = {}
+        for trace in traces:
+            by_id = {item.span_id: item for item in trace}
+            for item in trace:
+                durations.setdefault(_span_path(item, by_id), []).append(item.duration_ms)
+        print(f"\nProfile ({len(traces)} traces)")
+        print(f"{'phase':<56}  {'count':>6}  {'mean ms':>9}  {'p95 ms':>9}  {'max ms':>9}  {'total ms':>10}")
+        for path, values in sorted(durations.items()):
+            values.sort()
+            p95 = values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+            print(f"{path:<56}  {len(values):>6}  {sum(values) / len(values):>9.1f}  {p95:>9.1f}  "
+                  f"{values[-1]:>9.1f}  {sum(values):>10.1f}")
@@ -0,0 +1,276 @@
+import bisect
+import csv
+import json
+import os
+import threading
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+WEEKDAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DEFAULT_WORKDAYS = WEEKDAY_NAMES[:5]
+
+DEFAULT_CALENDAR_SETTINGS = {
+    "holiday_files": [],
+    "leave_file": None
+}
+
+# Markers for make-up workdays in CSV "type" columns and ICS summaries/categories
+WORKDAY_MARKERS = ("workday", "makeup", "make-up", "補班", "補行上班", "上班")
+
+
+def _parse_date(value: str) -> date:
+    value = value.strip()
+    if len(value) == 8 and value.isdigit():
+        return date(int(value[:4]), int(value[4:6]), int(value[6:]))
+    return date.fromisoformat(value.replace("/", "-")[:10])
+
+
+class IntervalIndex:
+    """Sorted, merged day ranges with O(log n) membership lookups"""
+
+    def __init__(self, intervals: Iterable[Tuple[date, date, str]] = ()):
+        merged: List[List[Any]] = []
+        for start, end, label in sorted((s.toordinal(), e.toordinal(), label) for s, e, label in intervals):
+            if merged and start <= merged[-1][1] + 1:
+                if end > merged[-1][1]:
+                    merged[-1][1] = end
+                if label and label not in merged[-1][2]:
+                    merged[-1][2] = f"{merged[-1][2]}, {label}" if merged[-1][2] else label
+            else:
+                merged.append([start, end, label or ""])
+        self._starts = [interval[0] for interval in merged]
+        self._intervals = [tuple(interval) for interval in merged]
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, IntervalIndex) and self._intervals == other._intervals
+
+    def lookup(self, day: date) -> Optional[str]:
+        """Label of the range containing `day` ("" when unnamed), or None"""
+        ordinal = day.toordinal()
+        position = bisect.bisect_right(self._starts, ordinal) - 1
+        if position >= 0 and self._intervals[position][1] >= ordinal:
+            return self._intervals[position][2]
+        return None
+
+    def __contains__(self, day: date) -> bool:
+        return self.lookup(day) is not None
+
+
+def _entry_range(entry: Any) -> Tuple[date, date, str]:
+    if isinstance(entry, str):
+        day = _parse_date(entry)
+        return day, day, ""
+    start = _parse_date(entry.get("start") or entry["date"])
+    end = _parse_date(entry["end"]) if entry.get("end") else start
+    return start, end, entry.get("name") or entry.get("reason") or ""
+
+
+def _is_workday_marker(value: str) -> bool:
+    value = (value or "").strip().lower()
+    return any(marker in value for marker in WORKDAY_MARKERS)
+
+
+def load_json_days(path: str) -> Tuple[List[Tuple[date, date, str]], List[Tuple[date, date, str]]]:
+    """{"holidays": [...], "makeup_workdays": [...]} or a plain list of holidays"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return [_entry_range(entry) for entry in data], []
+    return ([_entry_range(entry) for entry in data.get("holidays", [])],
+            [_entry_range(entry) for entry in data.get("makeup_workdays", [])])
+
+
+def load_csv_days(path: str) -> Tuple[List[Tuple[date, date, str]], List[Tuple[date, date, str]]]:
+    """CSV with date|start,end,name,type columns, or the government office calendar (西元日期, 是否放假, 備註)"""
+    holidays, workdays = [], []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            row = {(key or "").strip(): (value or "").strip() for key, value in row.items()}
+            if "西元日期" in row:
+                # The office calendar lists every day; only the exceptions to the plain week matter
+                day = _parse_date(row["西元日期"])
+                day_off = row.get("是否放假") == "2"
+                if day_off != (day.weekday() >= 5):
+                    (holidays if day_off else workdays).append((day, day, row.get("備註", "")))
+                continue
+            start = _parse_date(row.get("start") or row["date"])
+            end = _parse_date(row["end"]) if row.get("end") else start
+            target = workdays if _is_workday_marker(row.get("type", "")) else holidays
+            target.append((start, end, row.get("name", "")))
+    return holidays, workdays
+
+
+def _unfold_ics(text: str) -> List[str]:
+    lines = []
+    for line in text.splitlines():
+        if line[:1] in (" ", "\t") and lines:
+            lines[-1] += line[1:]
+        else:
+            lines.append(line)
+    return lines
+
+
+def _ics_date(params: str, value: str) -> Optional[date]:
+    """The day of an all-day DTSTART/DTEND (VALUE=DATE or a bare YYYYMMDD); None for timed values"""
+    value = value.strip()
+    if len(value) != 8 or not value.isdigit():
+        return None
+    kinds = [param[6:] for param in params.upper().split(";") if param.startswith("VALUE=")]
+    if kinds and kinds != ["DATE"]:
+        return None
+    return date(int(value[:4]), int(value[4:6]), int(value[6:]))
+
+
+def load_ics_days(path: str) -> Tuple[List[Tuple[date, date, str]], List[Tuple[date, date, str]]]:
+    """All-day VEVENTs; DTEND is exclusive. Summaries or categories like 補班 mark make-up workdays.
+
+    Timed events (a meeting on 20260210T090000Z, say) are ignored rather
+    than read as holidays.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        lines = _unfold_ics(f.read())
+    holidays, workdays = [], []
+    event = None
+    for line in lines:
+        if line == "BEGIN:VEVENT":
+            event = {}
+        elif line == "END:VEVENT" and event is not None:
+            start = _ics_date(*event["DTSTART"]) if "DTSTART" in event else None
+            if start is not None:
+                end = _ics_date(*event["DTEND"]) if "DTEND" in event else None
+                end = end - timedelta(days=1) if end is not None else start
+                summary = event.get("SUMMARY", ("", ""))[1]
+                marked = _is_workday_marker(summary) or _is_workday_marker(event.get("CATEGORIES", ("", ""))[1])
+                (workdays if marked else holidays).append((start, max(start, end), summary))
+            event = None
+        elif event is not None and ":" in line:
+            name, value = line.split(":", 1)
+            name, _, params = name.partition(";")
+            event[name.upper()] = (params, value.strip())
+    return holidays, workdays
+
+
+LOADERS = {".json": load_json_days, ".csv": load_csv_days, ".ics": load_ics_days}
+
+
+def load_leave(path: str) -> Dict[str, IntervalIndex]:
+    """{"account": ["2026-03-02", {"start": ..., "end": ..., "reason": ...}], "*": [...]}"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {account: IntervalIndex(_entry_range(entry) for entry in entries) for account, entries in data.items()}
+
+
+def _describe(kind: str, label: str) -> str:
+    return f"{kind} ({label})" if label else kind
+
+
+class WorkCalendar:
+    """Holidays, make-up workdays and per-account leave on top of the weekly workdays"""
+
+    def __init__(self, holidays: Optional[IntervalIndex] = None, makeup_workdays: Optional[IntervalIndex] = None,
+                 leave: Optional[Dict[str, IntervalIndex]] = None):
+        self.holidays = holidays or IntervalIndex()
+        self.makeup_workdays = makeup_workdays or IntervalIndex()
+        self.leave = leave or {}
+        self._no_leave = IntervalIndex()
+
+    def account_leave(self, account: str) -> Tuple[IntervalIndex, IntervalIndex]:
+        """(personal, everyone) leave indexes for an account"""
+        return self.leave.get(account, self._no_leave), self.leave.get("*", self._no_leave)
+
+    def day_status(self, account: str, day: date, weekdays: Iterable[int]) -> Tuple[bool, str]:
+        """(is a workday, reason) - leave beats make-up workdays, which beat holidays and weekdays"""
+        for index in self.account_leave(account):
+            label = index.lookup(day)
+            if label is not None:
+                return False, _describe("leave", label)
+        label = self.makeup_workdays.lookup(day)
+        if label is not None:
+            return True, _describe("make-up workday", label)
+        label = self.holidays.lookup(day)
+        if label is not None:
+            return False, _describe("holiday", label)
+        if day.weekday() in weekdays:
+            return True, "workday"
+        return False, "weekend"
+
+    def fingerprint(self, account: str) -> tuple:
+        """Everything that decides an account's days off - reload compares these"""
+        personal, everyone = self.account_leave(account)
+        return (self.holidays._intervals, self.makeup_workdays._intervals, personal._intervals, everyone._intervals)
+
+    def is_workday(self, account: str, day: date, weekdays: Iterable[int]) -> bool:
+        return self.day_status(account, day, weekdays)[0]
+
+    def next_workdays(self, account: str, start: date, count: int, weekdays: Iterable[int],
+                      limit_days: int = 366) -> List[date]:
+        """The next `count` effective workdays from `start` (inclusive)"""
+        days = []
+        day = start
+        while len(days) < count and (day - start).days < limit_days:
+            if self.is_workday(account, day, weekdays):
+                days.append(day)
+            day += timedelta(days=1)
+        return days
+
+
+def calendar_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(DEFAULT_CALENDAR_SETTINGS, **config.get("service_settings", {}).get("calendar", {}))
+
+
+_workday_numbers: Dict[Tuple[str, ...], frozenset] = {}
+
+
+def workday_numbers(config: Dict[str, Any]) -> frozenset:
+    """service_settings.workdays as weekday() numbers (checked once per punch, so memoised)"""
+    workdays = tuple(config.get("service_settings", {}).get("workdays", DEFAULT_WORKDAYS))
+    numbers = _workday_numbers.get(workdays)
+    if numbers is None:
+        numbers = _workday_numbers[workdays] = frozenset(WEEKDAY_NAMES.index(day.lower()) for day in workdays)
+    return numbers
+
+
+# Built calendars keyed by the calendar files, revalidated on (mtime, size)
+_calendar_cache: Dict[Tuple[str, ...], Tuple[tuple, WorkCalendar]] = {}
+_calendar_lock = threading.Lock()
+
+
+def _signature(paths: Iterable[str]) -> tuple:
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def get_calendar(config: Dict[str, Any]) -> WorkCalendar:
+    """The WorkCalendar for a config's calendar settings, rebuilt only when a file changes"""
+    settings = calendar_settings(config)
+    paths = tuple(settings["holiday_files"]) + ((settings["leave_file"], ) if settings["leave_file"] else ())
+    signature = _signature(paths)
+    cached = _calendar_cache.get(paths)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    with _calendar_lock:
+        holidays, makeup = [], []
+        for path in settings["holiday_files"]:
+            if not os.path.exists(path):
+                continue
+            loader = LOADERS.get(os.path.splitext(path)[1].lower())
+            if loader is None:
+                raise ValueError(f"Unsupported calendar file {path} (use .ics, .csv or .json)")
+            file_holidays, file_makeup = loader(path)
+            holidays.extend(file_holidays)
+            makeup.extend(file_makeup)
+        leave_file = settings["leave_file"]
+        leave = load_leave(leave_file) if leave_file and os.path.exists(leave_file) else {}
+        calendar = WorkCalendar(IntervalIndex(holidays), IntervalIndex(makeup), leave)
+        _calendar_cache[paths] = (signature, calendar)
+        return calendar